@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2012 - 2015 Michal Čihař <michal@cihar.com>
+#
+# This file is part of Weblate <https://weblate.org/>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+import socket
+import sys
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from smtplib import SMTPException
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Min, Q
+from django.utils import timezone
+from weblate import appsettings
+from weblate.accounts.models import (
+    Notification, get_notification_email, get_digest_email
+)
+from weblate.logger import LOGGER
+from weblate.trans.util import report_error
+from optparse import make_option
+
+
+class Command(BaseCommand):
+    help = 'sends queued notifications'
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--limit',
+            action='store',
+            type='int',
+            dest='limit',
+            default=100,
+            help='number of notifications to process in one run'
+        ),
+        make_option(
+            '--daemon',
+            action='store_true',
+            dest='daemon',
+            default=False,
+            help='keep processing notifications until interrupted'
+        ),
+        make_option(
+            '--max-delay',
+            action='store',
+            type='int',
+            dest='max_delay',
+            default=60,
+            help='maximal delay in seconds between checks when idle'
+        ),
+    )
+
+    def __init__(self, *args, **kwargs):
+        super(Command, self).__init__(*args, **kwargs)
+        # Notifications which failed in current pass over the queue
+        self.failed = set()
+
+    def get_ready(self):
+        '''
+        Returns notifications which should be sent now.
+
+        With NOTIFICATION_DIGEST, notifications for user are held back until
+        the oldest of them is old enough and then all are sent together.
+        '''
+        notifications = Notification.objects.queued().filter(
+            event=False
+        ).exclude(
+            pk__in=self.failed
+        )
+        if appsettings.NOTIFICATION_DIGEST <= 0:
+            return notifications.order_by('pk')
+
+        cutoff = timezone.now() - timedelta(
+            seconds=appsettings.NOTIFICATION_DIGEST
+        )
+        users = Notification.objects.queued().filter(
+            user__isnull=False
+        ).values('user').annotate(
+            oldest=Min('timestamp')
+        ).filter(
+            oldest__lte=cutoff
+        ).values_list(
+            'user', flat=True
+        )
+        return notifications.filter(
+            Q(user=None) | Q(user__in=list(users))
+        ).order_by('user', 'pk')
+
+    def render(self, notifications):
+        '''
+        Renders notification emails, aggregating them to digests.
+
+        Returns list of tuples of email and notifications it was rendered
+        from and list of notifications which failed to render.
+        '''
+        mails = []
+        failed = []
+        digests = OrderedDict()
+        for notification in notifications:
+            try:
+                args = notification.get_args()
+                mail = get_notification_email(*args)
+            except Exception as error:
+                LOGGER.error(
+                    'failed to render notification %s: %s',
+                    notification.pk, error
+                )
+                report_error(error, sys.exc_info())
+                failed.append(notification)
+                continue
+            if (appsettings.NOTIFICATION_DIGEST > 0 and
+                    notification.user_id is not None):
+                digest = digests.setdefault(
+                    notification.user_id, (args[0], args[1], [], [])
+                )
+                digest[2].append(mail)
+                digest[3].append(notification)
+            else:
+                mails.append((mail, [notification]))
+
+        for language, email, emails, items in digests.values():
+            if len(emails) == 1:
+                mails.append((emails[0], items))
+            else:
+                mails.append(
+                    (get_digest_email(language, email, emails), items)
+                )
+
+        return mails, failed
+
+    def record_failure(self, notifications):
+        '''
+        Records failed attempt to send notifications.
+
+        The notifications are not tried again in current pass over the
+        queue. After NOTIFICATION_MAX_FAILURES attempts they are not sent
+        at all, but kept in the database for inspection.
+        '''
+        pks = [notification.pk for notification in notifications]
+        self.failed.update(pks)
+        Notification.objects.filter(pk__in=pks).update(
+            failures=F('failures') + 1, worker='', claimed=None
+        )
+
+    def resolve_events(self, limit):
+        '''
+        Queues notifications for recipients of queued events, returns number
+        of processed events.
+        '''
+        token, events = Notification.objects.claim(
+            Notification.objects.queued().filter(
+                event=True
+            ).exclude(
+                pk__in=self.failed
+            ).order_by('pk'),
+            limit
+        )
+        try:
+            for event in events:
+                try:
+                    with transaction.atomic():
+                        event.resolve()
+                        event.delete()
+                except Exception as error:
+                    LOGGER.error(
+                        'failed to resolve notification %s: %s',
+                        event.pk, error
+                    )
+                    report_error(error, sys.exc_info())
+                    self.record_failure([event])
+        finally:
+            Notification.objects.release(token)
+        return len(events)
+
+    def process_batch(self, connection, limit):
+        '''
+        Processes single batch of notifications, returns number of processed
+        ones.
+
+        Recipients of queued events are resolved first. The notifications
+        to send are then claimed, so several processes can work on the queue
+        without sending same emails, and sent outside of a transaction, so
+        no rows are locked while waiting for the mail server. Each sent
+        email is removed from the queue, failed ones are kept in the queue.
+        '''
+        processed = self.resolve_events(limit)
+
+        token, notifications = Notification.objects.claim(
+            self.get_ready(), limit
+        )
+        try:
+            if not notifications:
+                return processed
+
+            mails, failed = self.render(notifications)
+            if failed:
+                self.record_failure(failed)
+            if not mails:
+                return processed + len(notifications)
+
+            try:
+                # Connection is kept open for following batches
+                connection.open()
+            except (SMTPException, socket.error) as error:
+                # Mail server is not available, try again later
+                LOGGER.error('Failed to connect to mail server: %s', error)
+                report_error(error, sys.exc_info())
+                connection.close()
+                return 0
+
+            for mail, items in mails:
+                try:
+                    connection.send_messages([mail])
+                except (SMTPException, socket.error) as error:
+                    LOGGER.error('Failed to send email: %s', error)
+                    report_error(error, sys.exc_info())
+                    self.record_failure(items)
+                    # Reconnect for next email
+                    connection.close()
+                    continue
+                Notification.objects.filter(
+                    pk__in=[item.pk for item in items]
+                ).delete()
+        finally:
+            Notification.objects.release(token)
+
+        return processed + len(notifications)
+
+    def process_queue(self, connection, limit):
+        '''
+        Processes batches until there is nothing to send, returns number of
+        processed notifications.
+        '''
+        self.failed = set()
+        processed = 0
+        while True:
+            count = self.process_batch(connection, limit)
+            if not count:
+                return processed
+            processed += count
+
+    def report(self, processed):
+        '''
+        Writes information about processed notifications and remaining
+        backlog.
+        '''
+        self.stdout.write(
+            'Processed {0} notifications, backlog {1}, failed {2}, '
+            'lag {3:.1f} s'.format(
+                processed,
+                Notification.objects.queued().count(),
+                Notification.objects.failed().count(),
+                Notification.objects.get_lag(),
+            )
+        )
+
+    def handle(self, *args, **options):
+        verbose = int(options['verbosity']) > 1
+        connection = get_connection()
+
+        if not options['daemon']:
+            try:
+                processed = self.process_queue(connection, options['limit'])
+            finally:
+                connection.close()
+            if verbose:
+                self.report(processed)
+            return
+
+        delay = 0
+        try:
+            while True:
+                processed = self.process_queue(connection, options['limit'])
+                if processed:
+                    delay = 0
+                    if int(options['verbosity']) > 0:
+                        self.report(processed)
+                # Do not keep connection to mail server open while idle
+                connection.close()
+                # Back off while there is nothing to do, failed
+                # notifications are tried again after the delay
+                delay = min(max(1, delay * 2), options['max_delay'])
+                time.sleep(delay)
+        except KeyboardInterrupt:
+            return
+        finally:
+            connection.close()
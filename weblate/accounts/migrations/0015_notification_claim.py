@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0014_notification_failures'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='event',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='worker',
+            field=models.CharField(default='', max_length=32, blank=True, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='claimed',
+            field=models.DateTimeField(null=True, blank=True),
+        ),
+    ]
@@ -20,10 +20,17 @@
 
 import os
 import sys
+import uuid
 import binascii
+import functools
+import cPickle
+from cStringIO import StringIO
+from datetime import timedelta
 from smtplib import SMTPException
 
+from django.apps import apps
 from django.db import models
+from django.db.models import Q
 from django.dispatch import receiver
 from django.conf import settings
 from django.contrib.auth.signals import user_logged_in
@@ -32,6 +39,7 @@ from django.utils.translation import ugettext_lazy as _
 from django.contrib.auth.models import Group, User, Permission
 from django.utils import translation as django_translation
 from django.template.loader import render_to_string
+from django.utils import timezone
 from django.core.mail import EmailMultiAlternatives, get_connection
 from django.utils.translation import LANGUAGE_SESSION_KEY
 
@@ -42,21 +50,68 @@ from weblate.trans.site import get_site_url, get_site_domain
 from weblate.accounts.avatar import get_user_display
 from weblate.trans.util import report_error
 from weblate.trans.signals import user_pre_delete
-from weblate import VERSION
+from weblate import VERSION, appsettings
 from weblate.logger import LOGGER
 from weblate.appsettings import ANONYMOUS_USER_NAME, SITE_TITLE
 
+# Time in seconds after which claim of notifications is considered abandoned
+CLAIM_TIMEOUT = 3600
+
 
 def send_mails(mails):
-    """Sends multiple mails in single connection."""
+    """Sends multiple mails in single connection or queues them."""
+    queued = []
+    emails = []
+    for mail in mails:
+        if mail is None:
+            # User has no access to the project
+            continue
+        elif isinstance(mail, Notification):
+            queued.append(mail)
+        else:
+            emails.append(mail)
+
+    if queued:
+        Notification.objects.bulk_create(queued)
+
+    if not emails:
+        return
+
     try:
         connection = get_connection()
-        connection.send_messages(mails)
+        connection.send_messages(emails)
     except SMTPException as error:
         LOGGER.error('Failed to send email: %s', error)
         report_error(error, sys.exc_info())
 
 
+# Notification functions which can be offloaded, indexed by name
+NOTIFICATION_EVENTS = {}
+
+
+def notification_event(function):
+    '''
+    Decorator for functions collecting notification emails about an event.
+
+    The emails are sent right away or, if sending is offloaded, only the
+    event is queued and its recipients are resolved by send_notifications.
+    '''
+    NOTIFICATION_EVENTS[function.__name__] = function
+
+    @functools.wraps(function)
+    def notify(*args):
+        if appsettings.OFFLOAD_NOTIFICATIONS:
+            Notification.objects.create(
+                event=True,
+                notification=function.__name__,
+                data=dump_notification(args),
+            )
+        else:
+            send_mails(function(*args))
+
+    return notify
+
+
 def get_author_name(user, email=True):
     """Returns formatted author name with email."""
     # Get full name from database
@@ -72,6 +127,7 @@ def get_author_name(user, email=True):
     return '%s <%s>' % (full_name, user.email)
 
 
+@notification_event
 def notify_merge_failure(subproject, error, status):
     '''
     Notification on merge failure.
@@ -96,7 +152,7 @@ def notify_merge_failure(subproject, error, status):
 
     # Notify admins
     mails.append(
-        get_notification_email(
+        prepare_notification_email(
             'en',
             'ADMINS',
             'merge_failure',
@@ -108,9 +164,10 @@ def notify_merge_failure(subproject, error, status):
             }
         )
     )
-    send_mails(mails)
+    return mails
 
 
+@notification_event
 def notify_new_string(translation):
     '''
     Notification on new string to translate.
@@ -124,9 +181,10 @@ def notify_new_string(translation):
             subscription.notify_new_string(translation)
         )
 
-    send_mails(mails)
+    return mails
 
 
+@notification_event
 def notify_new_language(subproject, language, user):
     '''
     Notify subscribed users about new language requests
@@ -152,7 +210,7 @@ def notify_new_language(subproject, language, user):
 
     # Notify admins
     mails.append(
-        get_notification_email(
+        prepare_notification_email(
             'en',
             'ADMINS',
             'new_language',
@@ -165,9 +223,10 @@ def notify_new_language(subproject, language, user):
         )
     )
 
-    send_mails(mails)
+    return mails
 
 
+@notification_event
 def notify_new_translation(unit, oldunit, user):
     '''
     Notify subscribed users about new translation
@@ -183,9 +242,10 @@ def notify_new_translation(unit, oldunit, user):
             subscription.notify_any_translation(unit, oldunit)
         )
 
-    send_mails(mails)
+    return mails
 
 
+@notification_event
 def notify_new_contributor(unit, user):
     '''
     Notify about new contributor.
@@ -203,9 +263,10 @@ def notify_new_contributor(unit, user):
             )
         )
 
-    send_mails(mails)
+    return mails
 
 
+@notification_event
 def notify_new_suggestion(unit, suggestion, user):
     '''
     Notify about new suggestion.
@@ -225,9 +286,10 @@ def notify_new_suggestion(unit, suggestion, user):
             )
         )
 
-    send_mails(mails)
+    return mails
 
 
+@notification_event
 def notify_new_comment(unit, comment, user, report_source_bugs):
     '''
     Notify about new comment.
@@ -245,20 +307,22 @@ def notify_new_comment(unit, comment, user, report_source_bugs):
 
     # Notify upstream
     if comment.language is None and report_source_bugs != '':
-        send_notification_email(
-            'en',
-            report_source_bugs,
-            'new_comment',
-            unit.translation,
-            {
-                'unit': unit,
-                'comment': comment,
-                'subproject': unit.translation.subproject,
-            },
-            user=user,
+        mails.append(
+            prepare_notification_email(
+                'en',
+                report_source_bugs,
+                'new_comment',
+                unit.translation,
+                {
+                    'unit': unit,
+                    'comment': comment,
+                    'subproject': unit.translation.subproject,
+                },
+                user=user,
+            )
         )
 
-    send_mails(mails)
+    return mails
 
 
 def get_notification_email(language, email, notification,
@@ -361,6 +425,91 @@ def get_notification_email(language, email, notification,
         django_translation.activate(cur_language)
 
 
+def get_digest_email(language, email, emails):
+    '''
+    Renders digest of several notification emails.
+    '''
+    notifications = []
+    for mail in emails:
+        subject = mail.subject
+        if subject.startswith(settings.EMAIL_SUBJECT_PREFIX):
+            subject = subject[len(settings.EMAIL_SUBJECT_PREFIX):]
+        notifications.append({'subject': subject, 'body': mail.body})
+
+    return get_notification_email(
+        language,
+        email,
+        'digest',
+        context={'notifications': notifications},
+        info='{0} notifications'.format(len(notifications)),
+    )
+
+
+def dump_notification(args):
+    '''
+    Serializes notification arguments for rendering them later.
+
+    Model instances are stored as their field values, so the notification
+    shows the objects as they were at the time of the event.
+    '''
+    def persistent_id(obj):
+        if not isinstance(obj, models.Model):
+            return None
+        return (
+            obj._meta.app_label,
+            obj._meta.model_name,
+            dict(
+                (field.attname, getattr(obj, field.attname))
+                for field in obj._meta.concrete_fields
+                # Do not copy password hashes to the queue
+                if field.attname != 'password'
+            ),
+        )
+
+    handle = StringIO()
+    pickler = cPickle.Pickler(handle, cPickle.HIGHEST_PROTOCOL)
+    pickler.persistent_id = persistent_id
+    pickler.dump(args)
+    return binascii.b2a_base64(handle.getvalue())
+
+
+def load_notification(data):
+    '''
+    Loads notification arguments serialized by dump_notification.
+    '''
+    def persistent_load(pid):
+        app_label, model_name, values = pid
+        obj = apps.get_model(app_label, model_name)(**values)
+        obj._state.adding = False
+        return obj
+
+    unpickler = cPickle.Unpickler(StringIO(binascii.a2b_base64(data)))
+    unpickler.persistent_load = persistent_load
+    return unpickler.load()
+
+
+def prepare_notification_email(language, email, notification,
+                               translation_obj=None, context=None,
+                               headers=None, user=None, info=None,
+                               recipient=None):
+    '''
+    Renders notification email or queues it if sending is offloaded.
+    '''
+    if appsettings.OFFLOAD_NOTIFICATIONS:
+        return Notification(
+            user=recipient,
+            notification=notification,
+            data=dump_notification((
+                language, email, notification, translation_obj, context,
+                headers, user, info
+            )),
+        )
+    return get_notification_email(
+        language, email, notification, translation_obj, context, headers,
+        user, info
+    )
+
+
 def send_notification_email(language, email, notification,
                             translation_obj=None, context=None, headers=None,
                             user=None, info=None):
@@ -388,6 +537,111 @@ class VerifiedEmail(models.Model):
         )
 
 
+class NotificationManager(models.Manager):
+    def claim(self, notifications, limit):
+        '''
+        Claims notifications from given queryset for processing.
+
+        Returns claim token and list of claimed notifications in order of
+        the queryset. The notifications are claimed by conditional update
+        of the rows, so they are not locked while being sent and several
+        workers can process the queue. Claims older than CLAIM_TIMEOUT are
+        taken over as their worker has most likely died.
+        '''
+        token = uuid.uuid4().hex
+        while True:
+            now = timezone.now()
+            available = Q(claimed=None) | Q(
+                claimed__lt=now - timedelta(seconds=CLAIM_TIMEOUT)
+            )
+            pks = list(
+                notifications.filter(available).values_list(
+                    'pk', flat=True
+                )[:limit]
+            )
+            if not pks:
+                return token, []
+            # Other worker might have claimed some of them meanwhile
+            if self.filter(available, pk__in=pks).update(
+                    worker=token, claimed=now):
+                claimed = self.filter(worker=token).in_bulk(pks)
+                return token, [claimed[pk] for pk in pks if pk in claimed]
+
+    def release(self, token):
+        '''
+        Returns claimed notifications back to the queue.
+        '''
+        self.filter(worker=token).update(worker='', claimed=None)
+
+    def queued(self):
+        '''
+        Returns notifications waiting to be sent.
+        '''
+        return self.filter(
+            failures__lt=appsettings.NOTIFICATION_MAX_FAILURES
+        )
+
+    def failed(self):
+        '''
+        Returns notifications which are no longer tried to be sent.
+        '''
+        return self.filter(
+            failures__gte=appsettings.NOTIFICATION_MAX_FAILURES
+        )
+
+    def get_lag(self):
+        '''
+        Returns age in seconds of oldest queued notification.
+        '''
+        try:
+            oldest = self.queued().order_by('timestamp')[0]
+        except IndexError:
+            return 0
+        return (timezone.now() - oldest.timestamp).total_seconds()
+
+
+class Notification(models.Model):
+    '''
+    Notification email waiting to be sent.
+    '''
+    user = models.ForeignKey(User, null=True, blank=True)
+    notification = models.CharField(max_length=100)
+    data = models.TextField()
+    timestamp = models.DateTimeField(default=timezone.now, db_index=True)
+    failures = models.IntegerField(default=0)
+    # Event waiting for resolving its recipients
+    event = models.BooleanField(default=False)
+    worker = models.CharField(
+        max_length=32, blank=True, default='', db_index=True
+    )
+    claimed = models.DateTimeField(null=True, blank=True)
+
+    objects = NotificationManager()
+
+    def __unicode__(self):
+        return self.notification
+
+    def get_args(self):
+        '''
+        Returns arguments for get_notification_email or, for events, for
+        the notification function.
+        '''
+        return load_notification(self.data)
+
+    def resolve(self):
+        '''
+        Queues notifications for recipients of the event.
+
+        The notifications keep timestamp of the event, so the lag and
+        digests are counted from the time it happened.
+        '''
+        mails = NOTIFICATION_EVENTS[self.notification](*self.get_args())
+        for mail in mails:
+            if isinstance(mail, Notification):
+                mail.timestamp = self.timestamp
+        send_mails(mails)
+
+
 class ProfileManager(models.Manager):
     '''
     Manager providing shortcuts for subscription queries.
@@ -581,14 +835,15 @@ class Profile(models.Model):
         if not translation_obj.has_acl(self.user):
             return
         # Generate notification
-        return get_notification_email(
+        return prepare_notification_email(
             self.language,
             self.user.email,
             notification,
             translation_obj,
             context,
             headers,
-            user=user
+            user=user,
+            recipient=self.user
         )
 
     def notify_any_translation(self, unit, oldunit):
@@ -22,13 +22,21 @@
 Tests for user handling.
 """
 
+from datetime import timedelta
+from smtplib import SMTPException
 from unittest import TestCase as UnitTestCase
 from django.core.urlresolvers import reverse
 from django.contrib.auth.models import User
 from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend
+from django.core.management import call_command
+from django.test.utils import override_settings
+from django.utils import timezone
 
 from weblate.accounts.models import (
     Profile,
+    Notification,
+    CLAIM_TIMEOUT,
     notify_merge_failure,
     notify_new_string,
     notify_new_suggestion,
@@ -40,11 +48,23 @@ from weblate.accounts.models import (
 from weblate.accounts.captcha import (
     hash_question, unhash_question, MathCaptcha
 )
+from weblate.trans.tests import OverrideSettings
 from weblate.trans.tests.test_views import ViewTestCase
 from weblate.trans.models.unitdata import Suggestion, Comment
 from weblate.lang.models import Language
 
 
+class FailingEmailBackend(EmailBackend):
+    '''
+    Email backend refusing to send notifications about new translations.
+    '''
+    def send_messages(self, messages):
+        for message in messages:
+            if 'New translation' in message.subject:
+                raise SMTPException('Refused')
+        return super(FailingEmailBackend, self).send_messages(messages)
+
+
 class NotificationTest(ViewTestCase):
     def setUp(self):
         super(NotificationTest, self).setUp()
@@ -231,6 +251,131 @@ class NotificationTest(ViewTestCase):
             '[Weblate] New comment in Test/Test'
         )
 
+    @OverrideSettings(OFFLOAD_NOTIFICATIONS=True)
+    def test_offload(self):
+        unit = self.get_unit()
+        unit.target = 'Queued translation'
+        notify_new_translation(unit, unit, self.second_user())
+        translation = self.get_translation()
+        # Recipients are not resolved while handling the request
+        with self.assertNumQueries(1):
+            notify_new_string(translation)
+
+        # Notifications are only queued
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(Notification.objects.filter(event=True).count(), 2)
+
+        call_command('send_notifications')
+
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(
+            mail.outbox[0].subject,
+            '[Weblate] New translation in Test/Test - Czech'
+        )
+        # Content is rendered as it was when queued
+        self.assertIn('Queued translation', mail.outbox[0].body)
+        self.assertEqual(
+            mail.outbox[1].subject,
+            '[Weblate] New string to translate in Test/Test - Czech'
+        )
+        self.assertEqual(Notification.objects.count(), 0)
+
+    @OverrideSettings(OFFLOAD_NOTIFICATIONS=True)
+    def test_offload_batches(self):
+        notify_new_string(self.get_translation())
+        notify_new_contributor(self.get_unit(), self.second_user())
+        notify_new_string(self.get_translation())
+
+        # All batches are processed
+        call_command('send_notifications', limit=1)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(Notification.objects.count(), 0)
+
+    @OverrideSettings(OFFLOAD_NOTIFICATIONS=True)
+    def test_offload_claimed(self):
+        notify_new_string(self.get_translation())
+
+        # Resolving keeps time of the event
+        event = Notification.objects.get()
+        event.resolve()
+        notification = Notification.objects.get(event=False)
+        self.assertEqual(notification.user, self.user)
+        self.assertEqual(notification.timestamp, event.timestamp)
+        event.delete()
+
+        # Notifications claimed by other worker are skipped
+        Notification.objects.update(worker='other', claimed=timezone.now())
+        call_command('send_notifications')
+        self.assertEqual(len(mail.outbox), 0)
+
+        # Abandoned claims are taken over
+        Notification.objects.update(
+            claimed=timezone.now() - timedelta(seconds=CLAIM_TIMEOUT + 1)
+        )
+        call_command('send_notifications')
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(Notification.objects.count(), 0)
+
+    @override_settings(
+        EMAIL_BACKEND=(
+            'weblate.accounts.tests.test_notifications.FailingEmailBackend'
+        )
+    )
+    @OverrideSettings(OFFLOAD_NOTIFICATIONS=True, NOTIFICATION_MAX_FAILURES=2)
+    def test_offload_failure(self):
+        unit = self.get_unit()
+        notify_new_translation(unit, unit, self.second_user())
+        notify_new_string(self.get_translation())
+        Notification.objects.create(notification='broken', data='')
+
+        # Other emails are sent
+        call_command('send_notifications')
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(
+            mail.outbox[0].subject,
+            '[Weblate] New string to translate in Test/Test - Czech'
+        )
+        self.assertEqual(Notification.objects.queued().count(), 2)
+        self.assertEqual(
+            list(Notification.objects.values_list('failures', flat=True)),
+            [1, 1]
+        )
+
+        # Failing notifications are put aside
+        call_command('send_notifications')
+        self.assertEqual(Notification.objects.queued().count(), 0)
+        self.assertEqual(Notification.objects.failed().count(), 2)
+        self.assertEqual(Notification.objects.get_lag(), 0)
+
+    @OverrideSettings(OFFLOAD_NOTIFICATIONS=True, NOTIFICATION_DIGEST=3600)
+    def test_digest(self):
+        notify_new_string(self.get_translation())
+        notify_new_contributor(self.get_unit(), self.second_user())
+
+        # Digest is not yet due
+        call_command('send_notifications')
+        self.assertEqual(len(mail.outbox), 0)
+
+        Notification.objects.update(
+            timestamp=timezone.now() - timedelta(hours=2)
+        )
+        call_command('send_notifications')
+
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(
+            mail.outbox[0].subject,
+            '[Weblate] 2 notifications from Weblate'
+        )
+        self.assertIn(
+            'New string to translate in Test/Test - Czech',
+            mail.outbox[0].body
+        )
+        self.assertIn(
+            'New contributor in Test/Test - Czech',
+            mail.outbox[0].body
+        )
+        self.assertEqual(Notification.objects.count(), 0)
+
 
 class CaptchaTest(UnitTestCase):
     def test_decode(self):
@@ -77,6 +77,9 @@ MT_TMSERVER = getvalue('MT_TMSERVER', None)
 # Limit (in seconds) for Weblate machine translation
 MT_WEBLATE_LIMIT = getvalue('MT_WEBLATE_LIMIT', 15)
 
+# Number of processes for Weblate similarity machine translation
+MT_WEBLATE_WORKERS = getvalue('MT_WEBLATE_WORKERS', 2)
+
 # Title of site to use
 SITE_TITLE = getvalue('SITE_TITLE', 'Weblate')
 
@@ -107,6 +110,39 @@ LAZY_COMMITS = getvalue('LAZY_COMMITS', True)
 # Offload indexing
 OFFLOAD_INDEXING = getvalue('OFFLOAD_INDEXING', False)
 
+# Offload sending of notifications
+OFFLOAD_NOTIFICATIONS = getvalue('OFFLOAD_NOTIFICATIONS', False)
+
+# Interval in seconds for aggregating notifications to user, 0 disables
+NOTIFICATION_DIGEST = getvalue('NOTIFICATION_DIGEST', 0)
+
+# Number of failed attempts after which notification is no longer sent
+NOTIFICATION_MAX_FAILURES = getvalue('NOTIFICATION_MAX_FAILURES', 5)
+
+# Number of processes used for loading translation files
+IMPORT_JOBS = getvalue('IMPORT_JOBS', 1)
+
+# Fulltext search backend
+FULLTEXT_BACKEND = getvalue(
+    'FULLTEXT_BACKEND', 'weblate.trans.search.WhooshBackend'
+)
+
+# Batching of fulltext index updates
+INDEX_QUEUE_LIMIT = getvalue('INDEX_QUEUE_LIMIT', 100)
+INDEX_QUEUE_DELAY = getvalue('INDEX_QUEUE_DELAY', 5)
+
+# Time in seconds to cache fulltext search results
+SEARCH_CACHE_TIMEOUT = getvalue('SEARCH_CACHE_TIMEOUT', 3600)
+
+# Size of cache for parsed translation files in bytes
+STORE_CACHE_SIZE = getvalue('STORE_CACHE_SIZE', 100 * 1024 * 1024)
+
+# Delay in seconds for writing edits to translation files, 0 writes at once
+WRITE_BEHIND_DELAY = getvalue('WRITE_BEHIND_DELAY', 0)
+
+# Propagate translations to other components in background
+BACKGROUND_PROPAGATION = getvalue('BACKGROUND_PROPAGATION', False)
+
 # Translation locking
 AUTO_LOCK = getvalue('AUTO_LOCK', True)
 AUTO_LOCK_TIME = getvalue('AUTO_LOCK_TIME', 60)
@@ -18,12 +18,15 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
+import time
+from django.core.cache import cache
+from django.core.signals import request_started
 from django.db import models, transaction
 from django.db.utils import OperationalError
 from django.utils.translation import ugettext as _, ugettext_lazy
 from django.utils.safestring import mark_safe
 from django.dispatch import receiver
-from django.db.models.signals import post_migrate
+from django.db.models.signals import post_migrate, post_save, post_delete
 
 from translate.lang.data import languages
 
@@ -32,6 +35,40 @@ from weblate.trans.mixins import PercentMixin
 from weblate.appsettings import SIMPLIFY_LANGUAGES
 from weblate.logger import LOGGER
 
+# Cache key of languages version, it is changed on every language change
+VERSION_KEY = 'languages-version'
+
+
+def get_languages_version():
+    '''
+    Returns version of languages shared by all processes.
+    '''
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, int(time.time() * 1000), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def get_transaction_state():
+    '''
+    Returns savepoints of current transaction, None outside of transaction.
+    '''
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        return None
+    return tuple(connection.savepoint_ids)
+
+
+def update_languages_version():
+    '''
+    Changes version of languages, so that other processes reload them.
+    '''
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        get_languages_version()
+
 
 def get_plural_type(code, pluralequation):
     '''
@@ -75,63 +112,60 @@ def get_english_lang():
         return 65535
 
 
-class LanguageManager(models.Manager):
-    # pylint: disable=W0232
-
-    _default_lang = None
+class LanguageResolver(object):
+    '''
+    In-memory resolver of language codes.
 
-    def get_default(self):
-        '''
-        Returns default source language object.
-        '''
-        if self._default_lang is None:
-            self._default_lang = self.get(code='en')
-        return self._default_lang
+    All languages are loaded at once and codes are resolved without database
+    queries, remembering results for already seen codes.
+    '''
+    def __init__(self, manager, version, state=None):
+        self.manager = manager
+        self.version = version
+        self.state = state
+        self.lookups = {
+            'code': {},
+            'name': {},
+            'name__iexact': {},
+        }
+        self.resolved = {}
+        for language in manager.all():
+            self.add(language)
+
+    def add(self, language):
+        '''
+        Adds language to lookup tables.
+        '''
+        for lookup, value in (('code', language.code),
+                              ('name', language.name),
+                              ('name__iexact', language.name.lower())):
+            self.lookups[lookup].setdefault(value, []).append(language)
 
     def try_get(self, **kwargs):
         '''
-        Tries to get language by code.
+        Tries to get language same way as LanguageManager.try_get.
         '''
-        try:
-            return self.get(**kwargs)
-        except (Language.DoesNotExist, Language.MultipleObjectsReturned):
-            return None
+        lookup, value = kwargs.items()[0]
+        if lookup == 'name__iexact':
+            value = value.lower()
+        matches = self.lookups[lookup].get(value, [])
+        if len(matches) == 1:
+            return matches[0]
+        return None
 
-    def parse_lang_country(self, code):
+    def fuzzy_get(self, code):
         '''
-        Parses language and country from locale code.
+        Resolves code same way as LanguageManager.fuzzy_get.
         '''
-        # Parse the string
-        if '-' in code:
-            lang, country = code.split('-', 1)
-            # Android regional locales
-            if len(country) > 2 and country[0] == 'r':
-                country = country[1:]
-        elif '_' in code:
-            lang, country = code.split('_', 1)
-        else:
-            lang = code
-            country = None
-
-        return lang, country
-
-    def sanitize_code(self, code):
-        """
-        Language code sanitization.
-        """
-        code = code.replace(' ', '').replace('(', '').replace(')', '')
-        while code[-1].isdigit():
-            code = code[:-1]
-        return code
+        if code not in self.resolved:
+            self.resolved[code] = self.resolve(code)
+        return self.resolved[code]
 
-    def fuzzy_get(self, code):
+    def resolve(self, code):
         '''
-        Gets matching language for code (the code does not have to be exactly
-        same, cs_CZ is same as cs-CZ) or returns None
-
-        It also handles Android special naming of regional locales like pt-rBR
+        Resolves code to language or to normalized code if not found.
         '''
-        code = self.sanitize_code(code)
+        code = self.manager.sanitize_code(code)
 
         # First try getting langauge as is
         ret = self.try_get(code=code)
@@ -151,7 +185,7 @@ class LanguageManager(models.Manager):
                 return ret
 
         # Parse the string
-        lang, country = self.parse_lang_country(code)
+        lang, country = self.manager.parse_lang_country(code)
 
         # Try "corrected" code
         if country is not None:
@@ -182,14 +216,133 @@ class LanguageManager(models.Manager):
 
     def auto_get_or_create(self, code):
         '''
-        Try to get language using fuzzy_get and create it if that fails.
+        Resolves code, creating new language if needed.
         '''
         ret = self.fuzzy_get(code)
         if isinstance(ret, Language):
             return ret
 
-        # Create new one
-        return self.auto_create(ret)
+        # Create new one and make it known to this resolver
+        language = self.manager.auto_create(ret)
+        self.add(language)
+        self.resolved = {}
+        return language
+
+
+class LanguageManager(models.Manager):
+    # pylint: disable=W0232
+
+    _default_lang = None
+    _resolver = None
+    _check_resolver = False
+    # Languages were changed in transaction which might be rolled back
+    _uncommitted = False
+
+    def get_default(self):
+        '''
+        Returns default source language object.
+        '''
+        if self._default_lang is None:
+            self._default_lang = self.get(code='en')
+        return self._default_lang
+
+    def try_get(self, **kwargs):
+        '''
+        Tries to get language by code.
+        '''
+        try:
+            return self.get(**kwargs)
+        except (Language.DoesNotExist, Language.MultipleObjectsReturned):
+            return None
+
+    def parse_lang_country(self, code):
+        '''
+        Parses language and country from locale code.
+        '''
+        # Parse the string
+        if '-' in code:
+            lang, country = code.split('-', 1)
+            # Android regional locales
+            if len(country) > 2 and country[0] == 'r':
+                country = country[1:]
+        elif '_' in code:
+            lang, country = code.split('_', 1)
+        else:
+            lang = code
+            country = None
+
+        return lang, country
+
+    def sanitize_code(self, code):
+        """
+        Language code sanitization.
+        """
+        code = code.replace(' ', '').replace('(', '').replace(')', '')
+        while code[-1].isdigit():
+            code = code[:-1]
+        return code
+
+    def get_resolver(self, refresh=False):
+        '''
+        Returns in-memory resolver of language codes.
+
+        The resolver is shared within the process. Whether languages were
+        changed by other process is checked with refresh and once in every
+        request, it is reloaded then.
+        '''
+        resolver = self._resolver
+        state = None
+        if self._uncommitted:
+            # Reload once transaction or savepoint changing languages ends
+            state = get_transaction_state()
+            if state is None:
+                self._uncommitted = False
+            if state is None or state != getattr(resolver, 'state', None):
+                resolver = None
+        if resolver is not None and (refresh or self._check_resolver):
+            self._check_resolver = False
+            if resolver.version != get_languages_version():
+                resolver = None
+        if resolver is None:
+            resolver = LanguageResolver(self, get_languages_version(), state)
+            self._resolver = resolver
+        return resolver
+
+    def check_resolver(self):
+        '''
+        Checks for languages changed by other process on next use of the
+        resolver.
+        '''
+        self._check_resolver = True
+        if self._uncommitted and get_transaction_state() is None:
+            self._uncommitted = False
+            self._resolver = None
+
+    def invalidate_resolver(self):
+        '''
+        Forces reloading of the resolver on next use.
+
+        Languages changed inside transaction are reloaded again when the
+        transaction ends, as it might have been rolled back.
+        '''
+        self._resolver = None
+        if get_transaction_state() is not None:
+            self._uncommitted = True
+
+    def fuzzy_get(self, code):
+        '''
+        Gets matching language for code (the code does not have to be exactly
+        same, cs_CZ is same as cs-CZ) or returns None
+
+        It also handles Android special naming of regional locales like pt-rBR
+        '''
+        return self.get_resolver().fuzzy_get(code)
+
+    def auto_get_or_create(self, code):
+        '''
+        Try to get language using fuzzy_get and create it if that fails.
+        '''
+        return self.get_resolver().auto_get_or_create(code)
 
     def auto_create(self, code):
         '''
@@ -436,7 +589,8 @@ class Language(models.Model, PercentMixin):
             return self._percents
 
         # Get translations percents
-        result = self.translation_set.get_percents()
+        from weblate.trans.models.rollup import StatsRollup
+        result = StatsRollup.objects.get_percents(language=self)
 
         # Update cache
         self._percents = result
@@ -504,3 +658,21 @@ class Language(models.Model, PercentMixin):
     def uses_ngram(self):
         code = self.base_code()
         return code in ('ja', 'zh', 'ko')
+
+
+@receiver(post_save, sender=Language)
+@receiver(post_delete, sender=Language)
+def invalidate_resolver(sender, **kwargs):
+    '''
+    Forces reloading languages in resolver in all processes.
+    '''
+    update_languages_version()
+    Language.objects.invalidate_resolver()
+
+
+@receiver(request_started)
+def check_resolver(sender, **kwargs):
+    '''
+    Checks for changed languages once in every request.
+    '''
+    Language.objects.check_resolver()
@@ -24,10 +24,13 @@ Tests for language manipulations.
 
 import os.path
 import gettext
+from django.db import transaction
 from django.test import TestCase
 from django.core.urlresolvers import reverse
 from django.core.management import call_command
-from weblate.lang.models import Language, get_plural_type
+from weblate.lang.models import (
+    Language, get_plural_type, update_languages_version, check_resolver,
+)
 from weblate.lang import data
 from weblate.trans.tests.test_views import ViewTestCase
 
@@ -229,6 +232,57 @@ class LanguagesTest(TestCase):
             # Check name
             self.assertEqual(unicode(lang), name)
 
+    def test_resolver(self):
+        '''
+        Tests that resolver does not query database for every code
+        '''
+        resolver = Language.objects.get_resolver()
+        with self.assertNumQueries(0):
+            self.assertEqual(resolver.fuzzy_get('cs_CZ').code, 'cs')
+            self.assertEqual(resolver.fuzzy_get('Czech').code, 'cs')
+            self.assertEqual(resolver.fuzzy_get('pt-rBR').code, 'pt_BR')
+        # New language is resolved by the resolver
+        created = resolver.auto_get_or_create('xx_XX')
+        self.assertEqual(resolver.fuzzy_get('xx-XX'), created)
+        # Shared resolver is reloaded
+        self.assertEqual(Language.objects.fuzzy_get('xx_XX'), created)
+
+    def test_resolver_version(self):
+        '''
+        Tests that resolver is reloaded on change in other process
+        '''
+        resolver = Language.objects.get_resolver()
+        with self.assertNumQueries(0):
+            self.assertIs(Language.objects.get_resolver(), resolver)
+            self.assertIs(
+                Language.objects.get_resolver(refresh=True), resolver
+            )
+        # Language changed in other process
+        update_languages_version()
+        self.assertIs(Language.objects.get_resolver(), resolver)
+        # Checked on next request
+        check_resolver(None)
+        self.assertIsNot(Language.objects.get_resolver(), resolver)
+
+    def test_resolver_rollback(self):
+        '''
+        Tests that resolver forgets languages from rolled back transaction
+        '''
+        try:
+            with transaction.atomic():
+                resolver = Language.objects.get_resolver()
+                created = resolver.auto_get_or_create('xx_XX')
+                self.assertEqual(
+                    Language.objects.get_resolver().fuzzy_get('xx_XX'),
+                    created
+                )
+                raise ValueError('Rollback')
+        except ValueError:
+            pass
+        self.assertEqual(
+            Language.objects.get_resolver().fuzzy_get('xx_XX'), 'xx_XX'
+        )
+
     def test_plurals(self):
         '''
         Test whether plural form is correctly calculated.
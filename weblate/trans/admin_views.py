@@ -18,7 +18,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
-from weblate.trans.models import SubProject, IndexUpdate
+from weblate.trans.models import SubProject, IndexUpdate, PendingUnit
 from django.contrib.sites.models import Site
 from django.shortcuts import render
 from django.contrib.admin.views.decorators import staff_member_required
@@ -29,8 +29,14 @@ import django
 from weblate import settings_example
 from weblate import appsettings
 from weblate.accounts.avatar import HAS_LIBRAVATAR
+from weblate.accounts.models import Notification
 from weblate.accounts.forms import HAS_PYUCA
 from weblate.trans.util import get_configuration_errors
+from weblate.trans.search import INDEX_QUEUE, SEARCH_CACHE
+from weblate.trans.propagation import PROPAGATION_RUNNER
+from weblate.trans.similar import SIMILAR_POOL
+from weblate.trans.storecache import STORE_CACHE
+from weblate.trans.writebehind import WRITE_BEHIND_QUEUE
 from weblate.trans.ssh import (
     generate_ssh_key, get_key_data, add_host_key,
     get_host_keys, can_generate_key
@@ -120,8 +126,78 @@ def performance(request):
             _('Indexing offloading processing'),
             index_updates,
             'production-indexing',
-            IndexUpdate.objects.count(),
+            _('%(count)d pending, oldest %(lag)d s old') % {
+                'count': IndexUpdate.objects.count(),
+                'lag': IndexUpdate.objects.get_lag(),
+            },
         ))
+    # Pending index updates in this process
+    index_stats = INDEX_QUEUE.get_stats()
+    checks.append((
+        _('Indexing queue'),
+        index_stats['depth'] < appsettings.INDEX_QUEUE_LIMIT,
+        'production-indexing',
+        _('%(depth)d pending, last flush took %(time).3f s') % {
+            'depth': index_stats['depth'],
+            'time': index_stats['last_flush_time'],
+        },
+    ))
+    # Fulltext search cache hits in this process
+    cache_stats = SEARCH_CACHE.get_stats()
+    checks.append((
+        _('Search cache'),
+        True,
+        'production-indexing',
+        _('%(hits)d hits, %(misses)d misses') % cache_stats,
+    ))
+    # Parsed files cache in this process
+    store_stats = STORE_CACHE.get_stats()
+    checks.append((
+        _('Parsed files cache'),
+        True,
+        'production-cache',
+        _('%(hits)d hits, %(misses)d misses, saved %(time).3f s') % {
+            'hits': store_stats['hits'],
+            'misses': store_stats['misses'],
+            'time': store_stats['saved_time'],
+        },
+    ))
+    # Delayed writing of translation files
+    if appsettings.WRITE_BEHIND_DELAY > 0:
+        write_stats = WRITE_BEHIND_QUEUE.get_stats()
+        write_lag = PendingUnit.objects.get_lag()
+        checks.append((
+            _('Delayed file writes'),
+            write_lag < 2 * appsettings.WRITE_BEHIND_DELAY,
+            'production-write-behind',
+            _('%(units)d edits written, oldest pending is %(lag)d s old') % {
+                'units': write_stats['units'],
+                'lag': write_lag,
+            },
+        ))
+    # Translation propagation in this process
+    propagation_stats = PROPAGATION_RUNNER.get_stats()
+    checks.append((
+        _('Translation propagation'),
+        propagation_stats['pending'] < 100,
+        'production-propagation',
+        _(
+            '%(running)d running with %(pending)d translations pending, '
+            '%(units)d strings propagated'
+        ) % propagation_stats,
+    ))
+    # Similarity lookups in this process
+    similar_stats = SIMILAR_POOL.get_stats()
+    checks.append((
+        _('Similarity lookups'),
+        similar_stats['timeouts'] * 10 <= similar_stats['requests'],
+        'production-indexing',
+        _('%(timeouts)d of %(requests)d timed out, waiting %(time).3f s') % {
+            'timeouts': similar_stats['timeouts'],
+            'requests': similar_stats['requests'],
+            'time': similar_stats['average_wait_time'],
+        },
+    ))
     # Check for sane caching
     caches = settings.CACHES['default']['BACKEND'].split('.')[-1]
     if caches in ['MemcachedCache', 'DatabaseCache']:
@@ -162,6 +238,19 @@ def performance(request):
         'production-email',
         ', '.join((settings.SERVER_EMAIL, settings.DEFAULT_FROM_EMAIL)),
     ))
+    # Queued notifications
+    if appsettings.OFFLOAD_NOTIFICATIONS:
+        notification_lag = Notification.objects.get_lag()
+        checks.append((
+            _('Notifications offloading processing'),
+            notification_lag < appsettings.NOTIFICATION_DIGEST + 3600,
+            'production-notifications',
+            _('%(count)d pending, %(failed)d failed, oldest %(lag)d s old') % {
+                'count': Notification.objects.queued().count(),
+                'failed': Notification.objects.failed().count(),
+                'lag': notification_lag,
+            },
+        ))
     # libravatar library
     checks.append((
         _('Federated avatar support'),
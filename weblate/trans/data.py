@@ -45,6 +45,7 @@ def check_data_writable():
     create_and_check_dir(data_dir('whoosh'))
     create_and_check_dir(data_dir('ssh'))
     create_and_check_dir(data_dir('vcs'))
+    create_and_check_dir(data_dir('stores'))
 
 
 def data_dir(component):
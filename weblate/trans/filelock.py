@@ -39,7 +39,9 @@ class FileLock(object):
     """
     A file locking mechanism for Unix systems based on flock.
 
-    It can be also used as a context-manager using with statement.
+    It can be also used as a context-manager using with statement. The lock
+    can be acquired repeatedly, it is released once it has been released as
+    many times as it was acquired.
     """
 
     def __init__(self, file_name, timeout=10, delay=.05):
@@ -56,6 +58,7 @@ class FileLock(object):
         # Initial state
         self.is_locked = False
         self.handle = None
+        self.depth = 0
 
     def acquire(self):
         """
@@ -66,6 +69,7 @@ class FileLock(object):
         seconds, in which case it throws an exception.
         """
         if self.is_locked:
+            self.depth += 1
             return
 
         # Timer for timeout
@@ -89,6 +93,7 @@ class FileLock(object):
                 time.sleep(self.delay)
 
         self.is_locked = True
+        self.depth = 1
 
     def check_lock(self):
         '''
@@ -104,10 +109,16 @@ class FileLock(object):
                 raise
             return True
 
-    def release(self):
+    def release(self, force=False):
         """
         Release the lock and delete underlaying file.
+
+        Nested acquires are released only by matching number of releases
+        unless force is set.
         """
+        if self.depth > 1 and not force:
+            self.depth -= 1
+            return
         if self.is_locked:
             fcntl.flock(self.handle, fcntl.LOCK_UN)
             os.close(self.handle)
@@ -117,6 +128,7 @@ class FileLock(object):
             except OSError:
                 pass
             self.is_locked = False
+            self.depth = 0
 
     def __enter__(self):
         """
@@ -140,4 +152,4 @@ class FileLock(object):
         Make sure that the FileLock instance doesn't leave a lockfile
         lying around.
         """
-        self.release()
+        self.release(True)
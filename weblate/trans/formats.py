@@ -35,6 +35,7 @@ from translate.storage import factory
 from weblate.trans.util import get_string, join_plural, add_configuration_error
 from translate.misc import quote
 from weblate.trans.util import get_clean_env, calculate_checksum
+from weblate.trans.storecache import STORE_CACHE, get_blob_hash
 import weblate
 import subprocess
 import os.path
@@ -42,6 +43,9 @@ import re
 import csv
 import traceback
 import importlib
+import copy
+import threading
+import weakref
 from StringIO import StringIO
 import __builtin__
 
@@ -51,6 +55,12 @@ FILE_DETECT = []
 FLAGS_RE = re.compile(r'\b[-\w]+\b')
 LOCATIONS_RE = re.compile(r'^([+-]|.*, [+-]|.*:[+-])')
 
+# Indexes of loaded stores
+STORE_INDEXES = weakref.WeakKeyDictionary()
+# Template stores shared in the process
+TEMPLATE_STORES = {}
+TEMPLATE_LOCK = threading.Lock()
+
 
 class ParseError(Exception):
     """Generic error for parsing."""
@@ -66,6 +76,59 @@ class StringIOMode(StringIO):
         self.name = filename
 
 
+class StoreIndex(object):
+    '''
+    Index of store units by their id.
+
+    Unlike findid in translate-toolkit it includes units with empty
+    translation and it is updated when adding units to the store.
+    '''
+    def __init__(self, store):
+        self.units = {}
+        self.positions = {}
+        for position, unit in enumerate(store.units):
+            unit_id = unit.getid()
+            # Prefer units with some content
+            if (unit_id in self.units and
+                    (unit.isheader() or unit.isblank())):
+                continue
+            self.units[unit_id] = unit
+            self.positions[unit_id] = position
+
+    def find(self, unit_id):
+        '''
+        Returns unit with given id or None.
+        '''
+        return self.units.get(unit_id)
+
+    def get_position(self, unit_id):
+        '''
+        Returns position of unit with given id in the store or None.
+        '''
+        return self.positions.get(unit_id)
+
+    def add(self, unit, position):
+        '''
+        Adds unit appended to the store to the index.
+        '''
+        unit_id = unit.getid()
+        if unit_id not in self.units:
+            self.units[unit_id] = unit
+            self.positions[unit_id] = position
+
+
+def get_store_index(store):
+    '''
+    Returns index for translate-toolkit store, building it if needed.
+    '''
+    try:
+        return STORE_INDEXES[store]
+    except KeyError:
+        index = StoreIndex(store)
+        STORE_INDEXES[store] = index
+        return index
+
+
 def register_fileformat(fileformat):
     '''
     Registers fileformat in dictionary.
@@ -439,7 +502,7 @@ class FileFormat(object):
                 not hasattr(storefile, 'mode')):
             storefile.mode = 'r'
 
-        return cls.parse_store(storefile)
+        return STORE_CACHE.load(cls, storefile)
 
     @classmethod
     def get_class(cls):
@@ -496,17 +559,29 @@ class FileFormat(object):
             self.template_store is not None
         )
 
+    @classmethod
+    def load_template(cls, storefile):
+        '''
+        Loads template store, sharing it within the process.
+
+        The shared store is used as long as the file content is not changed,
+        it must not be modified.
+        '''
+        with open(storefile, 'rb') as handle:
+            blob_hash = get_blob_hash(handle.read())
+        key = (cls.format_id, os.path.abspath(storefile))
+        with TEMPLATE_LOCK:
+            cached = TEMPLATE_STORES.get(key)
+        if cached is not None and cached[0] == blob_hash:
+            return cached[1]
+        store = cls.load(storefile)
+        with TEMPLATE_LOCK:
+            TEMPLATE_STORES[key] = (blob_hash, store)
+        return store
+
     def _find_unit_mono(self, context, store):
         # We search by ID when using template
-        ttkit_unit = store.findid(context)
-
-        if ttkit_unit is not None:
-            return ttkit_unit
-
-        # Do not use findid as it does not work for empty translations
-        for search_unit in store.units:
-            if search_unit.getid() == context:
-                return search_unit
+        return get_store_index(store).find(context)
 
     def _find_unit_template(self, context):
         # Need to create new unit based on template
@@ -520,11 +595,16 @@ class FileFormat(object):
 
         # We always need new unit to translate
         if ttkit_unit is None:
-            ttkit_unit = template_ttkit_unit
             if template_ttkit_unit is None:
                 raise Exception(
                     'Could not find template unit for new unit!'
                 )
+            # Template store is shared, so work on copy (keeping reference
+            # to the store instead of copying it)
+            ttkit_unit = copy.deepcopy(
+                template_ttkit_unit,
+                {id(self.template_store): self.template_store}
+            )
             add = True
         else:
             add = False
@@ -579,6 +659,9 @@ class FileFormat(object):
             self.store.addunit(ttkit_unit.unit, new=True)
         else:
             self.store.addunit(ttkit_unit.unit)
+        get_store_index(self.store).add(
+            ttkit_unit.unit, len(self.store.units) - 1
+        )
 
     def update_header(self, **kwargs):
         '''
@@ -614,11 +697,12 @@ class FileFormat(object):
                 # Create wrapper object
                 yield self.unit_class(tt_unit)
         else:
+            index = get_store_index(self.store)
             for template_unit in self.template_store.units:
 
                 # Create wrapper object (not translated)
                 yield self.unit_class(
-                    self.store.findid(template_unit.getid()),
+                    index.find(template_unit.getid()),
                     template_unit
                 )
 
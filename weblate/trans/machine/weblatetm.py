@@ -74,10 +74,8 @@ class WeblateSimilarTranslation(WeblateBase):
         '''
         Downloads list of possible translations from a service.
         '''
-        matching_units = Unit.objects.more_like_this(unit)
-
         return [
-            format_unit_match(munit, 50)
-            for munit in matching_units
+            format_unit_match(munit, quality)
+            for munit, quality in Unit.objects.more_like_this(unit)
             if munit.has_acl(user)
         ]
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2012 - 2015 Michal Čihař <michal@cihar.com>
+#
+# This file is part of Weblate <https://weblate.org/>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+from django.core.management.base import BaseCommand
+from weblate.lang.models import Language
+from weblate.trans.search import check_index
+from optparse import make_option
+
+# Checksums are hex digests, every pass handles one starting digit
+PREFIXES = '0123456789abcdef'
+
+
+class Command(BaseCommand):
+    help = 'checks fulltext index consistency and repairs it'
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--dry-run',
+            action='store_true',
+            dest='dry_run',
+            default=False,
+            help='only report differences, do not repair them'
+        ),
+        make_option(
+            '--lang',
+            action='store',
+            type='string',
+            dest='lang',
+            default=None,
+            help='Limit only to given languages (comma separated list)'
+        ),
+    )
+
+    def handle(self, *args, **options):
+        if options['lang'] is None:
+            langs = [None] + [
+                lang.code for lang in Language.objects.have_translation()
+            ]
+        else:
+            langs = options['lang'].split(',')
+
+        total = 0
+        for lang in langs:
+            missing = stale = 0
+            for prefix in PREFIXES:
+                result = check_index(lang, prefix, not options['dry_run'])
+                missing += result[0]
+                stale += result[1]
+            if lang is None:
+                name = 'source'
+            else:
+                name = 'target-%s' % lang
+            self.stdout.write(
+                '{0}: {1} missing, {2} stale'.format(name, missing, stale)
+            )
+            total += missing + stale
+
+        if options['dry_run']:
+            self.stdout.write('Found {0} differences'.format(total))
+        else:
+            self.stdout.write('Repaired {0} differences'.format(total))
@@ -19,6 +19,7 @@
 #
 
 from weblate.trans.management.commands import WeblateLangCommand
+from weblate.trans.models import PendingUnit
 from django.utils import timezone
 from datetime import timedelta
 from optparse import make_option
@@ -41,7 +42,19 @@ class Command(WeblateLangCommand):
 
         age = timezone.now() - timedelta(hours=options['age'])
 
+        # Edits left behind by processes which did not write them
+        stale = set(PendingUnit.objects.stale().values_list(
+            'unit__translation', flat=True
+        ))
+
         for translation in self.get_translations(*args, **options):
+            if translation.pk in stale:
+                if int(options['verbosity']) >= 1:
+                    self.stdout.write(
+                        'Writing pending edits for %s' % translation
+                    )
+                translation.flush_pending()
+
             if not translation.repo_needs_commit():
                 continue
 
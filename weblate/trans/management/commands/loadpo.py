@@ -19,6 +19,7 @@
 #
 
 from weblate.trans.management.commands import WeblateLangCommand
+from weblate import appsettings
 from optparse import make_option
 
 
@@ -32,11 +33,21 @@ class Command(WeblateLangCommand):
             default=False,
             help='Force rereading files even when they should be up to date'
         ),
+        make_option(
+            '--jobs',
+            type='int',
+            dest='jobs',
+            default=None,
+            help='Number of processes used for loading files'
+        ),
     )
 
     def handle(self, *args, **options):
         langs = None
         if options['lang'] is not None:
             langs = options['lang'].split(',')
+        jobs = options['jobs']
+        if jobs is None:
+            jobs = appsettings.IMPORT_JOBS
         for subproject in self.get_subprojects(*args, **options):
-            subproject.create_translations(options['force'], langs)
+            subproject.create_translations(options['force'], langs, jobs=jobs)
@@ -20,11 +20,8 @@
 
 from weblate.trans.management.commands import WeblateCommand
 from weblate.trans.search import (
-    get_source_index, get_target_index,
-    update_source_unit_index, update_target_unit_index,
-    clean_indexes,
+    index_units, clean_indexes, rebuild_indexes, optimize_indexes,
 )
-from weblate.lang.models import Language
 from optparse import make_option
 
 
@@ -45,41 +42,42 @@ class Command(WeblateCommand):
             default=False,
             help='optimize index without rebuilding it'
         ),
+        make_option(
+            '--jobs',
+            action='store',
+            type='int',
+            dest='jobs',
+            default=0,
+            help='number of processes building indexes in parallel'
+        ),
     )
 
     def handle(self, *args, **options):
         # Optimize index
         if options['optimize']:
-            index = get_source_index()
-            index.optimize()
-            languages = Language.objects.have_translation()
-            for lang in languages:
-                index = get_target_index(lang.code)
-                index.optimize()
+            optimize_indexes()
+            return
+
+        # Build indexes in parallel
+        if options['jobs']:
+            if options['all']:
+                subprojects = None
+            else:
+                subprojects = self.get_subprojects(
+                    *args, **options
+                ).values_list('pk', flat=True)
+            results = rebuild_indexes(
+                options['jobs'], subprojects, options['clean']
+            )
+            for name, count in results:
+                self.stdout.write(
+                    'Indexed {0} strings in {1}'.format(count, name)
+                )
             return
+
         # Optionally rebuild indices from scratch
         if options['clean']:
             clean_indexes()
 
-        # Open writer
-        source_writer = get_source_index().writer()
-        target_writers = {}
-
-        try:
-            # Process all units
-            for unit in self.iterate_units(*args, **options):
-                lang = unit.translation.language.code
-                # Lazy open writer
-                if lang not in target_writers:
-                    target_writers[lang] = get_target_index(lang).writer()
-                # Update target index
-                if unit.translation:
-                    update_target_unit_index(target_writers[lang], unit)
-                # Update source index
-                update_source_unit_index(source_writer, unit)
-
-        finally:
-            # Close all writers
-            source_writer.commit()
-            for lang in target_writers:
-                target_writers[lang].commit()
+        # Process all units
+        index_units(self.iterate_units(*args, **options))
@@ -18,9 +18,10 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
+import time
 from django.core.management.base import BaseCommand
 from weblate.trans.models import IndexUpdate, Unit
-from weblate.trans.search import update_index
+from weblate.trans.search import update_index, INDEX_QUEUE
 from optparse import make_option
 
 
@@ -35,18 +36,39 @@ class Command(BaseCommand):
             default=1000,
             help='number of updates to process in one run'
         ),
+        make_option(
+            '--daemon',
+            action='store_true',
+            dest='daemon',
+            default=False,
+            help='keep processing updates until interrupted'
+        ),
+        make_option(
+            '--max-delay',
+            action='store',
+            type='int',
+            dest='max_delay',
+            default=60,
+            help='maximal delay in seconds between checks when idle'
+        ),
     )
 
-    def handle(self, *args, **options):
-        indexupdates = set()
+    def process_batch(self, limit):
+        '''
+        Processes single batch of updates, returns number of processed ones.
+
+        The updates are claimed before processing, so several processes can
+        work on the queue without indexing same updates. The index is
+        updated outside of database transaction.
+        '''
+        token, updates = IndexUpdate.objects.claim(limit)
+        if not updates:
+            return 0
+
         unit_ids = set()
         source_unit_ids = set()
-
-        # Grab all updates from the database
-        for update in IndexUpdate.objects.all()[:options['limit']].iterator():
-            indexupdates.add(update.pk)
+        for update in updates:
             unit_ids.add(update.unit_id)
-
             if update.source:
                 source_unit_ids.add(update.unit_id)
 
@@ -59,7 +81,53 @@ class Command(BaseCommand):
         )
 
         # Udate index
-        update_index(units, source_units)
+        try:
+            update_index(units, source_units)
+        except Exception:
+            IndexUpdate.objects.release(token)
+            raise
+
+        # Delete processed updates, the ones changed meanwhile are no
+        # longer claimed by us
+        IndexUpdate.objects.filter(worker=token).delete()
+
+        return len(updates)
+
+    def report(self, processed):
+        '''
+        Writes information about processed batch and remaining backlog.
+        '''
+        stats = INDEX_QUEUE.get_stats()
+        self.stdout.write(
+            'Indexed {0} updates, backlog {1}, lag {2:.1f} s, '
+            'last flush took {3:.3f} s'.format(
+                processed,
+                IndexUpdate.objects.count(),
+                IndexUpdate.objects.get_lag(),
+                stats['last_flush_time'],
+            )
+        )
+
+    def handle(self, *args, **options):
+        verbose = int(options['verbosity']) > 1
+
+        if not options['daemon']:
+            processed = self.process_batch(options['limit'])
+            if verbose:
+                self.report(processed)
+            return
 
-        # Delete processed updates
-        IndexUpdate.objects.filter(id__in=indexupdates).delete()
+        delay = 0
+        try:
+            while True:
+                processed = self.process_batch(options['limit'])
+                if processed:
+                    delay = 0
+                    if int(options['verbosity']) > 0:
+                        self.report(processed)
+                    continue
+                # Back off while there is nothing to do
+                delay = min(max(1, delay * 2), options['max_delay'])
+                time.sleep(delay)
+        except KeyboardInterrupt:
+            return
@@ -19,11 +19,25 @@
 #
 
 from weblate.trans.management.commands import WeblateCommand
+from weblate import appsettings
+from optparse import make_option
 
 
 class Command(WeblateCommand):
     help = 'updates git repos'
+    option_list = WeblateCommand.option_list + (
+        make_option(
+            '--jobs',
+            type='int',
+            dest='jobs',
+            default=None,
+            help='Number of processes used for loading files'
+        ),
+    )
 
     def handle(self, *args, **options):
+        jobs = options['jobs']
+        if jobs is None:
+            jobs = appsettings.IMPORT_JOBS
         for subproject in self.get_subprojects(*args, **options):
-            subproject.do_update()
+            subproject.do_update(jobs=jobs)
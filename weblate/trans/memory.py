@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2012 - 2015 Michal Čihař <michal@cihar.com>
+#
+# This file is part of Weblate <https://weblate.org/>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+'''
+Translation memory for finding similar strings.
+
+Source strings of translated units are split to character n-grams and
+MinHash signature is calculated from them. The signature is split to bands
+which are stored in the database, units sharing at least one band with
+searched string are then scored by actual similarity of the strings.
+'''
+
+from difflib import SequenceMatcher
+import hashlib
+import random
+import re
+import zlib
+from django.db.models import Count
+
+# Length of n-grams
+NGRAM = 3
+# Number of bands and rows in each band of the signature
+BANDS = 8
+ROWS = 3
+# Number of candidates scored for each requested result
+CANDIDATES = 10
+# Minimal similarity (in percent) of returned strings
+MIN_SCORE = 50
+
+# Prime used for hashing, all hashes are below it
+PRIME = (1 << 61) - 1
+
+WHITESPACE_RE = re.compile(r'\s+', re.UNICODE)
+
+
+def get_permutation(seed):
+    '''
+    Returns parameters of hash function.
+
+    The parameters are generated with fixed seed to stay same across
+    processes.
+    '''
+    generator = random.Random(seed)
+    return (
+        generator.randint(1, PRIME - 1),
+        generator.randint(0, PRIME - 1),
+    )
+
+
+# Parameters of hash functions
+PERMUTATIONS = [get_permutation(seed) for seed in range(BANDS * ROWS)]
+
+
+def normalize(text):
+    '''
+    Normalizes text for comparing.
+    '''
+    return WHITESPACE_RE.sub(' ', text.lower()).strip()
+
+
+def get_ngrams(text):
+    '''
+    Returns set of n-grams in normalized text.
+    '''
+    text = normalize(text)
+    if len(text) <= NGRAM:
+        return set([text])
+    return set([
+        text[pos:pos + NGRAM] for pos in range(len(text) - NGRAM + 1)
+    ])
+
+
+def get_bands(text):
+    '''
+    Returns list of band hashes for MinHash signature of text.
+    '''
+    values = [
+        int(hashlib.md5(ngram.encode('utf-8')).hexdigest()[:15], 16)
+        for ngram in get_ngrams(text)
+    ]
+    signature = [
+        min([(mul * value + add) % PRIME for value in values])
+        for mul, add in PERMUTATIONS
+    ]
+    return [
+        zlib.crc32(
+            repr((band, signature[band * ROWS:(band + 1) * ROWS]))
+        ) & 0x7fffffff
+        for band in range(BANDS)
+    ]
+
+
+def get_similarity(first, second):
+    '''
+    Returns similarity of two strings in percent.
+    '''
+    return int(
+        SequenceMatcher(None, normalize(first), normalize(second)).ratio() *
+        100
+    )
+
+
+def update_memory_unit(unit):
+    '''
+    Updates translation memory for given unit.
+    '''
+    from weblate.trans.models.search import SimilarityBand
+    SimilarityBand.objects.filter(unit=unit).delete()
+    if not unit.translated:
+        return
+    source = unit.get_source_plurals()[0]
+    language = unit.translation.language
+    SimilarityBand.objects.bulk_create([
+        SimilarityBand(unit=unit, language=language, band=band)
+        for band in set(get_bands(source))
+    ])
+
+
+def memory_lookup(unit, top=5):
+    '''
+    Returns list of (unit, score) for translated units with similar source.
+
+    Exact matches of the source string are not included.
+    '''
+    from weblate.trans.models import Unit
+    from weblate.trans.models.search import SimilarityBand
+    source = unit.get_source_plurals()[0]
+    language = unit.translation.language
+
+    candidates = SimilarityBand.objects.filter(
+        language=language,
+        band__in=get_bands(source),
+    ).exclude(
+        unit=unit
+    ).values(
+        'unit'
+    ).annotate(
+        matches=Count('id')
+    ).order_by(
+        '-matches'
+    )[:top * CANDIDATES]
+
+    units = Unit.objects.filter(
+        pk__in=[candidate['unit'] for candidate in candidates],
+        translated=True,
+    ).exclude(
+        source=unit.source
+    ).select_related(
+        'translation__subproject'
+    )
+
+    result = []
+    for match in units:
+        score = get_similarity(source, match.get_source_plurals()[0])
+        if score >= MIN_SCORE:
+            result.append((match, score))
+
+    result.sort(key=lambda item: (-item[1], item[0].pk))
+    return result[:top]
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+FIELDS = ('source', 'context', 'location', 'target', 'comment')
+
+
+def create_fulltext(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        try:
+            schema_editor.execute(
+                'CREATE VIRTUAL TABLE trans_fulltextdocument_fts '
+                'USING fts5({0}, content=\'trans_fulltextdocument\', '
+                'content_rowid=\'id\')'.format(', '.join(FIELDS))
+            )
+        except Exception:
+            # SQLite built without FTS5
+            return
+        new = ', '.join(['new.{0}'.format(field) for field in FIELDS])
+        old = ', '.join(['old.{0}'.format(field) for field in FIELDS])
+        columns = ', '.join(FIELDS)
+        insert = (
+            'INSERT INTO trans_fulltextdocument_fts (rowid, {0}) '
+            'VALUES (new.id, {1});'.format(columns, new)
+        )
+        delete = (
+            'INSERT INTO trans_fulltextdocument_fts '
+            '(trans_fulltextdocument_fts, rowid, {0}) '
+            'VALUES (\'delete\', old.id, {1});'.format(columns, old)
+        )
+        schema_editor.execute(
+            'CREATE TRIGGER trans_fulltextdocument_ai '
+            'AFTER INSERT ON trans_fulltextdocument BEGIN {0} END'.format(
+                insert
+            )
+        )
+        schema_editor.execute(
+            'CREATE TRIGGER trans_fulltextdocument_ad '
+            'AFTER DELETE ON trans_fulltextdocument BEGIN {0} END'.format(
+                delete
+            )
+        )
+        schema_editor.execute(
+            'CREATE TRIGGER trans_fulltextdocument_au '
+            'AFTER UPDATE ON trans_fulltextdocument BEGIN {0} {1} END'.format(
+                delete, insert
+            )
+        )
+    elif vendor == 'postgresql':
+        for field in FIELDS:
+            schema_editor.execute(
+                'CREATE INDEX trans_fulltextdocument_{0}_fts '
+                'ON trans_fulltextdocument '
+                'USING gin(to_tsvector(\'simple\', {0}))'.format(field)
+            )
+
+
+def drop_fulltext(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        for suffix in ('ai', 'ad', 'au'):
+            schema_editor.execute(
+                'DROP TRIGGER IF EXISTS trans_fulltextdocument_{0}'.format(
+                    suffix
+                )
+            )
+        schema_editor.execute(
+            'DROP TABLE IF EXISTS trans_fulltextdocument_fts'
+        )
+    elif vendor == 'postgresql':
+        for field in FIELDS:
+            schema_editor.execute(
+                'DROP INDEX IF EXISTS trans_fulltextdocument_{0}_fts'.format(
+                    field
+                )
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trans', '0048_auto_20151120_1306'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FulltextDocument',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('checksum', models.CharField(max_length=40)),
+                ('language', models.CharField(default='', max_length=50, blank=True)),
+                ('source', models.TextField(default='', blank=True)),
+                ('context', models.TextField(default='', blank=True)),
+                ('location', models.TextField(default='', blank=True)),
+                ('target', models.TextField(default='', blank=True)),
+                ('comment', models.TextField(default='', blank=True)),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='fulltextdocument',
+            index_together=set([('checksum', 'language')]),
+        ),
+        migrations.RunPython(
+            create_fulltext,
+            reverse_code=drop_fulltext,
+        ),
+    ]
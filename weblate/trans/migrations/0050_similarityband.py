@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lang', '0002_auto_20150630_1208'),
+        ('trans', '0049_fulltextdocument'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarityBand',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('band', models.IntegerField()),
+                ('language', models.ForeignKey(to='lang.Language')),
+                ('unit', models.ForeignKey(to='trans.Unit')),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='similarityband',
+            index_together=set([('language', 'band')]),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trans', '0051_indexupdate_timestamp'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingUnit',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('author', models.CharField(max_length=200)),
+                ('timestamp', models.DateTimeField(default=django.utils.timezone.now)),
+                ('unit', models.OneToOneField(to='trans.Unit')),
+            ],
+        ),
+    ]
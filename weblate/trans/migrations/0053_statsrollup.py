@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+FIELDS = (
+    'total', 'total_words', 'translated', 'translated_words', 'fuzzy',
+    'fuzzy_words', 'failing_checks', 'failing_checks_words',
+    'have_suggestion', 'have_comment',
+)
+
+LEVELS = (
+    ('subproject__project',),
+    ('subproject__project', 'subproject'),
+    ('language',),
+    ('subproject__project', 'language'),
+)
+
+
+def fill_in_rollups(apps, schema_editor):
+    Translation = apps.get_model('trans', 'Translation')
+    StatsRollup = apps.get_model('trans', 'StatsRollup')
+
+    aggregates = [Count('id')] + [Sum(field) for field in FIELDS]
+    for level in LEVELS:
+        stats = Translation.objects.values(*level).annotate(
+            *aggregates
+        ).order_by()
+        for item in stats:
+            rollup = StatsRollup(
+                project_id=item.get('subproject__project'),
+                subproject_id=item.get('subproject'),
+                language_id=item.get('language'),
+                translations=item['id__count'],
+            )
+            for field in FIELDS:
+                setattr(rollup, field, item['{0}__sum'.format(field)])
+            rollup.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trans', '0052_pendingunit'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatsRollup',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('translations', models.IntegerField(default=0)),
+                ('total', models.IntegerField(default=0)),
+                ('total_words', models.IntegerField(default=0)),
+                ('translated', models.IntegerField(default=0)),
+                ('translated_words', models.IntegerField(default=0)),
+                ('fuzzy', models.IntegerField(default=0)),
+                ('fuzzy_words', models.IntegerField(default=0)),
+                ('failing_checks', models.IntegerField(default=0)),
+                ('failing_checks_words', models.IntegerField(default=0)),
+                ('have_suggestion', models.IntegerField(default=0)),
+                ('have_comment', models.IntegerField(default=0)),
+                ('language', models.ForeignKey(to='lang.Language', null=True)),
+                ('project', models.ForeignKey(to='trans.Project', null=True)),
+                ('subproject', models.ForeignKey(to='trans.SubProject', null=True)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='statsrollup',
+            unique_together=set([('project', 'subproject', 'language')]),
+        ),
+        migrations.RunPython(
+            fill_in_rollups,
+            reverse_code=migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+from django.db.models import Count, Min
+
+UNIQUE = 'trans_fulltextdocument_checksum_language_uniq'
+INDEX = 'trans_fulltextdocument_checksum_language_idx'
+
+
+def remove_duplicates(apps, schema_editor):
+    FulltextDocument = apps.get_model('trans', 'FulltextDocument')
+
+    duplicates = FulltextDocument.objects.values(
+        'checksum', 'language'
+    ).annotate(
+        Count('id'), Min('id')
+    ).filter(
+        id__count__gt=1
+    ).order_by()
+    for item in duplicates:
+        FulltextDocument.objects.filter(
+            checksum=item['checksum'],
+            language=item['language'],
+        ).exclude(
+            id=item['id__min']
+        ).delete()
+
+
+def get_index_names(schema_editor, unique):
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(
+            cursor, 'trans_fulltextdocument'
+        )
+    return [
+        name for name, info in constraints.items()
+        if info['columns'] == ['checksum', 'language'] and
+        info['index'] and bool(info['unique']) == unique
+    ]
+
+
+def drop_index(schema_editor, name):
+    if schema_editor.connection.vendor == 'mysql':
+        schema_editor.execute(
+            'DROP INDEX {0} ON trans_fulltextdocument'.format(name)
+        )
+    else:
+        schema_editor.execute('DROP INDEX {0}'.format(name))
+
+
+def create_unique(apps, schema_editor):
+    # Indexes are changed directly, altering unique_together would recreate
+    # the table on SQLite and drop fulltext triggers
+    for name in get_index_names(schema_editor, False):
+        drop_index(schema_editor, name)
+    schema_editor.execute(
+        'CREATE UNIQUE INDEX {0} '
+        'ON trans_fulltextdocument (checksum, language)'.format(UNIQUE)
+    )
+
+
+def drop_unique(apps, schema_editor):
+    for name in get_index_names(schema_editor, True):
+        drop_index(schema_editor, name)
+    schema_editor.execute(
+        'CREATE INDEX {0} '
+        'ON trans_fulltextdocument (checksum, language)'.format(INDEX)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trans', '0053_statsrollup'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            remove_duplicates,
+            reverse_code=migrations.RunPython.noop,
+        ),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(
+                    create_unique,
+                    reverse_code=drop_unique,
+                ),
+            ],
+            state_operations=[
+                migrations.AlterUniqueTogether(
+                    name='fulltextdocument',
+                    unique_together=set([('checksum', 'language')]),
+                ),
+                migrations.AlterIndexTogether(
+                    name='fulltextdocument',
+                    index_together=set([]),
+                ),
+            ],
+        ),
+    ]
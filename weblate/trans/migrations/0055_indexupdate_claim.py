@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trans', '0054_fulltextdocument_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='indexupdate',
+            name='claimed',
+            field=models.DateTimeField(null=True, blank=True),
+        ),
+        migrations.AddField(
+            model_name='indexupdate',
+            name='worker',
+            field=models.CharField(default='', max_length=32, blank=True, db_index=True),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def fill_in_keys(apps, schema_editor):
+    StatsRollup = apps.get_model('trans', 'StatsRollup')
+    seen = set()
+    for rollup in StatsRollup.objects.order_by('pk'):
+        key = '-'.join([
+            '' if value is None else str(value)
+            for value in (
+                rollup.project_id, rollup.subproject_id, rollup.language_id
+            )
+        ])
+        # Remove duplicates created concurrently
+        if key in seen:
+            rollup.delete()
+            continue
+        seen.add(key)
+        rollup.key = key
+        rollup.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trans', '0055_indexupdate_claim'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='statsrollup',
+            name='key',
+            field=models.CharField(default='', max_length=100),
+            preserve_default=False,
+        ),
+        migrations.RunPython(
+            fill_in_keys,
+            reverse_code=migrations.RunPython.noop
+        ),
+        migrations.AlterField(
+            model_name='statsrollup',
+            name='key',
+            field=models.CharField(unique=True, max_length=100),
+        ),
+        migrations.AlterUniqueTogether(
+            name='statsrollup',
+            unique_together=set([]),
+        ),
+    ]
@@ -31,7 +31,11 @@ from weblate.trans.models.unit import Unit
 from weblate.trans.models.unitdata import (
     Check, Suggestion, Comment, Vote
 )
-from weblate.trans.models.search import IndexUpdate
+from weblate.trans.models.search import (
+    IndexUpdate, FulltextDocument, SimilarityBand,
+)
+from weblate.trans.models.pending import PendingUnit
+from weblate.trans.models.rollup import StatsRollup
 from weblate.trans.models.changes import Change
 from weblate.trans.models.dictionary import Dictionary
 from weblate.trans.models.source import Source
@@ -49,7 +53,8 @@ from weblate.trans.scripts import (
 __all__ = [
     'Project', 'SubProject', 'Translation', 'Unit', 'Check', 'Suggestion',
     'Comment', 'Vote', 'IndexUpdate', 'Change', 'Dictionary', 'Source',
-    'Advertisement', 'WhiteboardMessage',
+    'Advertisement', 'WhiteboardMessage', 'FulltextDocument', 'SimilarityBand',
+    'PendingUnit', 'StatsRollup',
 ]
 
 
@@ -70,6 +75,27 @@ def delete_object_dir(sender, instance, **kwargs):
         shutil.rmtree(project_path)
 
 
+@receiver(post_save, sender=Translation)
+def add_translation_rollup(sender, instance, created, **kwargs):
+    '''
+    Counts new translation in rollups.
+    '''
+    if created:
+        StatsRollup.objects.add_delta(instance, {'translations': 1})
+
+
+@receiver(post_delete, sender=Translation)
+def remove_translation_rollup(sender, instance, **kwargs):
+    '''
+    Removes deleted translation from rollups.
+    '''
+    delta = dict(
+        (key, -value) for key, value in instance.get_stats_values().items()
+    )
+    delta['translations'] = -1
+    StatsRollup.objects.add_delta(instance, delta, create=False)
+
+
 @receiver(post_save, sender=Source)
 def update_source(sender, instance, **kwargs):
     """
@@ -154,57 +180,11 @@ def cleanup_deleted(sender, instance, **kwargs):
     '''
     Removes stale checks/comments/suggestions for deleted units.
     '''
-    project = instance.translation.subproject.project
-    language = instance.translation.language
-    contentsum = instance.translation
-    units = Unit.objects.filter(
-        translation__language=language,
-        translation__subproject__project=project,
-        contentsum=contentsum
-    )
-    if units.exists():
-        # There are other units as well, but some checks
-        # (eg. consistency) needs update now
-        for unit in units:
-            unit.run_checks()
-        return
-
-    # Last unit referencing to these checks
-    Check.objects.filter(
-        project=project,
-        language=language,
-        contentsum=contentsum
-    ).delete()
-    # Delete suggestons referencing this unit
-    Suggestion.objects.filter(
-        project=project,
-        language=language,
-        contentsum=contentsum
-    ).delete()
-    # Delete translation comments referencing this unit
-    Comment.objects.filter(
-        project=project,
-        language=language,
-        contentsum=contentsum
-    ).delete()
-    # Check for other units with same source
-    other_units = Unit.objects.filter(
-        translation__subproject__project=project,
-        contentsum=contentsum
+    Unit.objects.cleanup_related(
+        instance.translation.subproject.project,
+        instance.translation.language,
+        [instance.contentsum]
     )
-    if not other_units.exists():
-        # Delete source comments as well if this was last reference
-        Comment.objects.filter(
-            project=project,
-            language=None,
-            contentsum=contentsum
-        ).delete()
-        # Delete source checks as well if this was last reference
-        Check.objects.filter(
-            project=project,
-            language=None,
-            contentsum=contentsum
-        ).delete()
 
 
 @receiver(vcs_post_push)
@@ -20,7 +20,7 @@
 
 from django.db import models
 from django.contrib.auth.models import User
-from django.db.models import Count, Q
+from django.db.models import Count, Max, Q
 from django.utils.translation import ugettext as _, ugettext_lazy
 from django.utils import timezone
 from weblate.trans.models.project import Project
@@ -42,6 +42,23 @@ class ChangeManager(models.Manager):
             user__isnull=False,
         )
 
+    def last_content_changes(self, translations):
+        '''
+        Returns last content change of every translation in a dictionary
+        indexed by translation id.
+        '''
+        pks = self.content().filter(
+            translation__in=translations
+        ).values(
+            'translation'
+        ).annotate(
+            Max('pk')
+        ).order_by().values_list(
+            'pk__max', flat=True
+        )
+        changes = self.filter(pk__in=list(pks)).select_related('author')
+        return dict((change.translation_id, change) for change in changes)
+
     def count_stats(self, days, step, dtstart, base):
         '''
         Counts number of changes in given dataset and period grouped by
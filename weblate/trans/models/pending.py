@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2012 - 2015 Michal Čihař <michal@cihar.com>
+#
+# This file is part of Weblate <https://weblate.org/>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+from datetime import timedelta
+from django.db import models
+from django.utils import timezone
+from weblate import appsettings
+
+
+class PendingUnitManager(models.Manager):
+    def get_lag(self):
+        '''
+        Returns age in seconds of oldest pending edit.
+        '''
+        try:
+            oldest = self.order_by('timestamp')[0]
+        except IndexError:
+            return 0
+        return (timezone.now() - oldest.timestamp).total_seconds()
+
+    def stale(self):
+        '''
+        Returns edits which should have been already written.
+
+        These are left behind by processes which ended before writing them.
+        '''
+        return self.filter(
+            timestamp__lt=timezone.now() - timedelta(
+                seconds=appsettings.WRITE_BEHIND_DELAY
+            )
+        )
+
+
+class PendingUnit(models.Model):
+    '''
+    Edit of unit saved in the database, but not yet written to the file.
+    '''
+    unit = models.OneToOneField('Unit')
+    author = models.CharField(max_length=200)
+    timestamp = models.DateTimeField(default=timezone.now)
+
+    objects = PendingUnitManager()
+
+    class Meta(object):
+        app_label = 'trans'
+
+    def __unicode__(self):
+        return self.unit.__unicode__()
@@ -315,11 +315,11 @@ class Project(models.Model, PercentMixin, URLMixin, PathMixin):
         """
         Returns percentages of translation status.
         """
-        # Import translations
-        from weblate.trans.models.translation import Translation
+        # Import rollups
+        from weblate.trans.models.rollup import StatsRollup
 
         # Get percents:
-        return Translation.objects.get_percents(project=self, language=lang)
+        return StatsRollup.objects.get_percents(project=self, language=lang)
 
     # Arguments number differs from overridden method
     # pylint: disable=W0221
@@ -336,41 +336,44 @@ class Project(models.Model, PercentMixin, URLMixin, PathMixin):
         """
         Calculates total number of strings to translate. This is done based on
         assumption that all languages have same number of strings.
+
+        The number of strings in component is average of its translations,
+        which differs from the actual one only while some translations are
+        not yet updated to the current source strings.
         """
-        totals = []
-        for component in self.subproject_set.all():
-            try:
-                totals.append(component.translation_set.all()[0].total)
-            except IndexError:
-                pass
-        return sum(totals)
+        from weblate.trans.models.rollup import StatsRollup
+        return sum([
+            rollup.get_strings()
+            for rollup in StatsRollup.objects.get_components(self)
+        ])
 
     def get_total_words(self):
         """
         Calculates total number of words to translate. This is done based on
         assumption that all languages have same number of strings.
         """
-        totals = []
-        for component in self.subproject_set.all():
-            try:
-                totals.append(component.translation_set.all()[0].total_words)
-            except IndexError:
-                pass
-        return sum(totals)
+        from weblate.trans.models.rollup import StatsRollup
+        return sum([
+            rollup.get_words()
+            for rollup in StatsRollup.objects.get_components(self)
+        ])
 
     def get_languages(self):
         """
         Returns list of all languages used in project.
         """
         return Language.objects.filter(
-            translation__subproject__project=self
-        ).distinct()
+            statsrollup__project=self,
+            statsrollup__subproject=None,
+            statsrollup__translations__gt=0,
+        )
 
     def get_language_count(self):
         """
         Returns number of languages used in this project.
         """
-        return self.get_languages().count()
+        from weblate.trans.models.rollup import StatsRollup
+        return StatsRollup.objects.get_languages(self).count()
 
     def repo_needs_commit(self):
         """
@@ -0,0 +1,336 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2012 - 2015 Michal Čihař <michal@cihar.com>
+#
+# This file is part of Weblate <https://weblate.org/>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import models, transaction, IntegrityError
+from django.db.models import Sum, Count, F
+
+from weblate.lang.models import Language
+from weblate.trans.util import translation_percent
+
+# Counters kept in rollups, see Translation.get_stats_values
+ROLLUP_FIELDS = (
+    'translations', 'total', 'total_words', 'translated', 'translated_words',
+    'fuzzy', 'fuzzy_words', 'failing_checks', 'failing_checks_words',
+    'have_suggestion', 'have_comment',
+)
+
+# Materialized levels, every level is list of fields of Translation
+ROLLUP_LEVELS = (
+    ('subproject__project',),
+    ('subproject__project', 'subproject'),
+    ('language',),
+    ('subproject__project', 'language'),
+)
+
+
+def get_rollup_key(project_id, subproject_id, language_id):
+    '''
+    Returns unique key of rollup.
+
+    Unique constraint on the nullable columns does not prevent duplicate
+    rollups as NULL values are not considered equal.
+    '''
+    return '-'.join([
+        '' if value is None else str(value)
+        for value in (project_id, subproject_id, language_id)
+    ])
+
+
+def get_rollup_filter(project=None, subproject=None, language=None):
+    '''
+    Returns lookup for rollup row for given objects or None if such
+    combination is not materialized.
+    '''
+    if subproject is not None:
+        if language is not None:
+            return None
+        return {
+            'project_id': subproject.project_id,
+            'subproject_id': subproject.pk,
+            'language_id': None,
+        }
+    if project is None and language is None:
+        return None
+    return {
+        'project_id': getattr(project, 'pk', None),
+        'subproject_id': None,
+        'language_id': getattr(language, 'pk', None),
+    }
+
+
+class StatsRollupManager(models.Manager):
+    # pylint: disable=W0232
+
+    def get_lookups(self, translation):
+        '''
+        Returns lookups of all rollups the translation is part of.
+        '''
+        result = [{
+            'project_id': None,
+            'subproject_id': None,
+            'language_id': translation.language_id,
+        }]
+        try:
+            project = translation.subproject.project_id
+        except ObjectDoesNotExist:
+            # Component is being deleted together with its rollups
+            return result
+        result.append({
+            'project_id': project,
+            'subproject_id': None,
+            'language_id': None,
+        })
+        result.append({
+            'project_id': project,
+            'subproject_id': translation.subproject_id,
+            'language_id': None,
+        })
+        result.append({
+            'project_id': project,
+            'subproject_id': None,
+            'language_id': translation.language_id,
+        })
+        return result
+
+    def add_delta(self, translation, delta, create=True):
+        '''
+        Adds difference of translation counters to all its rollups.
+
+        Missing rollups are created from current translations when
+        create is set.
+        '''
+        if not delta:
+            return
+        changes = dict((key, F(key) + value) for key, value in delta.items())
+        for lookup in self.get_lookups(translation):
+            key = get_rollup_key(**lookup)
+            if self.filter(key=key).update(**changes) or not create:
+                continue
+            try:
+                with transaction.atomic():
+                    self.create(**lookup).recount()
+            except IntegrityError:
+                # Created meanwhile by other process
+                self.filter(key=key).update(**changes)
+
+    def get_rollup(self, project=None, subproject=None, language=None):
+        '''
+        Returns rollup for given objects, None if it does not exist.
+        '''
+        lookup = get_rollup_filter(project, subproject, language)
+        if lookup is None:
+            raise ValueError('Not materialized rollup!')
+        try:
+            return self.get(key=get_rollup_key(**lookup))
+        except StatsRollup.DoesNotExist:
+            return None
+
+    def get_percents(self, project=None, subproject=None, language=None):
+        '''
+        Returns tuple consting of status percents -
+        (translated, fuzzy, failing checks)
+        '''
+        rollup = self.get_rollup(project, subproject, language)
+        if rollup is None:
+            return (100, 0, 0)
+        return rollup.get_percents()
+
+    def get_project_stats(self, project, language=None):
+        '''
+        Returns translated percent of project or its language, number of
+        strings and words to translate and number of languages.
+
+        All values are read from rollups of the project in single query,
+        numbers of strings are summed same way as in Project.get_total.
+        '''
+        percent = 100
+        total = 0
+        total_words = 0
+        languages = 0
+        for rollup in self.filter(project=project):
+            if rollup.subproject_id is not None:
+                total += rollup.get_strings()
+                total_words += rollup.get_words()
+                continue
+            if rollup.language_id is not None and rollup.translations:
+                languages += 1
+            if rollup.language_id == getattr(language, 'pk', None):
+                percent = rollup.get_percents()[0]
+        return {
+            'percent': percent,
+            'total': total,
+            'total_words': total_words,
+            'languages': languages,
+        }
+
+    def get_components(self, project):
+        '''
+        Returns component rollups within project.
+        '''
+        return self.filter(
+            project=project,
+            subproject__isnull=False,
+            language=None,
+            translations__gt=0,
+        )
+
+    def get_languages(self, project):
+        '''
+        Returns per language rollups within project.
+        '''
+        return self.filter(
+            project=project,
+            subproject=None,
+            language__isnull=False,
+            translations__gt=0,
+        )
+
+    def rebuild(self):
+        '''
+        Recreates all rollups from translations.
+        '''
+        from weblate.trans.models.translation import Translation
+        aggregates = [Count('id')]
+        aggregates.extend([Sum(field) for field in ROLLUP_FIELDS[1:]])
+
+        rollups = []
+        for level in ROLLUP_LEVELS:
+            stats = Translation.objects.values(*level).annotate(
+                *aggregates
+            ).order_by()
+            for item in stats:
+                rollup = StatsRollup(
+                    project_id=item.get('subproject__project'),
+                    subproject_id=item.get('subproject'),
+                    language_id=item.get('language'),
+                    translations=item['id__count'],
+                )
+                rollup.key = rollup.get_key()
+                for field in ROLLUP_FIELDS[1:]:
+                    setattr(rollup, field, item['{0}__sum'.format(field)])
+                rollups.append(rollup)
+
+        with transaction.atomic():
+            self.all().delete()
+            self.bulk_create(rollups)
+
+
+class StatsRollup(models.Model):
+    '''
+    Materialized sum of translation statistics on project, component,
+    language and project language level.
+    '''
+    project = models.ForeignKey('Project', null=True)
+    subproject = models.ForeignKey('SubProject', null=True)
+    language = models.ForeignKey(Language, null=True)
+    key = models.CharField(max_length=100, unique=True)
+
+    translations = models.IntegerField(default=0)
+    total = models.IntegerField(default=0)
+    total_words = models.IntegerField(default=0)
+    translated = models.IntegerField(default=0)
+    translated_words = models.IntegerField(default=0)
+    fuzzy = models.IntegerField(default=0)
+    fuzzy_words = models.IntegerField(default=0)
+    failing_checks = models.IntegerField(default=0)
+    failing_checks_words = models.IntegerField(default=0)
+    have_suggestion = models.IntegerField(default=0)
+    have_comment = models.IntegerField(default=0)
+
+    objects = StatsRollupManager()
+
+    class Meta(object):
+        app_label = 'trans'
+
+    def __unicode__(self):
+        return u'/'.join([
+            unicode(item)
+            for item in (self.project, self.subproject, self.language)
+            if item is not None
+        ])
+
+    def save(self, *args, **kwargs):
+        self.key = self.get_key()
+        super(StatsRollup, self).save(*args, **kwargs)
+
+    def get_key(self):
+        '''
+        Returns unique key of the rollup.
+        '''
+        return get_rollup_key(
+            self.project_id, self.subproject_id, self.language_id
+        )
+
+    def get_translations(self):
+        '''
+        Returns translations summed in this rollup.
+        '''
+        from weblate.trans.models.translation import Translation
+        result = Translation.objects.all()
+        if self.project_id is not None:
+            result = result.filter(subproject__project_id=self.project_id)
+        if self.subproject_id is not None:
+            result = result.filter(subproject_id=self.subproject_id)
+        if self.language_id is not None:
+            result = result.filter(language_id=self.language_id)
+        return result
+
+    def recount(self):
+        '''
+        Recounts rollup from translations.
+        '''
+        aggregates = [Count('id')]
+        aggregates.extend([Sum(field) for field in ROLLUP_FIELDS[1:]])
+        stats = self.get_translations().aggregate(*aggregates)
+        self.translations = stats['id__count']
+        for field in ROLLUP_FIELDS[1:]:
+            setattr(self, field, stats['{0}__sum'.format(field)] or 0)
+        self.save()
+
+    def get_percents(self):
+        '''
+        Returns tuple consting of status percents -
+        (translated, fuzzy, failing checks)
+        '''
+        # Catch no translations (division by zero)
+        if self.total == 0:
+            return (100, 0, 0)
+        return tuple([
+            translation_percent(value, self.total)
+            for value in (self.translated, self.fuzzy, self.failing_checks)
+        ])
+
+    def get_strings(self):
+        '''
+        Returns number of strings in single translation. This is done based
+        on assumption that all languages have same number of strings.
+        '''
+        if not self.translations:
+            return 0
+        return self.total // self.translations
+
+    def get_words(self):
+        '''
+        Returns number of words in single translation.
+        '''
+        if not self.translations:
+            return 0
+        return self.total_words // self.translations
@@ -18,15 +18,121 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
+from datetime import timedelta
+import uuid
 from django.db import models
+from django.db.models import Q
+from django.utils import timezone
+from weblate.lang.models import Language
+
+# Time in seconds after which claimed updates are considered abandoned
+CLAIM_TIMEOUT = 3600
+
+
+class IndexUpdateManager(models.Manager):
+    def claim(self, limit):
+        '''
+        Claims pending updates for processing.
+
+        Returns claim token and list of claimed updates. The updates are
+        claimed by conditional update of the rows, so several workers can
+        process the queue without waiting for each other. Claims older than
+        CLAIM_TIMEOUT are taken over as their worker has most likely died.
+        '''
+        token = uuid.uuid4().hex
+        while True:
+            now = timezone.now()
+            available = Q(claimed=None) | Q(
+                claimed__lt=now - timedelta(seconds=CLAIM_TIMEOUT)
+            )
+            pks = list(
+                self.filter(available).order_by('pk').values_list(
+                    'pk', flat=True
+                )[:limit]
+            )
+            if not pks:
+                return token, []
+            # Other worker might have claimed some of them meanwhile
+            if self.filter(available, pk__in=pks).update(
+                    worker=token, claimed=now):
+                return token, list(self.filter(worker=token))
+
+    def release(self, token):
+        '''
+        Returns claimed updates back to the queue.
+        '''
+        self.filter(worker=token).update(worker='', claimed=None)
+
+    def get_lag(self):
+        '''
+        Returns age in seconds of oldest pending update.
+        '''
+        try:
+            oldest = self.order_by('timestamp')[0]
+        except IndexError:
+            return 0
+        return (timezone.now() - oldest.timestamp).total_seconds()
 
 
 class IndexUpdate(models.Model):
     unit = models.OneToOneField('Unit')
     source = models.BooleanField(default=True)
+    timestamp = models.DateTimeField(default=timezone.now)
+    worker = models.CharField(
+        max_length=32, blank=True, default='', db_index=True
+    )
+    claimed = models.DateTimeField(null=True, blank=True)
+
+    objects = IndexUpdateManager()
+
+    class Meta(object):
+        app_label = 'trans'
+
+    def __unicode__(self):
+        return self.unit.__unicode__()
+
+
+class FulltextDocument(models.Model):
+    '''
+    Fulltext index document used by database search backend.
+
+    Source documents have empty language, target documents are stored
+    for each language.
+    '''
+    checksum = models.CharField(max_length=40)
+    language = models.CharField(max_length=50, blank=True, default='')
+    source = models.TextField(blank=True, default='')
+    context = models.TextField(blank=True, default='')
+    location = models.TextField(blank=True, default='')
+    target = models.TextField(blank=True, default='')
+    comment = models.TextField(blank=True, default='')
+
+    class Meta(object):
+        app_label = 'trans'
+        unique_together = [
+            ('checksum', 'language'),
+        ]
+
+    def __unicode__(self):
+        return self.checksum
+
+
+class SimilarityBand(models.Model):
+    '''
+    Band of MinHash signature of translated unit source.
+
+    Units sharing a band with searched string are candidates for similar
+    strings in translation memory.
+    '''
+    unit = models.ForeignKey('Unit')
+    language = models.ForeignKey(Language)
+    band = models.IntegerField()
 
     class Meta(object):
         app_label = 'trans'
+        index_together = [
+            ('language', 'band'),
+        ]
 
     def __unicode__(self):
         return self.unit.__unicode__()
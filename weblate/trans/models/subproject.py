@@ -18,7 +18,8 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
-from django.db import models, transaction
+from django.db import models, transaction, connection, connections
+from django.db.models import Q
 from django.utils.translation import ugettext as _, ugettext_lazy
 from django.core.mail import mail_admins
 from django.core.exceptions import ValidationError
@@ -32,6 +33,7 @@ import traceback
 import sys
 import time
 import fnmatch
+import multiprocessing
 import re
 from weblate.trans.formats import FILE_FORMAT_CHOICES, FILE_FORMATS, ParseError
 from weblate.trans.mixins import PercentMixin, URLMixin, PathMixin
@@ -45,6 +47,7 @@ from weblate.trans.signals import (
     vcs_post_push, vcs_post_update, translation_post_add
 )
 from weblate.trans.vcs import RepositoryException, VCS_REGISTRY, VCS_CHOICES
+from weblate.trans.search import INDEX_QUEUE
 from weblate.trans.models.translation import Translation
 from weblate.trans.validators import (
     validate_repoweb, validate_filemask,
@@ -61,6 +64,44 @@ from weblate.appsettings import (
 )
 from weblate.accounts.models import notify_merge_failure, get_author_name
 from weblate.trans.models.changes import Change
+from weblate.trans.models.pending import PendingUnit
+from weblate.trans.models.rollup import StatsRollup
+
+
+def sync_translation(params, subproject=None, request=None):
+    '''
+    Loads single translation file, returns translation id.
+
+    The params is tuple of component id, language id, language code, path
+    and whether to force the update. It is used directly as task for worker
+    processes, which load the component from the database.
+    '''
+    subproject_id, language_id, code, path, force = params
+    if subproject is None:
+        subproject = SubProject.objects.get(pk=subproject_id)
+    with transaction.atomic():
+        translation = Translation.objects.check_sync(
+            subproject,
+            Language.objects.get(pk=language_id),
+            code,
+            path,
+            force,
+            request=request
+        )
+    return translation.id
+
+
+def sync_translation_task(params):
+    '''
+    Loads single translation file in worker process.
+
+    The workers exit without running atexit handlers, so the index updates
+    queued while loading the file have to be written before returning.
+    '''
+    try:
+        return sync_translation(params)
+    finally:
+        INDEX_QUEUE.flush()
 
 
 DEFAULT_COMMIT_MESSAGE = (
@@ -702,12 +743,14 @@ class SubProject(models.Model, PercentMixin, URLMixin, PathMixin):
         with self.repository_lock:
             self.repository.configure_branch(self.branch)
 
-    def do_update(self, request=None, method=None):
+    def do_update(self, request=None, method=None, jobs=1):
         '''
         Wrapper for doing repository update and pushing them to translations.
         '''
         if self.is_repo_link:
-            return self.linked_subproject.do_update(request, method=method)
+            return self.linked_subproject.do_update(
+                request, method=method, jobs=jobs
+            )
 
         # pull remote
         if not self.update_remote_branch():
@@ -721,11 +764,16 @@ class SubProject(models.Model, PercentMixin, URLMixin, PathMixin):
         self.commit_pending(request, skip_push=True)
 
         # update local branch
+        previous = self.repository.last_revision
         ret = self.update_branch(request, method=method)
 
-        # create translation objects for all files
+        # create translation objects for changed files
         try:
-            self.create_translations(request=request)
+            self.create_translations(
+                request=request,
+                jobs=jobs,
+                changed=self.get_changed_files(previous)
+            )
         except ParseError:
             ret = False
 
@@ -735,6 +783,22 @@ class SubProject(models.Model, PercentMixin, URLMixin, PathMixin):
 
         return ret
 
+    def get_changed_files(self, revision):
+        '''
+        Returns set of files changed since revision.
+
+        Returns None in case this can not be figured out and all files
+        should be checked.
+        '''
+        try:
+            changed = self.repository.get_changed_files(revision)
+        except RepositoryException as error:
+            self.log_error('failed to get changed files: %s', error)
+            return None
+        if changed is None:
+            return None
+        return set(changed)
+
     def push_if_needed(self, request, do_update=True, on_commit=True):
         """Wrapper to push if needed
 
@@ -838,6 +902,14 @@ class SubProject(models.Model, PercentMixin, URLMixin, PathMixin):
             with self.repository_lock:
                 self.repository.reset(self.branch)
 
+                # Discard edits not yet written to the files
+                PendingUnit.objects.filter(
+                    Q(unit__translation__subproject=self) |
+                    Q(unit__translation__subproject__repo=(
+                        self.get_repo_link_url()
+                    ))
+                ).delete()
+
             Change.objects.create(
                 action=Change.ACTION_RESET,
                 user=request.user if request else None,
@@ -1010,40 +1082,77 @@ class SubProject(models.Model, PercentMixin, URLMixin, PathMixin):
                 matches.discard(filename)
         return sorted(matches)
 
-    def create_translations(self, force=False, langs=None, request=None):
+    def create_translations(self, force=False, langs=None, request=None,
+                            jobs=1, changed=None):
         '''
         Loads translations from VCS.
+
+        With jobs bigger than one, the files are processed by pool of
+        processes. This is meant for management commands only, the pool is
+        not used inside transaction as the workers use own database
+        connections.
+
+        The changed can contain set of files changed in the repository,
+        in that case only translations for these files are checked.
         '''
         translations = set()
         languages = set()
+        resolver = Language.objects.get_resolver(refresh=True)
+        tasks = []
+        existing = self.get_unchanged_translations(force, changed)
         matches = self.get_mask_matches()
         language_re = re.compile(self.language_regex)
         for pos, path in enumerate(matches):
-            with transaction.atomic():
-                code = self.get_lang_code(path)
-                if langs is not None and code not in langs:
-                    self.log_info('skipping %s', path)
-                    continue
-                if not language_re.match(code):
-                    self.log_info('skipping language %s', code)
+            code = self.get_lang_code(path)
+            if langs is not None and code not in langs:
+                self.log_info('skipping %s', path)
+                continue
+            if not language_re.match(code):
+                self.log_info('skipping language %s', code)
+                continue
+
+            if path in existing:
+                translation_id, language_code = existing[path]
+                if (language_code not in languages and
+                        self.repository.resolve_symlinks(path) not in changed):
+                    self.log_info('skipping unchanged %s', path)
+                    translations.add(translation_id)
+                    languages.add(language_code)
                     continue
 
-                self.log_info(
-                    'checking %s (%s) [%d/%d]',
-                    path,
-                    code,
-                    pos + 1,
-                    len(matches)
-                )
-                lang = Language.objects.auto_get_or_create(code=code)
-                if lang.code in languages:
-                    self.log_error('duplicate language found: %s', lang.code)
-                    continue
-                translation = Translation.objects.check_sync(
-                    self, lang, code, path, force, request=request
-                )
-                translations.add(translation.id)
-                languages.add(lang.code)
+            self.log_info(
+                'checking %s (%s) [%d/%d]',
+                path,
+                code,
+                pos + 1,
+                len(matches)
+            )
+            lang = resolver.auto_get_or_create(code)
+            if lang.code in languages:
+                self.log_error('duplicate language found: %s', lang.code)
+                continue
+            languages.add(lang.code)
+            tasks.append((self.pk, lang.pk, code, path, force))
+
+        if jobs > 1 and len(tasks) > 1 and not connection.in_atomic_block:
+            # Files must not change while being parsed
+            with self.repository_lock:
+                # Workers have to open own database connections
+                for db_connection in connections.all():
+                    db_connection.close()
+                # Do not let workers inherit pending index updates
+                INDEX_QUEUE.flush()
+                pool = multiprocessing.Pool(min(jobs, len(tasks)))
+                try:
+                    translations.update(
+                        pool.map(sync_translation_task, tasks, chunksize=1)
+                    )
+                finally:
+                    pool.close()
+                    pool.join()
+        else:
+            for task in tasks:
+                translations.add(sync_translation(task, self, request))
 
         # Delete possibly no longer existing translations
         if langs is None:
@@ -1062,10 +1171,35 @@ class SubProject(models.Model, PercentMixin, URLMixin, PathMixin):
                 'updating linked project %s',
                 subproject
             )
-            subproject.create_translations(force, langs, request=request)
+            subproject.create_translations(
+                force, langs, request=request, jobs=jobs, changed=changed
+            )
 
         self.log_info('updating completed')
 
+    def get_unchanged_translations(self, force, changed):
+        '''
+        Returns existing translations which might be skipped on update.
+
+        The returned dictionary maps filename to translation id and language
+        code. Everything has to be checked when the update is forced, changed
+        files are not known, template has changed or post update script can
+        modify the files.
+        '''
+        if force or changed is None or self.post_update_script:
+            return {}
+        if self.has_template():
+            template = self.repository.resolve_symlinks(self.template)
+            if template in changed:
+                return {}
+        return {
+            filename: (translation_id, language_code)
+            for filename, translation_id, language_code
+            in self.translation_set.values_list(
+                'filename', 'id', 'language__code'
+            )
+        }
+
     def get_lang_code(self, path):
         '''
         Parses language code from path.
@@ -1147,13 +1281,14 @@ class SubProject(models.Model, PercentMixin, URLMixin, PathMixin):
             raise ValidationError(_('The mask did not match any files!'))
         langs = set()
         translated_langs = set()
+        resolver = Language.objects.get_resolver(refresh=True)
         for match in matches:
             code = self.get_lang_code(match)
             if not code:
                 raise ValidationError(_(
                     'Got empty language code for %s, please check filemask!'
                 ) % match)
-            lang = Language.objects.auto_get_or_create(code=code)
+            lang = resolver.auto_get_or_create(code)
             if code in langs:
                 raise ValidationError(_(
                     'There are more files for single language, please '
@@ -1407,7 +1542,7 @@ class SubProject(models.Model, PercentMixin, URLMixin, PathMixin):
         '''
         Returns percentages of translation status.
         '''
-        return self.translation_set.get_percents()
+        return StatsRollup.objects.get_percents(subproject=self)
 
     def repo_needs_commit(self):
         '''
@@ -1458,7 +1593,7 @@ class SubProject(models.Model, PercentMixin, URLMixin, PathMixin):
         '''
         Loads translate-toolkit store for template.
         '''
-        return self.file_format_cls.load(
+        return self.file_format_cls.load_template(
             self.get_template_filename(),
         )
 
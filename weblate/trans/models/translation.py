@@ -18,9 +18,10 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
-from django.db import models
+from django.db import models, transaction
+from django.db.utils import IntegrityError
 from django.contrib.auth.models import User
-from django.db.models import Q, Sum, Count
+from django.db.models import Q, Sum, Count, F
 from django.utils.translation import ugettext as _
 from django.utils.safestring import mark_safe
 from django.core.exceptions import ValidationError
@@ -29,6 +30,7 @@ from django.utils import timezone
 from django.core.urlresolvers import reverse
 import os
 import codecs
+from collections import defaultdict
 from datetime import timedelta
 
 from weblate import appsettings
@@ -45,6 +47,25 @@ from weblate.trans.mixins import URLMixin, PercentMixin, LoggerMixin
 from weblate.trans.boolean_sum import BooleanSum
 from weblate.accounts.models import notify_new_string, get_author_name
 from weblate.trans.models.changes import Change
+from weblate.trans.models.source import Source
+from weblate.trans.models.pending import PendingUnit
+from weblate.trans.models.rollup import StatsRollup
+from weblate.trans.writebehind import WRITE_BEHIND_QUEUE
+
+# Unit fields updated when synchronizing with file
+SYNC_FIELDS = (
+    'position', 'location', 'flags', 'source', 'target', 'fuzzy',
+    'translated', 'comment', 'contentsum', 'previous_source', 'priority',
+    'num_words',
+)
+# Number of units loaded in one query when synchronizing with file
+SYNC_CHUNK = 1000
+# Statistics counters, see Unit.get_stats_values
+STATS_FIELDS = (
+    'total', 'total_words', 'translated', 'translated_words', 'fuzzy',
+    'fuzzy_words', 'failing_checks', 'failing_checks_words',
+    'have_suggestion', 'have_comment',
+)
 
 
 class TranslationManager(models.Manager):
@@ -61,6 +82,8 @@ class TranslationManager(models.Manager):
             subproject=subproject,
             defaults={'filename': path},
         )
+        # Share repository object (and its cached tree) with the component
+        translation.subproject = subproject
         if translation.filename != path:
             force = True
             translation.filename = path
@@ -315,7 +338,7 @@ class Translation(models.Model, URLMixin, PercentMixin, LoggerMixin):
         # Clean timestamp on unlock
         if user is None:
             self.lock_time = timezone.now()
-            self.save()
+            self.save(update_fields=['lock_user', 'lock_time'])
             return
 
         self.update_lock_time(explicit, is_new)
@@ -334,9 +357,9 @@ class Translation(models.Model, URLMixin, PercentMixin, LoggerMixin):
         if is_new or new_lock_time > self.lock_time:
             self.lock_time = new_lock_time
 
-        self.save()
+        self.save(update_fields=['lock_user', 'lock_time'])
 
-    def update_lock(self, request):
+    def update_lock(self, user):
         '''
         Updates lock timestamp.
         '''
@@ -347,7 +370,7 @@ class Translation(models.Model, URLMixin, PercentMixin, LoggerMixin):
 
         # Auto lock if we should
         if appsettings.AUTO_LOCK:
-            self.create_lock(request.user)
+            self.create_lock(user)
             return
 
     def get_non_translated(self):
@@ -474,21 +497,105 @@ class Translation(models.Model, URLMixin, PercentMixin, LoggerMixin):
             reason,
         )
 
-        # List of created units (used for cleanup and duplicates detection)
-        created_units = set()
+        # Synchronize units with the file
+        stale_units, was_new = self.sync_units(user)
+
+        # Delete units no longer present in the file
+        Unit.objects.delete_stale(self, stale_units)
+
+        # Update revision and stats
+        self.update_stats()
+
+        # Cleanup checks cache if there were some deleted units
+        if stale_units:
+            self.invalidate_cache()
+
+        # Store change entry
+        Change.objects.create(
+            translation=self,
+            action=change,
+            user=user,
+            author=user
+        )
+
+        # Notify subscribed users
+        if was_new:
+            notify_new_string(self)
 
+    def sync_units(self, user):
+        '''
+        Updates units in database to match the translation file.
+
+        Existing units and source strings are loaded at once, the changes
+        are written in bulk and checks are run in batch for changed units
+        afterwards. Returns tuple of list of units no longer present in the
+        file and whether there is new string to translate.
+        '''
+        # Load existing units
+        existing = {}
+        inconsistent = set()
+        for dbunit in self.unit_set.all():
+            if dbunit.checksum in existing:
+                inconsistent.add(dbunit.checksum)
+            # Share translation object to avoid loading it for every unit
+            dbunit.translation = self
+            existing[dbunit.checksum] = dbunit
+        if inconsistent:
+            # Some inconsistency (possibly race condition), try to recover
+            self.unit_set.filter(checksum__in=inconsistent).delete()
+            for checksum in inconsistent:
+                del existing[checksum]
+
+        # Load tracked source strings
+        sources = dict([
+            (source.checksum, source)
+            for source in Source.objects.filter(subproject=self.subproject)
+        ])
+
+        # Units found in the file, changed units, units with new source
+        # strings and duplicate strings
+        found = {}
+        changed = []
+        new_sources = []
+        duplicates = set()
+        moved = defaultdict(list)
         # Was there change?
         was_new = False
         # Position of current unit
-        pos = 1
+        pos = 0
 
         for unit in self.store.all_units():
             if not unit.is_translatable():
                 continue
 
-            newunit, is_new = Unit.objects.update_from_unit(
-                self, unit, pos
-            )
+            # Update position
+            pos += 1
+
+            checksum = unit.get_checksum()
+
+            # Check for possible duplicate units
+            if checksum in found:
+                duplicates.add(checksum)
+                continue
+
+            is_new = checksum not in existing
+            if is_new:
+                newunit = Unit(
+                    translation=self,
+                    checksum=checksum,
+                    source=unit.get_source(),
+                    context=unit.get_context(),
+                )
+            else:
+                newunit = existing[checksum]
+            found[checksum] = newunit
+
+            result = newunit.apply_unit(unit, pos, is_new)
+
+            if result is None and newunit.position != pos:
+                # Only moved, store offset to update position in bulk
+                moved[pos - newunit.position].append(newunit.pk)
+                newunit.position = pos
 
             # Check if unit is new and untranslated
             was_new = (
@@ -501,61 +608,132 @@ class Translation(models.Model, URLMixin, PercentMixin, LoggerMixin):
                 (newunit.fuzzy and newunit.fuzzy != newunit.old_fuzzy)
             )
 
-            # Update position
-            pos += 1
+            if result is None:
+                continue
 
-            # Check for possible duplicate units
-            if newunit.id in created_units:
-                self.log_error(
-                    'duplicate string to translate: %s (%s)',
-                    newunit,
-                    repr(newunit.source)
-                )
-                Change.objects.create(
-                    unit=newunit,
-                    translation=self,
-                    action=Change.ACTION_DUPLICATE_STRING,
-                    user=user,
-                    author=user
+            # Ensure we track source string
+            if checksum not in sources:
+                sources[checksum] = Source(
+                    checksum=checksum,
+                    subproject=self.subproject,
                 )
+                new_sources.append(newunit)
+            newunit.priority = sources[checksum].priority
 
-            # Store current unit ID
-            created_units.add(newunit.id)
+            changed.append((newunit, is_new) + result)
 
-        # Following query can get huge, so we should find better way
-        # to delete stale units, probably sort of garbage collection
+        self.save_units(
+            changed,
+            [sources[unit.checksum] for unit in new_sources]
+        )
+        self.move_units(moved)
+
+        # Create change objects for new source strings
+        Change.objects.bulk_create([
+            Change(
+                translation=self,
+                subproject=self.subproject,
+                action=Change.ACTION_NEW_SOURCE,
+                unit=unit,
+            )
+            for unit in new_sources
+        ])
 
-        # We should also do cleanup on source strings tracking objects
+        for checksum in duplicates:
+            newunit = found[checksum]
+            self.log_error(
+                'duplicate string to translate: %s (%s)',
+                newunit,
+                repr(newunit.source)
+            )
+            Change.objects.create(
+                unit=newunit,
+                translation=self,
+                action=Change.ACTION_DUPLICATE_STRING,
+                user=user,
+                author=user
+            )
 
-        # Get lists of stale units to delete
-        units_to_delete = self.unit_set.exclude(
-            id__in=created_units
-        )
-        # We need to resolve this now as otherwise list will become empty after
-        # delete
-        deleted_units = units_to_delete.count()
+        # Update checks in batch, it also updates failing check flags
+        Unit.objects.update_checks(self, [
+            (item, state, created)
+            for item, created, content, state, sums in changed
+            if not content or not state or sums
+        ])
 
-        # Actually delete units
-        units_to_delete.delete()
+        # Update flags and index
+        for unit, is_new, same_content, same_state, sum_changed in changed:
+            unit.update_saved(same_content, same_state, is_new, checks=False)
+            if sum_changed:
+                unit.update_has_comment(update_stats=False)
+                unit.update_has_suggestion(update_stats=False)
 
-        # Update revision and stats
-        self.update_stats()
+        stale = [
+            unit for checksum, unit in existing.items()
+            if checksum not in found
+        ]
+        return stale, was_new
 
-        # Cleanup checks cache if there were some deleted units
-        if deleted_units:
-            self.invalidate_cache()
+    def save_units(self, changed, sources):
+        '''
+        Writes changed units and new source strings to the database.
+        '''
+        created = []
+        for unit, is_new, same_content, same_state, dummy in changed:
+            if not same_content or not unit.num_words:
+                unit.update_num_words()
+            if is_new:
+                created.append(unit)
+            else:
+                Unit.objects.filter(pk=unit.pk).update(
+                    **dict([
+                        (field, getattr(unit, field))
+                        for field in SYNC_FIELDS
+                    ])
+                )
 
-        # Store change entry
-        Change.objects.create(
-            translation=self,
-            action=change,
-            user=user,
-            author=user
-        )
+        try:
+            with transaction.atomic():
+                Source.objects.bulk_create(sources)
+        except IntegrityError:
+            # Some of them were created meanwhile by other process
+            for source in sources:
+                Source.objects.get_or_create(
+                    checksum=source.checksum,
+                    subproject=source.subproject,
+                )
 
-        # Notify subscribed users
-        if was_new:
-            notify_new_string(self)
+        if not created:
+            return
+
+        Unit.objects.bulk_create(created)
+
+        # Fetch primary keys of created units
+        created = dict([(unit.checksum, unit) for unit in created])
+        checksums = list(created.keys())
+        for start in range(0, len(checksums), SYNC_CHUNK):
+            units = self.unit_set.filter(
+                checksum__in=checksums[start:start + SYNC_CHUNK]
+            ).values_list(
+                'checksum', 'pk'
+            )
+            for checksum, pk in units:
+                created[checksum].pk = pk
+
+    def move_units(self, moved):
+        '''
+        Updates position of units which were only moved in the file.
+
+        The moved units are grouped by offset, so inserting or removing
+        string updates all following units in single query for each chunk.
+        '''
+        for offset, ids in moved.items():
+            for start in range(0, len(ids), SYNC_CHUNK):
+                self.unit_set.filter(
+                    pk__in=ids[start:start + SYNC_CHUNK]
+                ).update(
+                    position=F('position') + offset
+                )
 
     @property
     def repository(self):
@@ -594,6 +772,39 @@ class Translation(models.Model, URLMixin, PercentMixin, LoggerMixin):
         '''
         Updates translation statistics.
         '''
+        self.reload_stats()
+        old = self.get_stats_values()
+        self.count_stats()
+
+        # Save stats together with current hash
+        self.revision = self.get_git_blob_hash()
+        self.save()
+        self.update_rollups(old, self.get_stats_values())
+
+    def reconcile_stats(self):
+        '''
+        Recounts statistics from units, correcting possible drift of
+        counters updated by deltas. Returns whether there was a drift.
+        '''
+        with transaction.atomic():
+            # Lock the translation, so that no delta is lost
+            Translation.objects.select_for_update().filter(
+                pk=self.pk
+            ).exists()
+            self.reload_stats()
+            old = self.get_stats_values()
+            self.count_stats()
+            new = self.get_stats_values()
+            if old == new:
+                return False
+            self.save(update_fields=STATS_FIELDS)
+            self.update_rollups(old, new)
+        return True
+
+    def count_stats(self):
+        '''
+        Counts statistics from units without saving them.
+        '''
         # Grab stats
         stats = self.unit_set.aggregate(
             Sum('num_words'),
@@ -653,8 +864,50 @@ class Translation(models.Model, URLMixin, PercentMixin, LoggerMixin):
         if self.failing_checks_words is None:
             self.failing_checks_words = 0
 
-        # Store hash will save object
-        self.store_hash()
+    def update_stats_delta(self, old, new):
+        '''
+        Updates statistics by difference of unit counters.
+
+        The old and new values are as returned by Unit.get_stats_values,
+        the counters are changed atomically in the database.
+        '''
+        delta = dict(
+            (key, new[key] - old[key]) for key in new if new[key] != old[key]
+        )
+        if not delta:
+            return
+
+        Translation.objects.filter(pk=self.pk).update(
+            **dict((key, F(key) + value) for key, value in delta.items())
+        )
+        for key, value in delta.items():
+            setattr(self, key, getattr(self, key) + value)
+        StatsRollup.objects.add_delta(self, delta)
+
+    def update_rollups(self, old, new):
+        '''
+        Updates project, component and language rollups by difference
+        of translation counters.
+        '''
+        StatsRollup.objects.add_delta(self, dict(
+            (key, new[key] - old[key]) for key in new if new[key] != old[key]
+        ))
+
+    def get_stats_values(self):
+        '''
+        Returns current statistics counters.
+        '''
+        return dict((key, getattr(self, key)) for key in STATS_FIELDS)
+
+    def reload_stats(self):
+        '''
+        Loads current statistics from the database.
+        '''
+        stats = Translation.objects.filter(pk=self.pk).values(
+            *STATS_FIELDS
+        )[0]
+        for key, value in stats.items():
+            setattr(self, key, value)
 
     def store_hash(self):
         '''
@@ -662,7 +915,7 @@ class Translation(models.Model, URLMixin, PercentMixin, LoggerMixin):
         '''
         blob_hash = self.get_git_blob_hash()
         self.revision = blob_hash
-        self.save()
+        self.save(update_fields=['revision'])
 
     def get_last_author(self, email=False):
         '''
@@ -703,6 +956,9 @@ class Translation(models.Model, URLMixin, PercentMixin, LoggerMixin):
         '''
         Commits any pending changes.
         '''
+        # Write edits delayed by write-behind mode
+        self.flush_pending(request)
+
         # Get author of last changes
         last = self.get_last_author(True)
 
@@ -735,7 +991,7 @@ class Translation(models.Model, URLMixin, PercentMixin, LoggerMixin):
         if self.commit_message:
             msg = '%s\n\n%s' % (msg, self.commit_message)
             self.commit_message = ''
-            self.save()
+            self.save(update_fields=['commit_message'])
 
         return msg
 
@@ -836,81 +1092,198 @@ class Translation(models.Model, URLMixin, PercentMixin, LoggerMixin):
         '''
         Updates backend file and unit.
         '''
+        return self.update_units([unit], request, user)[0]
+
+    def update_units(self, units, request, user=None):
+        '''
+        Updates backend file for several units, writing it only once.
+
+        With WRITE_BEHIND_DELAY set, the file is written later by
+        flush_pending and only the loaded store is updated.
+
+        Returns list of tuples of whether unit was changed and the store
+        unit.
+        '''
         if user is None:
             user = request.user
+        author = get_author_name(user)
+
+        if appsettings.WRITE_BEHIND_DELAY > 0:
+            # Loaded store is shared with flush_pending
+            with self.subproject.repository_lock:
+                result = [self.update_store_unit(unit) for unit in units]
+                for unit, (saved, pounit) in zip(units, result):
+                    if saved:
+                        PendingUnit.objects.update_or_create(
+                            unit=unit,
+                            defaults={
+                                'author': author,
+                                'timestamp': timezone.now(),
+                            }
+                        )
+            if any(saved for saved, pounit in result):
+                WRITE_BEHIND_QUEUE.schedule(self)
+            return result
+
         # Save with lock acquired
         with self.subproject.repository_lock:
+            result = [self.update_store_unit(unit) for unit in units]
+            if not any(saved for saved, pounit in result):
+                return result
+
+            # Update po file header
+            self.update_store_header(author, timezone.now())
+
+            # commit possible previous changes (by other author)
+            self.commit_pending(request, author)
+            # save translation changes
+            self.store.save()
+            # Store hash of written file, commit is possibly delayed
+            self.store_hash()
+            # commit VCS repo if needed
+            self.git_commit(request, author, timezone.now(), sync=True)
 
-            src = unit.get_source_plurals()[0]
-            add = False
+        return result
 
-            pounit, add = self.store.find_unit(unit.context, src)
+    def update_store_unit(self, unit):
+        '''
+        Updates unit in the loaded store.
 
-            # Bail out if we have not found anything
-            if pounit is None or pounit.is_obsolete():
-                return False, None
+        Returns tuple of whether unit was changed and the store unit.
+        '''
+        src = unit.get_source_plurals()[0]
+        add = False
 
-            # Check for changes
-            if ((not add or unit.target == '') and
-                    unit.target == pounit.get_target() and
-                    unit.fuzzy == pounit.is_fuzzy()):
-                return False, pounit
+        pounit, add = self.store.find_unit(unit.context, src)
 
-            # Store translations
-            if unit.is_plural():
-                pounit.set_target(unit.get_target_plurals())
-            else:
-                pounit.set_target(unit.target)
+        # Bail out if we have not found anything
+        if pounit is None or pounit.is_obsolete():
+            return False, None
 
-            # Update fuzzy flag
-            pounit.mark_fuzzy(unit.fuzzy)
+        # Check for changes
+        if ((not add or unit.target == '') and
+                unit.target == pounit.get_target() and
+                unit.fuzzy == pounit.is_fuzzy()):
+            return False, pounit
 
-            # Optionally add unit to translation file
-            if add:
-                self.store.add_unit(pounit)
+        # Store translations
+        if unit.is_plural():
+            pounit.set_target(unit.get_target_plurals())
+        else:
+            pounit.set_target(unit.target)
 
-            # We need to update backend now
-            author = get_author_name(user)
+        # Update fuzzy flag
+        pounit.mark_fuzzy(unit.fuzzy)
 
-            # Update po file header
-            now = timezone.now()
-            if not timezone.is_aware(now):
-                now = timezone.make_aware(now, timezone.utc)
-
-            # Prepare headers to update
-            headers = {
-                'add': True,
-                'last_translator': author,
-                'plural_forms': self.language.get_plural_form(),
-                'language': self.language_code,
-                'PO_Revision_Date': now.strftime('%Y-%m-%d %H:%M%z'),
-            }
+        # Optionally add unit to translation file
+        if add:
+            self.store.add_unit(pounit)
 
-            # Optionally store language team with link to website
-            if self.subproject.project.set_translation_team:
-                headers['language_team'] = '%s <%s>' % (
-                    self.language.name,
-                    get_site_url(self.get_absolute_url()),
-                )
+        return True, pounit
 
-            # Optionally store email for reporting bugs in source
-            report_source_bugs = self.subproject.report_source_bugs
-            if report_source_bugs != '':
-                headers['report_msgid_bugs_to'] = report_source_bugs
+    def update_store_header(self, author, timestamp):
+        '''
+        Updates headers of the loaded store for change by author.
+        '''
+        if not timezone.is_aware(timestamp):
+            timestamp = timezone.make_aware(timestamp, timezone.utc)
+
+        # Prepare headers to update
+        headers = {
+            'add': True,
+            'last_translator': author,
+            'plural_forms': self.language.get_plural_form(),
+            'language': self.language_code,
+            'PO_Revision_Date': timestamp.strftime('%Y-%m-%d %H:%M%z'),
+        }
 
-            # Update genric headers
-            self.store.update_header(
-                **headers
+        # Optionally store language team with link to website
+        if self.subproject.project.set_translation_team:
+            headers['language_team'] = '%s <%s>' % (
+                self.language.name,
+                get_site_url(self.get_absolute_url()),
             )
 
-            # commit possible previous changes (by other author)
-            self.commit_pending(request, author)
-            # save translation changes
-            self.store.save()
+        # Optionally store email for reporting bugs in source
+        report_source_bugs = self.subproject.report_source_bugs
+        if report_source_bugs != '':
+            headers['report_msgid_bugs_to'] = report_source_bugs
+
+        # Update genric headers
+        self.store.update_header(
+            **headers
+        )
+
+    def flush_pending(self, request=None):
+        '''
+        Writes edits pending in write-behind mode to the file.
+
+        All edits are applied to the store at once and the file is written
+        once for every author, changes by different authors are committed
+        separately. Returns number of written edits.
+        '''
+        # Pending edits are read with lock held, so that concurrent flush
+        # does not write them again
+        with self.subproject.repository_lock:
+            pending = list(PendingUnit.objects.filter(
+                unit__translation=self
+            ).select_related(
+                'unit'
+            ).order_by(
+                'timestamp'
+            ))
+            if not pending:
+                return 0
+
+            # Group consecutive edits by author
+            runs = []
+            for item in pending:
+                item.unit.translation = self
+                if runs and runs[-1][0] == item.author:
+                    runs[-1][1].append(item)
+                else:
+                    runs.append((item.author, [item]))
+
+            # Author of uncommitted changes already written to the file
+            author = None
+            timestamp = None
+            previous = self.change_set.content().filter(
+                timestamp__lt=pending[0].timestamp
+            ).select_related(
+                'author'
+            )[:1]
+            if previous:
+                author = get_author_name(previous[0].author, True)
+                timestamp = previous[0].timestamp
+
+            for run_author, items in runs:
+                # Commit changes by previous author
+                if author is not None and author != run_author:
+                    self.git_commit(
+                        request, author, timestamp, True, True, True
+                    )
+
+                for item in items:
+                    self.update_store_unit(item.unit)
+                author = run_author
+                timestamp = items[-1].timestamp
+                self.update_store_header(author, timestamp)
+                self.store.save()
+            # Store hash of written file, commit is possibly delayed
+            self.store_hash()
+
+            # Edits done meanwhile are newer
+            PendingUnit.objects.filter(
+                pk__in=[item.pk for item in pending],
+                timestamp__lte=pending[-1].timestamp,
+            ).delete()
+
+            WRITE_BEHIND_QUEUE.flushed(len(pending))
+
             # commit VCS repo if needed
             self.git_commit(request, author, timezone.now(), sync=True)
 
-        return True, pounit
+        return len(pending)
 
     def get_source_checks(self):
         '''
@@ -1154,9 +1527,9 @@ class Translation(models.Model, URLMixin, PercentMixin, LoggerMixin):
             if dbunit.target != unit.get_target():
                 Suggestion.objects.add(dbunit, unit.get_target(), request)
 
-        # Update suggestion count
+        # Suggestion counts were updated with suggestions
         if ret:
-            self.update_stats()
+            self.reload_stats()
 
         return ret
 
@@ -18,23 +18,30 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
+from collections import defaultdict
 from django.db import models
 from weblate import appsettings
 from django.db.models import Q
+from django.db.models.sql import DeleteQuery
 from django.utils.translation import ugettext as _
 from django.contrib import messages
 from django.core.cache import cache
 import traceback
-import multiprocessing
 from weblate.trans.checks import CHECKS
 from weblate.trans.models.source import Source
 from weblate.trans.models.unitdata import Check, Comment, Suggestion
 from weblate.trans.models.changes import Change
-from weblate.trans.search import update_index_unit, fulltext_search, more_like
+from weblate.trans.search import (
+    update_index_unit, fulltext_search, fulltext_search_ranked,
+    fulltext_filter, fulltext_count,
+)
+from weblate.trans.similar import SIMILAR_POOL
+from weblate.trans.memory import update_memory_unit
 from weblate.accounts.models import (
     notify_new_contributor, notify_new_translation
 )
 from weblate.trans.filelock import FileLockException
+from weblate.trans.propagation import Propagation, PROPAGATION_RUNNER
 from weblate.trans.mixins import LoggerMixin
 from weblate.trans.util import (
     is_plural, split_plural, join_plural, get_distinct_translations,
@@ -52,54 +59,114 @@ SIMPLE_FILTERS = {
 
 SEARCH_FILTERS = ('source', 'target', 'context', 'location', 'comment')
 
+CHECKS_CHUNK = 500
+
 
-def more_like_queue(checksum, source, top, queue):
+class RankedUnits(object):
     """
-    Multiprocess wrapper around more_like.
+    Units matching fulltext search ordered by relevance.
+
+    Behaves like a read only queryset. The search is restricted to the
+    units, matching checksums are fetched from the index in growing chunks
+    and only units within requested slice are loaded. Counting is done by
+    the fulltext backend and does not rank the matches at all.
     """
-    result = more_like(checksum, source, top)
-    queue.put(result)
+    chunk = 1000
 
+    def __init__(self, units, query, lang, params):
+        self.units = units
+        self.query = query
+        self.lang = lang
+        self.params = params
+        self._count = None
 
-class UnitManager(models.Manager):
-    # pylint: disable=W0232
+    def _clone(self, units):
+        return RankedUnits(units, self.query, self.lang, self.params)
+
+    def filter(self, *args, **kwargs):
+        return self._clone(self.units.filter(*args, **kwargs))
+
+    def exclude(self, *args, **kwargs):
+        return self._clone(self.units.exclude(*args, **kwargs))
+
+    def select_related(self, *args):
+        return self._clone(self.units.select_related(*args))
 
-    def update_from_unit(self, translation, unit, pos):
+    def get_keys(self, checksums):
         """
-        Process translation toolkit unit and stores/updates database entry.
+        Returns primary keys of units for given checksums in the ranking
+        order.
         """
-        # Get basic unit data
-        src = unit.get_source()
-        ctx = unit.get_context()
-        checksum = unit.get_checksum()
-        created = False
+        ranking = dict([
+            (checksum, pos) for pos, checksum in enumerate(checksums)
+        ])
+        return [
+            pk for checksum, pk in sorted(
+                self.units.filter(
+                    checksum__in=checksums
+                ).values_list('checksum', 'pk'),
+                key=lambda item: (ranking[item[0]], item[1])
+            )
+        ]
 
-        # Try getting existing unit
-        created = False
-        try:
-            dbunit = translation.unit_set.get(checksum=checksum)
-        except Unit.MultipleObjectsReturned:
-            # Some inconsistency (possibly race condition), try to recover
-            translation.unit_set.filter(checksum=checksum).delete()
-            dbunit = None
-        except Unit.DoesNotExist:
-            dbunit = None
-
-        # Create unit if it does not exist
-        if dbunit is None:
-            dbunit = Unit(
-                translation=translation,
-                checksum=checksum,
-                source=src,
-                context=ctx
+    def get_units(self, keys):
+        """
+        Returns units with given primary keys in same order.
+        """
+        units = dict([
+            (unit.pk, unit) for unit in self.units.filter(pk__in=keys)
+        ])
+        return [units[pk] for pk in keys if pk in units]
+
+    def count(self):
+        """
+        Returns number of matching units.
+        """
+        if self._count is None:
+            self._count = fulltext_count(
+                self.units, self.query, self.lang, self.params
+            )
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __iter__(self):
+        return iter(self[0:None])
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            try:
+                return self[key:key + 1][0]
+            except IndexError:
+                raise IndexError('Unit index out of range')
+
+        start = key.start or 0
+        stop = key.stop
+        if stop is None:
+            limit = self.chunk
+        else:
+            limit = max(stop, 1)
+
+        result = []
+        offset = 0
+        while True:
+            checksums = fulltext_search_ranked(
+                self.query, self.lang, self.params, offset, limit, self.units
             )
-            created = True
+            result.extend(self.get_keys(checksums))
+            offset += limit
+            if len(checksums) < limit:
+                break
+            if stop is not None and len(result) >= stop:
+                break
+            limit *= 2
 
-        # Update all details
-        dbunit.update_from_unit(unit, pos, created)
+        return self.get_units(result[start:stop])
 
-        # Return result
-        return dbunit, created
+
+class UnitManager(models.Manager):
+    # pylint: disable=W0232
 
     def filter_checks(self, rqtype, translation, ignored=False):
         """
@@ -199,9 +266,12 @@ class UnitManager(models.Manager):
         ).exclude(user=user)
         return self.filter(id__in=changes.values_list('unit__id', flat=True))
 
-    def search(self, translation, params):
+    def search(self, translation, params, ranked=False):
         """
         High level wrapper for searching.
+
+        With ranked, fulltext search returns units ordered by relevance
+        in a lazily evaluated RankedUnits object.
         """
         base = self.all()
         if params['type'] != 'all':
@@ -238,13 +308,9 @@ class UnitManager(models.Manager):
             return base.filter(query)
         else:
             lang = self.all()[0].translation.language.code
-            return base.filter(
-                checksum__in=fulltext_search(
-                    params['q'],
-                    lang,
-                    params
-                )
-            )
+            if ranked:
+                return RankedUnits(base, params['q'], lang, params)
+            return fulltext_filter(base, params['q'], lang, params)
 
     def same_source(self, unit):
         """
@@ -266,41 +332,17 @@ class UnitManager(models.Manager):
 
     def more_like_this(self, unit, top=5):
         """
-        Finds closely similar units.
+        Finds closely similar units, returns list of units and their
+        similarity scores.
         """
-        if appsettings.MT_WEBLATE_LIMIT >= 0:
-            queue = multiprocessing.Queue()
-            proc = multiprocessing.Process(
-                target=more_like_queue,
-                args=(unit.checksum, unit.source, top, queue)
-            )
-            proc.start()
-            proc.join(appsettings.MT_WEBLATE_LIMIT)
-            if proc.is_alive():
-                proc.terminate()
-
-            if queue.empty():
-                raise Exception('Request timed out.')
+        matches = SIMILAR_POOL.lookup(unit, top)
+        units = self.select_related(
+            'translation__subproject'
+        ).in_bulk([pk for pk, score in matches])
 
-            more_results = queue.get()
-        else:
-            more_results = more_like(unit.checksum, unit.source, top)
-
-        same_results = fulltext_search(
-            unit.get_source_plurals()[0],
-            unit.translation.language.code,
-            {'source': True}
-        )
-
-        checksums = more_results - same_results
-
-        return self.filter(
-            checksum__in=checksums,
-            translation__language=unit.translation.language,
-            translated=True
-        ).exclude(
-            pk=unit.id
-        )
+        return [
+            (units[pk], score) for pk, score in matches if pk in units
+        ]
 
     def same(self, unit):
         """
@@ -315,6 +357,321 @@ class UnitManager(models.Manager):
             pk=unit.id
         )
 
+    def update_checks(self, translation, units):
+        """
+        Updates checks for many units of single translation at once.
+
+        The units are list of tuples of unit, whether its state stayed same
+        and whether it is new. Existing checks are loaded, created and
+        deleted in bulk and failing check flags of all units sharing source
+        strings are updated afterwards. Returns whether any check has
+        changed.
+        """
+        was_change = False
+        translations = set()
+        for start in range(0, len(units), CHECKS_CHUNK):
+            chunk_change, chunk_translations = self._update_checks_chunk(
+                translation, units[start:start + CHECKS_CHUNK]
+            )
+            was_change |= chunk_change
+            translations.update(chunk_translations)
+
+        # Update stats of translations with changed flags
+        from weblate.trans.models.translation import Translation
+        for changed in Translation.objects.filter(pk__in=translations):
+            changed.update_stats()
+
+        if was_change:
+            translation.invalidate_cache()
+        return was_change
+
+    def _update_checks_chunk(self, translation, units):
+        """
+        Updates checks for single chunk of units.
+
+        Returns whether any check has changed and ids of translations with
+        changed failing check flags.
+        """
+        project = translation.subproject.project
+        language = translation.language
+        contentsums = set([unit.contentsum for unit, dummy, dummy in units])
+
+        # Load existing target and source checks
+        old_checks = defaultdict(set)
+        ignored = set()
+        checks = Check.objects.filter(
+            project=project,
+            contentsum__in=contentsums,
+        ).filter(
+            Q(language=language) | Q(language=None)
+        ).values_list('contentsum', 'language', 'check', 'ignore')
+        for contentsum, language_id, check, ignore in checks:
+            old_checks[(contentsum, language_id is None)].add(check)
+            if ignore and language_id is not None:
+                ignored.add((contentsum, check))
+
+        # Load translated units with same source for untranslated ones
+        untranslated = set([
+            unit.contentsum for unit, same_state, is_new in units
+            if (not same_state or is_new) and not unit.translated
+        ])
+        same_source = defaultdict(set)
+        if untranslated:
+            translated = self.filter(
+                translation__language=language,
+                translation__subproject__project=project,
+                contentsum__in=untranslated,
+                translated=True,
+            ).exclude(
+                translation__subproject__allow_translation_propagation=False,
+            ).values_list('contentsum', 'id')
+            for contentsum, unit_id in translated:
+                same_source[contentsum].add(unit_id)
+
+        # Run target checks, tracking resulting state in memory
+        new_checks = defaultdict(set)
+        for key, value in old_checks.items():
+            new_checks[key] = set(value)
+        cleanups = []
+        for unit, same_state, is_new in units:
+            target = new_checks[(unit.contentsum, False)]
+            checks_to_run = CHECKS
+            cleanup = True
+
+            if (not same_state or is_new) and not unit.translated:
+                # Same logic as in Unit.get_checks_to_run
+                checks_to_run = {}
+                if not same_source[unit.contentsum] - set([unit.id]):
+                    target.clear()
+                elif 'inconsistent' in CHECKS:
+                    checks_to_run['inconsistent'] = CHECKS['inconsistent']
+                cleanup = False
+
+            src = unit.get_source_plurals()
+            tgt = unit.get_target_plurals()
+            failing = set([
+                check for check in checks_to_run
+                if CHECKS[check].target and
+                CHECKS[check].check_target(src, tgt, unit)
+            ])
+            if cleanup:
+                target.intersection_update(failing)
+            target.update(failing)
+            cleanups.append(cleanup)
+
+        # Source checks can depend on target checks, write these first
+        was_change = self._write_checks(
+            project, language, old_checks, new_checks, False
+        )
+
+        # Run source checks
+        for (unit, dummy, dummy), cleanup in zip(units, cleanups):
+            source = new_checks[(unit.contentsum, True)]
+            src = unit.get_source_plurals()
+            failing = set([
+                check for check in CHECKS
+                if CHECKS[check].source and
+                CHECKS[check].check_source(src, unit)
+            ])
+            if cleanup:
+                source.intersection_update(failing)
+            source.update(failing)
+
+        was_change |= self._write_checks(
+            project, language, old_checks, new_checks, True
+        )
+
+        # Update failing check flags of all units with these sources,
+        # bulk_create does not trigger update_failed_check_flag
+        translations = self.update_failing_check_flags(
+            project, language, contentsums
+        )
+
+        # Keep loaded units in sync with the database
+        for unit, dummy, dummy in units:
+            unit.has_failing_check = unit.translated and any([
+                (unit.contentsum, check) not in ignored
+                for check in new_checks[(unit.contentsum, False)]
+            ])
+
+        return was_change, translations
+
+    def _write_checks(self, project, language, old_checks, new_checks,
+                      is_source):
+        """
+        Creates and deletes checks in bulk to match new state.
+        """
+        if is_source:
+            language = None
+        create = []
+        delete = defaultdict(list)
+        for key, checks in new_checks.items():
+            contentsum, source = key
+            if source != is_source:
+                continue
+            old = old_checks.get(key, set())
+            for check in checks - old:
+                create.append(Check(
+                    contentsum=contentsum,
+                    project=project,
+                    language=language,
+                    ignore=False,
+                    check=check,
+                ))
+            for check in old - checks:
+                delete[check].append(contentsum)
+
+        Check.objects.bulk_create(create)
+        for check, contentsums in delete.items():
+            Check.objects.filter(
+                project=project,
+                language=language,
+                check=check,
+                contentsum__in=contentsums,
+            ).delete()
+
+        return len(create) > 0 or len(delete) > 0
+
+    def delete_stale(self, translation, units):
+        """
+        Deletes stale units of translation.
+
+        The units are deleted in chunks by their ids together with rows
+        referencing them and checks, suggestions, comments and source
+        strings which are no longer used by any unit.
+        """
+        from weblate.trans.models.search import IndexUpdate, SimilarityBand
+        from weblate.trans.models.pending import PendingUnit
+        project = translation.subproject.project
+        language = translation.language
+        for start in range(0, len(units), CHECKS_CHUNK):
+            chunk = units[start:start + CHECKS_CHUNK]
+            ids = [unit.pk for unit in chunk]
+
+            # Delete referencing rows, deleting units directly does not
+            # cascade and does not send signals for every unit
+            Change.objects.filter(unit__in=ids).delete()
+            IndexUpdate.objects.filter(unit__in=ids).delete()
+            SimilarityBand.objects.filter(unit__in=ids).delete()
+            PendingUnit.objects.filter(unit__in=ids).delete()
+            DeleteQuery(self.model).delete_batch(ids, self.db)
+
+            self.cleanup_related(
+                project,
+                language,
+                set([unit.contentsum for unit in chunk]),
+            )
+
+            # Delete source strings no longer used in the component
+            checksums = set([unit.checksum for unit in chunk])
+            checksums -= set(self.filter(
+                translation__subproject=translation.subproject,
+                checksum__in=checksums,
+            ).values_list('checksum', flat=True))
+            if checksums:
+                Source.objects.filter(
+                    subproject=translation.subproject,
+                    checksum__in=checksums,
+                ).delete()
+
+    def cleanup_related(self, project, language, contentsums):
+        """
+        Removes checks, suggestions and comments for source strings no
+        longer present in the project and language.
+
+        Checks of remaining units with these source strings are updated, as
+        some of them (eg. consistency) depend on the removed units.
+        """
+        remaining = self.filter(
+            translation__language=language,
+            translation__subproject__project=project,
+            contentsum__in=contentsums,
+        ).select_related(
+            'translation__subproject__project',
+            'translation__language',
+        )
+        translations = {}
+        units = defaultdict(list)
+        for unit in remaining:
+            translations[unit.translation_id] = unit.translation
+            units[unit.translation_id].append((unit, True, False))
+        for translation_id, translation_units in units.items():
+            self.update_checks(
+                translations[translation_id], translation_units
+            )
+
+        contentsums = set(contentsums) - set([
+            unit.contentsum
+            for translation_units in units.values()
+            for unit, dummy, dummy in translation_units
+        ])
+        if not contentsums:
+            return
+
+        # Last units referencing to these checks
+        for model in (Check, Suggestion, Comment):
+            model.objects.filter(
+                project=project,
+                language=language,
+                contentsum__in=contentsums,
+            ).delete()
+
+        # Delete source comments and checks if this was last reference
+        contentsums -= set(self.filter(
+            translation__subproject__project=project,
+            contentsum__in=contentsums,
+        ).values_list('contentsum', flat=True))
+        if not contentsums:
+            return
+        for model in (Check, Comment):
+            model.objects.filter(
+                project=project,
+                language=None,
+                contentsum__in=contentsums,
+            ).delete()
+
+    def update_failing_check_flags(self, project, language, contentsums):
+        """
+        Updates failing check flags for units with given source strings in
+        single query for either state.
+
+        Returns set of ids of translations with changed units.
+        """
+        units = self.filter(
+            translation__subproject__project=project,
+            translation__language=language,
+            contentsum__in=contentsums,
+        )
+        failing = Check.objects.filter(
+            project=project,
+            language=language,
+            contentsum__in=contentsums,
+            ignore=False,
+        ).values_list('contentsum', flat=True)
+        failing = set(failing)
+        to_set = units.filter(
+            translated=True,
+            contentsum__in=failing,
+            has_failing_check=False,
+        )
+        to_clear = units.filter(
+            has_failing_check=True,
+        ).exclude(
+            translated=True,
+            contentsum__in=failing,
+        )
+
+        translations = set(
+            to_set.values_list('translation', flat=True)
+        ) | set(
+            to_clear.values_list('translation', flat=True)
+        )
+        if translations:
+            to_set.update(has_failing_check=True)
+            to_clear.update(has_failing_check=False)
+
+        return translations
+
 
 class Unit(models.Model, LoggerMixin):
     translation = models.ForeignKey('Translation')
@@ -359,6 +716,7 @@ class Unit(models.Model, LoggerMixin):
         self._suggestions = None
         self.old_translated = self.translated
         self.old_fuzzy = self.fuzzy
+        self.old_stats = self.get_stats_values()
 
     def has_acl(self, user):
         """
@@ -393,9 +751,13 @@ class Unit(models.Model, LoggerMixin):
             self.translation.get_translate_url(), self.checksum
         )
 
-    def update_from_unit(self, unit, pos, created):
+    def apply_unit(self, unit, pos, created):
         """
-        Updates Unit from ttkit unit.
+        Stores attributes of ttkit unit without saving.
+
+        Returns None if there was no change, otherwise tuple of same_content,
+        same_state and whether contentsum has changed. Position is not
+        updated if it is the only change, it is up to caller to store it.
         """
         # Store current values for use in Translation.check_sync
         self.old_fuzzy = self.fuzzy
@@ -445,16 +807,10 @@ class Unit(models.Model, LoggerMixin):
                 same_content and same_state and
                 translated == self.translated and
                 comment == self.comment and
-                pos == self.position and
                 contentsum == self.contentsum and
                 previous_source == self.previous_source):
-            return
+            return None
 
-        # Ensure we track source string
-        source_info, source_created = Source.objects.get_or_create(
-            checksum=self.checksum,
-            subproject=self.translation.subproject
-        )
         contentsum_changed = self.contentsum != contentsum
 
         # Store updated values
@@ -468,25 +824,16 @@ class Unit(models.Model, LoggerMixin):
         self.comment = comment
         self.contentsum = contentsum
         self.previous_source = previous_source
-        self.priority = source_info.priority
-        self.save(
-            force_insert=created,
-            backend=True,
-            same_content=same_content,
-            same_state=same_state
-        )
 
-        # Create change object for new source string
-        if source_created:
-            Change.objects.create(
-                translation=self.translation,
-                action=Change.ACTION_NEW_SOURCE,
-                unit=self,
-            )
-        if contentsum_changed:
-            self.update_has_failing_check(recurse=False, update_stats=False)
-            self.update_has_comment(update_stats=False)
-            self.update_has_suggestion(update_stats=False)
+        return same_content, same_state, contentsum_changed
+
+    def update_flags(self):
+        """
+        Updates flags depending on content sum without updating stats.
+        """
+        self.update_has_failing_check(recurse=False, update_stats=False)
+        self.update_has_comment(update_stats=False)
+        self.update_has_suggestion(update_stats=False)
 
     def is_plural(self):
         """
@@ -529,14 +876,11 @@ class Unit(models.Model, LoggerMixin):
     def propagate(self, request, change_action=None):
         """
         Propagates current translation to all others.
+
+        Every affected translation file is written only once, see
+        Propagation for details.
         """
-        allunits = Unit.objects.same(self).filter(
-            translation__subproject__allow_translation_propagation=True
-        )
-        for unit in allunits:
-            unit.target = self.target
-            unit.fuzzy = self.fuzzy
-            unit.save_backend(request, False, change_action=change_action)
+        PROPAGATION_RUNNER.start(Propagation(self, request, change_action))
 
     def save_backend(self, request, propagate=True, gen_change=True,
                      change_action=None, user=None):
@@ -546,7 +890,7 @@ class Unit(models.Model, LoggerMixin):
         Optional user parameters defines authorship of a change.
         """
         # Update lock timestamp
-        self.translation.update_lock(request)
+        self.translation.update_lock(request.user)
 
         # For case when authorship specified, use user from request
         if user is None:
@@ -606,7 +950,7 @@ class Unit(models.Model, LoggerMixin):
 
         # Update translation stats
         old_translated = self.translation.translated
-        self.translation.update_stats()
+        self.update_translation_stats()
 
         # Notify subscribed users about new translation
         notify_new_translation(self, oldunit, request.user)
@@ -617,7 +961,7 @@ class Unit(models.Model, LoggerMixin):
 
         # Generate Change object for this change
         if gen_change:
-            self.generate_change(request, user, oldunit, change_action)
+            self.generate_change(request.user, user, oldunit, change_action)
 
         # Force commiting on completing translation
         if (old_translated < self.translation.translated and
@@ -670,17 +1014,17 @@ class Unit(models.Model, LoggerMixin):
         # checksum which is same for all
         update_index_unit(self, True)
 
-    def generate_change(self, request, author, oldunit, change_action):
+    def generate_change(self, user, author, oldunit, change_action):
         """
         Creates Change entry for saving unit.
         """
         # Notify about new contributor
         user_changes = Change.objects.filter(
             translation=self.translation,
-            user=request.user
+            user=user
         )
         if not user_changes.exists():
-            notify_new_contributor(self, request.user)
+            notify_new_contributor(self, user)
 
         # Action type to store
         if change_action is not None:
@@ -701,7 +1045,7 @@ class Unit(models.Model, LoggerMixin):
             unit=self,
             translation=self.translation,
             action=action,
-            user=request.user,
+            user=user,
             author=author,
             target=history_target
         )
@@ -723,24 +1067,77 @@ class Unit(models.Model, LoggerMixin):
         # Pop parameter indicating that we don't have to process content
         same_content = kwargs.pop('same_content', False)
         same_state = kwargs.pop('same_state', False)
+        # Checks can be updated later in batch
+        checks = kwargs.pop('checks', True)
         # Keep the force_insert for parent save
         force_insert = kwargs.get('force_insert', False)
 
         # Store number of words
         if not same_content or not self.num_words:
-            self.num_words = len(self.get_source_plurals()[0].split())
+            self.update_num_words()
 
         # Actually save the unit
         super(Unit, self).save(*args, **kwargs)
 
+        self.update_saved(same_content, same_state, force_insert, checks)
+
+    def update_num_words(self):
+        """
+        Updates number of words in source string.
+        """
+        self.num_words = len(self.get_source_plurals()[0].split())
+
+    def get_stats_values(self):
+        """
+        Returns contribution of this unit to translation statistics.
+        """
+        return {
+            'total': 1,
+            'total_words': self.num_words,
+            'translated': int(self.translated),
+            'translated_words': self.num_words if self.translated else 0,
+            'fuzzy': int(self.fuzzy),
+            'fuzzy_words': self.num_words if self.fuzzy else 0,
+            'failing_checks': int(self.has_failing_check),
+            'failing_checks_words': (
+                self.num_words if self.has_failing_check else 0
+            ),
+            'have_suggestion': int(self.has_suggestion),
+            'have_comment': int(self.has_comment),
+        }
+
+    def update_translation_stats(self):
+        """
+        Updates translation statistics for changes in this unit.
+
+        Only difference to the state when the unit was loaded or last
+        counted is applied, so the translation does not have to be
+        aggregated again.
+        """
+        values = self.get_stats_values()
+        self.translation.update_stats_delta(self.old_stats, values)
+        self.old_stats = values
+
+    def update_saved(self, same_content, same_state, force_insert,
+                     checks=True):
+        """
+        Updates checks, fulltext index and translation memory after save.
+
+        Checks can be skipped to be updated later in batch using
+        UnitManager.update_checks.
+        """
         # Update checks if content or fuzzy flag has changed
-        if not same_content or not same_state:
+        if checks and (not same_content or not same_state):
             self.run_checks(same_state, same_content, force_insert)
 
         # Update fulltext index if content has changed or this is a new unit
         if force_insert or not same_content:
             update_index_unit(self, force_insert)
 
+        # Update translation memory if source or translated state has changed
+        if force_insert or not same_content or not same_state:
+            update_memory_unit(self)
+
     def suggestions(self):
         """
         Returns all suggestions for this unit.
@@ -958,7 +1355,7 @@ class Unit(models.Model, LoggerMixin):
 
             # Update translation stats
             if update_stats:
-                self.translation.update_stats()
+                self.update_translation_stats()
 
         # Invalidate checks cache if there was any change
         # (above code cares only about whether there is failing check
@@ -980,7 +1377,7 @@ class Unit(models.Model, LoggerMixin):
 
             # Update translation stats
             if update_stats:
-                self.translation.update_stats()
+                self.update_translation_stats()
 
     def update_has_comment(self, update_stats=True):
         """
@@ -993,7 +1390,7 @@ class Unit(models.Model, LoggerMixin):
 
             # Update translation stats
             if update_stats:
-                self.translation.update_stats()
+                self.update_translation_stats()
 
     def nearby(self):
         """
@@ -0,0 +1,360 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2012 - 2015 Michal Čihař <michal@cihar.com>
+#
+# This file is part of Weblate <https://weblate.org/>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+'''
+Propagation of translations to other components.
+
+Units with same source string in other components of the project are
+grouped by translation, so every translation file is written once and
+statistics are updated once per translation. With BACKGROUND_PROPAGATION
+set, the propagation runs in separate thread after the request, which keeps
+only the user who made the change.
+'''
+
+import atexit
+import copy
+import threading
+from django.contrib import messages
+from django.core.signals import request_finished
+from django.db import connection
+from django.dispatch import receiver
+from django.utils.translation import ugettext as _
+from weblate import appsettings
+from weblate.accounts.models import notify_new_translation
+from weblate.trans.filelock import FileLockException
+from weblate.logger import LOGGER
+
+
+class Propagation(object):
+    '''
+    Propagates translation of single unit to all matching units.
+    '''
+    def __init__(self, unit, request, change_action=None):
+        self.unit = unit
+        self.target = unit.target
+        self.fuzzy = unit.fuzzy
+        self.request = request
+        self.user = request.user
+        self.change_action = change_action
+        self.background = False
+        self.total = 0
+        self.done = 0
+        self.units = 0
+
+    def get_message_request(self):
+        '''
+        Returns request for emitting messages, these can not be shown when
+        running in background.
+        '''
+        if self.background:
+            return None
+        return self.request
+
+    def is_current(self):
+        '''
+        Checks whether unit still has the propagated translation.
+
+        It does not have it when the transaction saving it was rolled back
+        or when it was changed meanwhile.
+        '''
+        from weblate.trans.models import Unit
+        return Unit.objects.filter(
+            pk=self.unit.pk,
+            target=self.target,
+            fuzzy=self.fuzzy
+        ).exists()
+
+    def get_groups(self):
+        '''
+        Returns list of translations and their units to update.
+        '''
+        from weblate.trans.models import Translation, Unit
+        groups = {}
+        allunits = Unit.objects.same(self.unit).filter(
+            translation__subproject__allow_translation_propagation=True
+        )
+        for unit in allunits:
+            groups.setdefault(unit.translation_id, []).append(unit)
+
+        translations = Translation.objects.filter(
+            pk__in=groups.keys()
+        ).select_related(
+            'subproject', 'subproject__project', 'language'
+        ).order_by(
+            'subproject', 'pk'
+        )
+        return [
+            (translation, groups[translation.pk])
+            for translation in translations
+        ]
+
+    def run(self):
+        '''
+        Updates all matching units, returns number of changed units.
+        '''
+        groups = self.get_groups()
+        self.total = len(groups)
+        for translation, units in groups:
+            self.units += self.update_translation(translation, units)
+            self.done += 1
+            LOGGER.debug(
+                'propagating %d: %d of %d translations',
+                self.unit.pk, self.done, self.total
+            )
+
+        if self.units:
+            profile = self.user.profile
+            profile.translated += self.units
+            profile.save()
+
+        return self.units
+
+    def update_translation(self, translation, units):
+        '''
+        Updates units within single translation, writing the file once.
+        '''
+        from weblate.trans.models import Change, Unit
+        request = self.get_message_request()
+
+        # Update lock timestamp
+        translation.update_lock(self.user)
+
+        oldunits = []
+        for unit in units:
+            # Keep database state for notifications and history
+            oldunits.append(copy.copy(unit))
+            unit.translation = translation
+            unit.target = self.target
+            unit.fuzzy = self.fuzzy
+
+        # Store to backend
+        try:
+            result = translation.update_units(units, request, self.user)
+        except FileLockException:
+            translation.log_error('failed to lock backend for propagation!')
+            if request is not None:
+                messages.error(
+                    request,
+                    _(
+                        'Failed to store message in the backend, '
+                        'lock timeout occurred!'
+                    )
+                )
+            return 0
+
+        changed = []
+        missing = False
+        for unit, oldunit, (saved, pounit) in zip(units, oldunits, result):
+            # Handle situation when backend did not find the message
+            if pounit is None:
+                unit.log_error('message %s disappeared!', unit)
+                missing = True
+                continue
+
+            # Skip units without change
+            if (not saved and
+                    oldunit.fuzzy == unit.fuzzy and
+                    oldunit.target == unit.target):
+                continue
+
+            unit.translated = pounit.is_translated()
+            unit.flags = pounit.get_flags()
+            unit.save(backend=True, checks=False)
+            changed.append((unit, oldunit))
+
+        if missing:
+            # Try reloading from backend
+            translation.check_sync(True)
+
+        if not changed:
+            return 0
+
+        # Update checks and stats once for all units
+        Unit.objects.update_checks(
+            translation,
+            [(unit, False, False) for unit, oldunit in changed]
+        )
+        old_translated = translation.translated
+        translation.update_stats()
+
+        for unit, oldunit in changed:
+            notify_new_translation(unit, oldunit, self.user)
+            unit.generate_change(
+                self.user, self.user, oldunit, self.change_action
+            )
+            # Update related source strings if working on a template
+            if translation.is_template():
+                unit.update_source_units()
+
+        # Force commiting on completing translation
+        if (old_translated < translation.translated and
+                translation.translated == translation.total):
+            translation.commit_pending(request)
+            Change.objects.create(
+                translation=translation,
+                action=Change.ACTION_COMPLETE,
+                user=self.user,
+                author=self.user
+            )
+
+        return len(changed)
+
+
+class PropagationRunner(object):
+    '''
+    Runs propagations, optionally in background threads.
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running = []
+        self.threads = set()
+        self.finished = 0
+        self.units = 0
+        # Propagations waiting for end of transaction in each thread
+        self.local = threading.local()
+
+    def get_pending(self):
+        '''
+        Returns list of propagations waiting in current thread.
+        '''
+        if not hasattr(self.local, 'pending'):
+            self.local.pending = []
+        return self.local.pending
+
+    def start(self, propagation):
+        '''
+        Starts propagation, waits for it unless BACKGROUND_PROPAGATION is set.
+
+        Background thread has to see the saved translation, so inside
+        transaction it is started only once handling of the request is
+        finished, when transaction of ATOMIC_REQUESTS is already committed.
+        Django 1.8 does not provide hooks for transaction commit.
+        '''
+        if not appsettings.BACKGROUND_PROPAGATION:
+            self.run(propagation)
+            return None
+        if connection.in_atomic_block:
+            self.get_pending().append(propagation)
+            return None
+        self.start_pending()
+        return self.start_thread(propagation)
+
+    def start_pending(self):
+        '''
+        Starts propagations waiting for end of transaction.
+        '''
+        pending = self.get_pending()
+        while pending:
+            self.start_thread(pending.pop(0))
+
+    def start_thread(self, propagation):
+        '''
+        Starts propagation in background thread.
+
+        The thread is not daemonic, so the propagation is completed before
+        the process exits.
+        '''
+        propagation.background = True
+        # Request is finished before the propagation
+        propagation.request = None
+        thread = threading.Thread(
+            target=self.run_thread,
+            args=(propagation,)
+        )
+        with self.lock:
+            self.threads.add(thread)
+        thread.start()
+        return thread
+
+    def join(self):
+        '''
+        Waits for background propagations to complete.
+        '''
+        with self.lock:
+            threads = list(self.threads)
+        for thread in threads:
+            thread.join()
+
+    def run(self, propagation):
+        '''
+        Runs propagation, tracking its progress.
+        '''
+        with self.lock:
+            self.running.append(propagation)
+        try:
+            propagation.run()
+        finally:
+            with self.lock:
+                self.running.remove(propagation)
+                self.finished += 1
+                self.units += propagation.units
+
+    def run_thread(self, propagation):
+        '''
+        Runs propagation in background thread, logging errors.
+        '''
+        try:
+            if propagation.is_current():
+                self.run(propagation)
+            else:
+                LOGGER.info(
+                    'skipping propagation of %d, translation has changed',
+                    propagation.unit.pk
+                )
+        except Exception as error:
+            LOGGER.error(
+                'failed to propagate translation of %d: %s',
+                propagation.unit.pk,
+                error
+            )
+        finally:
+            # Thread has own database connection
+            connection.close()
+            with self.lock:
+                self.threads.discard(threading.current_thread())
+
+    def get_stats(self):
+        '''
+        Returns progress of running propagations and totals.
+        '''
+        with self.lock:
+            return {
+                'running': len(self.running),
+                'pending': sum(
+                    propagation.total - propagation.done
+                    for propagation in self.running
+                ),
+                'finished': self.finished,
+                'units': self.units,
+            }
+
+
+PROPAGATION_RUNNER = PropagationRunner()
+# Embedded interpreters do not have to wait for non daemonic threads
+atexit.register(PROPAGATION_RUNNER.join)
+
+
+@receiver(request_finished)
+def start_pending_propagations(sender, **kwargs):
+    '''
+    Starts propagations deferred until end of request.
+    '''
+    PROPAGATION_RUNNER.start_pending()
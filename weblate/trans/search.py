@@ -19,23 +19,57 @@
 #
 
 '''
-Whoosh based full text search.
+Full text search.
+
+The search itself is done by backend configured in FULLTEXT_BACKEND, this
+module contains the interface, Whoosh based implementation and database
+based implementation.
 '''
 
+import atexit
+import hashlib
+import json
+import multiprocessing
+import os
+import re
 import shutil
+import tempfile
+import threading
+import time
 from whoosh.fields import SchemaClass, TEXT, ID
 from whoosh.filedb.filestore import FileStorage
-from whoosh.writing import AsyncWriter, BufferedWriter
+from whoosh.writing import AsyncWriter
 from whoosh import qparser
+from django.core.cache import cache
 from django.dispatch import receiver
 from django.db.models.signals import post_migrate
 from django.db.utils import IntegrityError
-from django.db import transaction
+from django.db import transaction, connection, connections
 from weblate import appsettings
 from weblate.lang.models import Language
 from weblate.trans.data import data_dir
+from weblate.trans.filelock import FileLock
+from weblate.trans.util import load_class
+
+# Storage of currently used index directory
+STORAGE = None
+
+# Opened indexes and per thread searchers
+INDEXES = {}
+# Instantiated fulltext backends
+BACKENDS = {}
+SEARCHERS = threading.local()
 
-STORAGE = FileStorage(data_dir('whoosh'))
+# Words used in database fulltext queries
+TERMS_RE = re.compile(r'\w+', re.UNICODE)
+# Number of words used for finding similar strings in database
+MORE_LIKE_TERMS = 10
+# Fields which can be searched
+SEARCH_FIELDS = ('source', 'context', 'location', 'target', 'comment')
+# Number of documents repaired at once by index check
+CHECK_INDEX_CHUNK = 1000
+# Versioned index directories
+STORAGE_RE = re.compile(r'^whoosh-[0-9]+-[a-zA-Z0-9_]+$')
 
 
 class TargetSchema(SchemaClass):
@@ -57,12 +91,20 @@ class SourceSchema(SchemaClass):
     location = TEXT()
 
 
-def clean_indexes():
-    """
-    Cleans all indexes.
-    """
-    shutil.rmtree(data_dir('whoosh'))
-    create_index()
+def get_storage():
+    '''
+    Returns storage for current index directory.
+
+    The index directory can be symlink to versioned directory, which is
+    replaced by rebuild. Indexes opened from previous directory are
+    dropped once it changes.
+    '''
+    global STORAGE
+    path = os.path.realpath(data_dir('whoosh'))
+    if STORAGE is None or STORAGE.folder != path:
+        STORAGE = FileStorage(path)
+        INDEXES.clear()
+    return STORAGE
 
 
 @receiver(post_migrate)
@@ -70,60 +112,78 @@ def create_index(sender=None, **kwargs):
     '''
     Automatically creates storage directory.
     '''
-    STORAGE.create()
+    get_storage().create()
 
 
 def create_source_index():
     '''
     Creates source string index.
     '''
-    return STORAGE.create_index(SourceSchema(), 'source')
+    return get_storage().create_index(SourceSchema(), 'source')
 
 
 def create_target_index(lang):
     '''
     Creates traget string index for given language.
     '''
-    return STORAGE.create_index(TargetSchema(), 'target-%s' % lang)
+    return get_storage().create_index(TargetSchema(), 'target-%s' % lang)
+
+
+def get_source_unit_fields(unit):
+    '''
+    Returns source index document for given unit.
+    '''
+    return {
+        'checksum': unicode(unit.checksum),
+        'source': unicode(unit.source),
+        'context': unicode(unit.context),
+        'location': unicode(unit.location),
+    }
+
+
+def get_target_unit_fields(unit):
+    '''
+    Returns target index document for given unit.
+    '''
+    return {
+        'checksum': unicode(unit.checksum),
+        'target': unicode(unit.target),
+        'comment': unicode(unit.comment),
+    }
 
 
 def update_source_unit_index(writer, unit):
     '''
     Updates source index for given unit.
     '''
-    writer.update_document(
-        checksum=unicode(unit.checksum),
-        source=unicode(unit.source),
-        context=unicode(unit.context),
-        location=unicode(unit.location),
-    )
+    writer.update_document(**get_source_unit_fields(unit))
 
 
 def update_target_unit_index(writer, unit):
     '''
     Updates target index for given unit.
     '''
-    writer.update_document(
-        checksum=unicode(unit.checksum),
-        target=unicode(unit.target),
-        comment=unicode(unit.comment),
-    )
+    writer.update_document(**get_target_unit_fields(unit))
 
 
 def get_source_index():
     '''
     Returns source index object.
     '''
+    storage = get_storage()
+    if 'source' in INDEXES:
+        return INDEXES['source']
     try:
-        exists = STORAGE.index_exists('source')
+        exists = storage.index_exists('source')
     except OSError:
         create_index()
         exists = False
     if not exists:
         create_source_index()
-    index = STORAGE.open_index('source')
+    index = storage.open_index('source')
     if 'location' not in index.schema:
         index.add_field('location', TEXT)
+    INDEXES['source'] = index
     return index
 
 
@@ -132,53 +192,471 @@ def get_target_index(lang):
     Returns target index object.
     '''
     name = 'target-%s' % lang
+    storage = get_storage()
+    if name in INDEXES:
+        return INDEXES[name]
     try:
-        exists = STORAGE.index_exists(name)
+        exists = storage.index_exists(name)
     except OSError:
         create_index()
         exists = False
     if not exists:
         create_target_index(lang)
-    index = STORAGE.open_index(name)
+    index = storage.open_index(name)
     if 'comment' not in index.schema:
         index.add_field('comment', TEXT)
+    INDEXES[name] = index
     return index
 
 
-def update_index(units, source_units=None):
+def get_searcher(name, get_index):
     '''
-    Updates fulltext index for given set of units.
+    Returns searcher for given index.
+
+    The searchers are kept open and are refreshed only when the index
+    generation changes. The get_index is callable returning the index.
     '''
-    languages = Language.objects.have_translation()
+    if not hasattr(SEARCHERS, 'cache'):
+        SEARCHERS.cache = {}
+    index = get_index()
+    generation = index.latest_generation()
 
-    # Default to same set for both updates
-    if source_units is None:
-        source_units = units
+    # Index was removed meanwhile (eg. by rebuild in other process)
+    if generation < 0:
+        INDEXES.clear()
+        index = get_index()
+        generation = index.latest_generation()
 
-    # Update source index
-    index = get_source_index()
-    writer = BufferedWriter(index)
-    try:
-        for unit in source_units.iterator():
-            update_source_unit_index(writer, unit)
-    finally:
-        writer.close()
-
-    # Update per language indices
-    for lang in languages:
-        index = get_target_index(lang.code)
-        writer = BufferedWriter(index)
+    cached = SEARCHERS.cache.get(name)
+    if cached is None or cached[0] is not index:
+        if cached is not None:
+            cached[2].close()
+        searcher = index.searcher()
+    elif cached[1] != generation:
+        searcher = cached[2].refresh()
+    else:
+        return cached[2]
+
+    SEARCHERS.cache[name] = (index, generation, searcher)
+    return searcher
+
+
+def get_source_searcher():
+    '''
+    Returns searcher for source index.
+    '''
+    return get_searcher('source', get_source_index)
+
+
+def get_target_searcher(lang):
+    '''
+    Returns searcher for target index for given language.
+    '''
+    return get_searcher(
+        'target-%s' % lang,
+        lambda: get_target_index(lang)
+    )
+
+
+class IndexQueue(object):
+    '''
+    In-memory queue of pending fulltext index updates.
+
+    Updates are coalesced by checksum and written to the indexes in batches,
+    either once the queue holds INDEX_QUEUE_LIMIT documents or once the
+    oldest pending update is INDEX_QUEUE_DELAY seconds old.
+    '''
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.source = {}
+        self.target = {}
+        self.timer = None
+        self.flushes = 0
+        self.flush_time = 0.0
+        self.last_flush_time = 0.0
+
+    def __len__(self):
+        return len(self.source) + sum(
+            [len(docs) for docs in self.target.values()]
+        )
+
+    def add(self, unit, source=True, target=True):
+        '''
+        Queues index update for given unit.
+        '''
+        with self.lock:
+            if source:
+                self.source[unit.checksum] = get_source_unit_fields(unit)
+            if target and unit.target:
+                lang = unit.translation.language.code
+                self.target.setdefault(lang, {})[unit.checksum] = \
+                    get_target_unit_fields(unit)
+
+            if len(self) >= appsettings.INDEX_QUEUE_LIMIT:
+                self.flush()
+            elif self.timer is None and len(self) > 0:
+                self.timer = threading.Timer(
+                    appsettings.INDEX_QUEUE_DELAY, self.flush
+                )
+                self.timer.daemon = True
+                self.timer.start()
+
+    def clear(self):
+        '''
+        Drops all pending updates.
+        '''
+        with self.lock:
+            self.cancel_timer()
+            self.source = {}
+            self.target = {}
+
+    def cancel_timer(self):
+        '''
+        Cancels pending delayed flush.
+        '''
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+    def flush(self):
+        '''
+        Writes all pending updates to the indexes.
+        '''
+        with self.lock:
+            self.cancel_timer()
+            if len(self) == 0:
+                return
+            start = time.time()
+
+            # Rebuild in progress would not see these updates
+            journal_updates(self.source, self.target)
+
+            if self.source:
+                with AsyncWriter(get_source_index()) as writer:
+                    for fields in self.source.values():
+                        writer.update_document(**fields)
+
+            for lang, docs in self.target.items():
+                with AsyncWriter(get_target_index(lang)) as writer:
+                    for fields in docs.values():
+                        writer.update_document(**fields)
+
+            self.source = {}
+            self.target = {}
+
+            # Cached results are for older generations now
+            SEARCH_CACHE.clear()
+
+            self.last_flush_time = time.time() - start
+            self.flush_time += self.last_flush_time
+            self.flushes += 1
+
+    def get_stats(self):
+        '''
+        Returns queue depth and flush latency information.
+        '''
+        with self.lock:
+            if self.flushes:
+                average = self.flush_time / self.flushes
+            else:
+                average = 0.0
+            return {
+                'depth': len(self),
+                'flushes': self.flushes,
+                'last_flush_time': self.last_flush_time,
+                'average_flush_time': average,
+            }
+
+
+INDEX_QUEUE = IndexQueue()
+atexit.register(INDEX_QUEUE.flush)
+
+
+class SearchCache(object):
+    '''
+    Cache of fulltext search results.
+
+    The results are stored in Django cache, so they are shared by all
+    processes. The keys include generation, which is increased on every
+    index change, so any change makes older results unreachable for all
+    processes. Hit rates are counted for this process only.
+    '''
+    generation_key = 'search-generation'
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_generation(self):
+        '''
+        Returns current generation of cached results.
+        '''
+        generation = cache.get(self.generation_key)
+        if generation is None:
+            # Start from current time to not reuse generation of results
+            # which might be still cached
+            cache.add(self.generation_key, int(time.time() * 1000), None)
+            generation = cache.get(self.generation_key, 0)
+        return generation
+
+    def get_cache_key(self, key):
+        return 'search-{0}-{1}'.format(
+            self.get_generation(),
+            hashlib.md5(repr(key)).hexdigest()
+        )
+
+    def get(self, key):
+        '''
+        Returns cached result or None.
+        '''
+        result = cache.get(self.get_cache_key(key))
+        with self.lock:
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return result
+
+    def set(self, key, result):
+        '''
+        Stores result in the cache.
+        '''
+        cache.set(
+            self.get_cache_key(key),
+            result,
+            appsettings.SEARCH_CACHE_TIMEOUT
+        )
+
+    def clear(self):
+        '''
+        Makes all cached results unreachable.
+        '''
         try:
-            language_units = units.filter(
-                translation__language=lang
-            ).exclude(
-                target=''
-            )
+            cache.incr(self.generation_key)
+        except ValueError:
+            # Generation is not stored in the cache
+            self.get_generation()
+
+    def get_stats(self):
+        '''
+        Returns cache hit rate information.
+        '''
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+SEARCH_CACHE = SearchCache()
+
+
+def build_index(params):
+    '''
+    Builds single fulltext index from the database.
+
+    The params is tuple of storage path, language code (None for source
+    index), list of component ids to process (None for all) and whether
+    the index is being built from scratch. Units are streamed in checksum
+    ranges, so memory usage does not depend on number of units.
+    '''
+    from weblate.trans.models import Unit
+    path, lang, subprojects, clean = params
+
+    storage = FileStorage(path)
+    units = Unit.objects.all()
+    if subprojects is not None:
+        units = units.filter(translation__subproject__in=subprojects)
+
+    if lang is None:
+        name = 'source'
+        schema = SourceSchema()
+        get_fields = get_source_unit_fields
+    else:
+        name = 'target-%s' % lang
+        schema = TargetSchema()
+        get_fields = get_target_unit_fields
+        units = units.filter(
+            translation__language__code=lang
+        ).exclude(
+            target=''
+        )
+
+    if clean or not storage.index_exists(name):
+        index = storage.create_index(schema, name)
+    else:
+        index = storage.open_index(name)
+
+    # Units are ordered by checksum, so that same strings present in several
+    # components follow each other and only first of them is indexed
+    units = units.order_by('checksum', 'pk')
+    current = ''
+    count = 0
+    step = 1000
+
+    writer = index.writer()
+    try:
+        while True:
+            chunk = list(units.filter(checksum__gt=current)[:step])
+            if not chunk:
+                break
+            for unit in chunk:
+                if unit.checksum == current:
+                    continue
+                current = unit.checksum
+                count += 1
+                if clean:
+                    writer.add_document(**get_fields(unit))
+                else:
+                    writer.update_document(**get_fields(unit))
+    except Exception:
+        writer.cancel()
+        raise
+    writer.commit()
+
+    return name, count
 
-            for unit in language_units.iterator():
-                update_target_unit_index(writer, unit)
-        finally:
-            writer.close()
+
+def get_journal():
+    '''
+    Returns path to journal of updates done during rebuild.
+    '''
+    return data_dir('whoosh-journal')
+
+
+def get_journal_lock():
+    '''
+    Returns lock protecting the journal, it is shared by all processes.
+    '''
+    return FileLock(data_dir('whoosh-journal.lock'), timeout=60)
+
+
+def journal_updates(source, target):
+    '''
+    Records index updates while indexes are being rebuilt.
+
+    The journal exists only during rebuild and is replayed to the rebuilt
+    indexes, so updates written meanwhile to old indexes are not lost.
+    '''
+    journal = get_journal()
+    if not os.path.exists(journal):
+        return
+    with get_journal_lock():
+        if not os.path.exists(journal):
+            return
+        with open(journal, 'ab') as handle:
+            for fields in source.values():
+                handle.write(json.dumps([None, fields]) + '\n')
+            for lang, docs in target.items():
+                for fields in docs.values():
+                    handle.write(json.dumps([lang, fields]) + '\n')
+
+
+def read_journal(offset=0):
+    '''
+    Returns journal content starting at offset, journal lock has to be
+    held by caller.
+    '''
+    with open(get_journal(), 'rb') as handle:
+        handle.seek(offset)
+        return handle.read()
+
+
+def replay_journal(path, data):
+    '''
+    Writes updates from journal data to indexes in path.
+    '''
+    updates = {}
+    for line in data.splitlines():
+        lang, fields = json.loads(line)
+        updates.setdefault(lang, {})[fields['checksum']] = fields
+
+    storage = FileStorage(path)
+    for lang, docs in updates.items():
+        if lang is None:
+            name = 'source'
+            schema = SourceSchema()
+        else:
+            name = 'target-%s' % lang
+            schema = TargetSchema()
+        if storage.index_exists(name):
+            index = storage.open_index(name)
+        else:
+            index = storage.create_index(schema, name)
+        with index.writer() as writer:
+            for fields in docs.values():
+                writer.update_document(**fields)
+
+
+def create_index_storage():
+    '''
+    Creates new versioned directory for indexes.
+    '''
+    return tempfile.mkdtemp(
+        prefix='whoosh-{0}-'.format(int(time.time())),
+        dir=appsettings.DATA_DIR,
+    )
+
+
+def swap_index_storage(path):
+    '''
+    Replaces current index storage with the one in given path.
+
+    The index directory is symlink, which is atomically replaced, so there
+    is always some index available for other processes. Previous version is
+    kept for processes which still have it opened, older ones are removed.
+    '''
+    current = data_dir('whoosh')
+    previous = os.path.realpath(current)
+
+    if os.path.isdir(current) and not os.path.islink(current):
+        # Move away directory used before versioned indexes
+        previous = create_index_storage()
+        os.rename(current, previous)
+
+    temp = data_dir('whoosh-link-{0}'.format(os.getpid()))
+    if os.path.lexists(temp):
+        os.unlink(temp)
+    os.symlink(os.path.basename(path), temp)
+    os.rename(temp, current)
+
+    keep = (os.path.basename(path), os.path.basename(previous))
+    for name in os.listdir(appsettings.DATA_DIR):
+        if STORAGE_RE.match(name) and name not in keep:
+            shutil.rmtree(data_dir(name), ignore_errors=True)
+
+    # Opened indexes are dropped by get_storage on next use
+    SEARCH_CACHE.clear()
+
+
+def rebuild_index_storage(tasks, build):
+    '''
+    Builds indexes into new directory and swaps it in.
+
+    Updates written to current indexes in the meantime by any process are
+    recorded in journal and replayed to new indexes before the swap.
+    '''
+    path = create_index_storage()
+    journal = get_journal()
+    with get_journal_lock():
+        open(journal, 'wb').close()
+    try:
+        results = build([(path, ) + task for task in tasks])
+        # Replay most of the journal without blocking writers
+        with get_journal_lock():
+            data = read_journal()
+        replay_journal(path, data)
+        with get_journal_lock():
+            replay_journal(path, read_journal(len(data)))
+            swap_index_storage(path)
+            os.unlink(journal)
+    except Exception:
+        if os.path.exists(journal):
+            os.unlink(journal)
+        shutil.rmtree(path, ignore_errors=True)
+        raise
+    return results
 
 
 def update_index_unit(unit, source=True):
@@ -198,27 +676,15 @@ def update_index_unit(unit, source=True):
                 )
         # pylint: disable=E0712
         except IntegrityError:
-            try:
-                update = IndexUpdate.objects.get(unit=unit)
-                if not update.source and source:
-                    update.source = True
-                    update.save()
-            except IndexUpdate.DoesNotExist:
-                # It did exist, but was deleted meanwhile
-                return
+            # Release possible claim, so that the update is processed again
+            # with current content
+            changes = {'worker': '', 'claimed': None}
+            if source:
+                changes['source'] = True
+            IndexUpdate.objects.filter(unit=unit).update(**changes)
         return
 
-    # Update source
-    if source:
-        index = get_source_index()
-        with AsyncWriter(index) as writer:
-            update_source_unit_index(writer, unit)
-
-    # Update target
-    if unit.target:
-        index = get_target_index(unit.translation.language.code)
-        with AsyncWriter(index) as writer:
-            update_target_unit_index(writer, unit)
+    get_backend().update_unit(unit, source)
 
 
 def base_search(searcher, field, schema, query):
@@ -230,12 +696,10 @@ def base_search(searcher, field, schema, query):
     return [result['checksum'] for result in searcher.search(parsed)]
 
 
-def fulltext_search(query, lang, params):
+def get_search_params(params):
     '''
-    Performs fulltext search in given areas, returns set of checksums.
+    Returns search areas with defaults filled in.
     '''
-    checksums = set()
-
     search = {
         'source': False,
         'context': False,
@@ -244,34 +708,417 @@ def fulltext_search(query, lang, params):
         'location': False,
     }
     search.update(params)
+    return search
+
+
+class SearchBackend(object):
+    '''
+    Base class for fulltext search backends.
+    '''
+    def update_unit(self, unit, source=True):
+        '''
+        Updates index for single unit.
+        '''
+        raise NotImplementedError()
+
+    def update_index(self, units, source_units=None):
+        '''
+        Updates fulltext index for given set of units.
+        '''
+        raise NotImplementedError()
+
+    def index_units(self, units):
+        '''
+        Adds iterable of units to the index.
+        '''
+        raise NotImplementedError()
+
+    def rebuild(self, jobs=1, subprojects=None, clean=False):
+        '''
+        Rebuilds indexes, returns list of (index name, count).
+        '''
+        raise NotImplementedError()
+
+    def clean(self):
+        '''
+        Cleans all indexes.
+        '''
+        raise NotImplementedError()
+
+    def optimize(self):
+        '''
+        Optimizes indexes.
+        '''
+        return
+
+    def search(self, query, lang, params):
+        '''
+        Performs fulltext search in given areas, returns set of checksums.
+        '''
+        raise NotImplementedError()
+
+    def search_ranked(self, query, lang, params, offset=0, limit=None,
+                      units=None):
+        '''
+        Performs fulltext search in given areas, returns list of checksums
+        ordered by relevance.
+
+        The search can be restricted to checksums of units queryset.
+        '''
+        raise NotImplementedError()
+
+    def filter_units(self, units, query, lang, params):
+        '''
+        Filters units queryset by fulltext search.
+        '''
+        return units.filter(checksum__in=self.search(query, lang, params))
+
+    def count_units(self, units, query, lang, params):
+        '''
+        Counts units matching fulltext search.
+        '''
+        return self.filter_units(units, query, lang, params).count()
+
+    def more_like(self, checksum, source, top=5):
+        '''
+        Finds similar units, returns set of checksums.
+        '''
+        raise NotImplementedError()
+
+    def get_checksums(self, lang, prefix):
+        '''
+        Returns set of checksums with given prefix stored in the index.
+
+        Source index is used when lang is None.
+        '''
+        raise NotImplementedError()
+
+    def delete_checksums(self, lang, checksums):
+        '''
+        Removes documents with given checksums from the index.
+        '''
+        raise NotImplementedError()
+
+
+class WhooshBackend(SearchBackend):
+    '''
+    Whoosh based fulltext search, indexes are stored in data directory.
+    '''
+    def update_unit(self, unit, source=True):
+        # Queue the update, it will be written together with others
+        INDEX_QUEUE.add(unit, source)
+
+    def update_index(self, units, source_units=None):
+        '''
+        Updates fulltext index for given set of units.
+        '''
+        # Default to same set for both updates
+        if source_units is None:
+            source_units = units
+
+        # Update source index
+        for unit in source_units.iterator():
+            INDEX_QUEUE.add(unit, target=False)
+
+        # Update per language indices
+        language_units = units.exclude(
+            target=''
+        ).select_related(
+            'translation__language'
+        )
+        for unit in language_units.iterator():
+            INDEX_QUEUE.add(unit, source=False)
+
+        INDEX_QUEUE.flush()
+
+    def index_units(self, units):
+        source_writer = get_source_index().writer()
+        target_writers = {}
+
+        try:
+            for unit in units:
+                lang = unit.translation.language.code
+                # Lazy open writer
+                if lang not in target_writers:
+                    target_writers[lang] = get_target_index(lang).writer()
+                # Update target index
+                if unit.translation:
+                    update_target_unit_index(target_writers[lang], unit)
+                # Update source index
+                update_source_unit_index(source_writer, unit)
+
+        finally:
+            # Close all writers
+            source_writer.commit()
+            for lang in target_writers:
+                target_writers[lang].commit()
+
+    def rebuild(self, jobs=1, subprojects=None, clean=False):
+        '''
+        Rebuilds fulltext indexes using pool of worker processes.
+
+        Each index is built by single worker, so there is no lock
+        contention between them. With clean the indexes are built aside and
+        swapped in once complete, so search keeps working during the rebuild.
+        Inside transaction the indexes are built sequentially, as workers
+        would not see uncommitted data.
+        '''
+        if subprojects is None:
+            languages = Language.objects.have_translation()
+        else:
+            subprojects = list(subprojects)
+            languages = Language.objects.filter(
+                translation__subproject__in=subprojects
+            ).distinct()
+
+        # Source index is the biggest one, so start with it
+        tasks = [(None, subprojects, clean)] + [
+            (lang.code, subprojects, clean) for lang in languages
+        ]
+
+        def build(params):
+            if jobs > 1 and not connection.in_atomic_block:
+                # Workers have to open own database connections
+                for db_connection in connections.all():
+                    db_connection.close()
+                pool = multiprocessing.Pool(jobs)
+                try:
+                    return pool.map(build_index, params, chunksize=1)
+                finally:
+                    pool.close()
+                    pool.join()
+            return [build_index(task) for task in params]
 
-    if search['source'] or search['context'] or search['location']:
-        index = get_source_index()
-        with index.searcher() as searcher:
+        if clean:
+            return rebuild_index_storage(tasks, build)
+
+        path = get_storage().folder
+        return build([(path, ) + task for task in tasks])
+
+    def clean(self):
+        """
+        Cleans all indexes.
+        """
+        with INDEX_QUEUE.lock:
+            INDEX_QUEUE.clear()
+            swap_index_storage(create_index_storage())
+
+    def optimize(self):
+        get_source_index().optimize()
+        for lang in Language.objects.have_translation():
+            get_target_index(lang.code).optimize()
+
+    def get_cache_key(self, query, lang, search, *extra):
+        '''
+        Returns search cache key for query.
+        '''
+        fields = tuple([field for field in SEARCH_FIELDS if search[field]])
+        indexes = []
+        if search['source'] or search['context'] or search['location']:
+            indexes.append(
+                ('source', get_source_index().latest_generation())
+            )
+        if search['target'] or search['comment']:
+            indexes.append((
+                'target-%s' % lang,
+                get_target_index(lang).latest_generation()
+            ))
+        return (tuple(indexes), fields, ' '.join(query.split())) + extra
+
+    def search(self, query, lang, params):
+        '''
+        Performs fulltext search in given areas, returns set of checksums.
+        '''
+        checksums = set()
+
+        # Make sure pending updates from this process are visible
+        INDEX_QUEUE.flush()
+
+        search = get_search_params(params)
+
+        key = self.get_cache_key(query, lang, search)
+        cached = SEARCH_CACHE.get(key)
+        if cached is not None:
+            return set(cached)
+
+        if search['source'] or search['context'] or search['location']:
+            searcher = get_source_searcher()
             for param in ('source', 'context', 'location'):
                 if search[param]:
                     checksums.update(
                         base_search(searcher, param, SourceSchema(), query)
                     )
 
-    if search['target'] or search['comment']:
-        index = get_target_index(lang)
-        with index.searcher() as searcher:
+        if search['target'] or search['comment']:
+            searcher = get_target_searcher(lang)
             for param in ('target', 'comment'):
                 if search[param]:
                     checksums.update(
                         base_search(searcher, param, TargetSchema(), query)
                     )
 
-    return checksums
+        SEARCH_CACHE.set(key, frozenset(checksums))
 
+        return checksums
 
-def more_like(checksum, source, top=5):
-    '''
-    Finds similar units.
-    '''
-    index = get_source_index()
-    with index.searcher() as searcher:
+    def search_ranked(self, query, lang, params, offset=0,
+                      limit=None, units=None):
+        '''
+        Performs fulltext search in given areas, returns list of checksums
+        ordered by relevance.
+
+        Only offset + limit best matches are scored in each area, so getting
+        first results does not depend on total number of matches.
+        '''
+        # Make sure pending updates from this process are visible
+        INDEX_QUEUE.flush()
+
+        search = get_search_params(params)
+
+        if limit is None:
+            top = None
+        else:
+            top = offset + limit
+
+        counts = self.get_unit_counts(units)
+
+        key = self.get_cache_key(
+            query, lang, search, 'ranked', top, self.get_units_key(counts)
+        )
+        ranked = SEARCH_CACHE.get(key)
+        if ranked is not None:
+            return list(ranked[offset:top])
+
+        scores = {}
+        for searcher, schema, fields in self.get_searchers(lang, search):
+            docnums = self.get_filter(searcher, counts)
+            # Empty filter would allow everything
+            if docnums is not None and not docnums:
+                continue
+            for param in fields:
+                if not search[param]:
+                    continue
+                parser = qparser.QueryParser(param, schema)
+                parsed = parser.parse(query)
+                results = searcher.search(
+                    parsed, limit=top, filter=docnums
+                )
+                for result in results:
+                    checksum = result['checksum']
+                    if result.score > scores.get(checksum, -1):
+                        scores[checksum] = result.score
+
+        ranked = tuple(sorted(
+            scores,
+            key=lambda checksum: (-scores[checksum], checksum)
+        ))
+
+        SEARCH_CACHE.set(key, ranked)
+
+        return list(ranked[offset:top])
+
+    def get_searchers(self, lang, search):
+        '''
+        Returns list of searcher, schema and fields for searched indexes.
+        '''
+        areas = []
+        if search['source'] or search['context'] or search['location']:
+            areas.append((
+                get_source_searcher(),
+                SourceSchema(),
+                ('source', 'context', 'location'),
+            ))
+        if search['target'] or search['comment']:
+            areas.append((
+                get_target_searcher(lang),
+                TargetSchema(),
+                ('target', 'comment'),
+            ))
+        return areas
+
+    def get_unit_counts(self, units):
+        '''
+        Returns dictionary of number of units for each checksum.
+
+        None is returned for no units, meaning the search is not restricted.
+        '''
+        if units is None:
+            return None
+        counts = {}
+        for checksum in units.values_list('checksum', flat=True).iterator():
+            counts[checksum] = counts.get(checksum, 0) + 1
+        return counts
+
+    def get_units_key(self, counts):
+        '''
+        Returns cache key part for units restriction.
+        '''
+        if counts is None:
+            return None
+        return hashlib.md5(
+            '\n'.join(sorted(counts)).encode('utf-8')
+        ).hexdigest()
+
+    def get_filter(self, searcher, counts):
+        '''
+        Returns set of document numbers to search in, None for all.
+        '''
+        if counts is None:
+            return None
+        docnums = set()
+        for checksum in counts:
+            docnum = searcher.document_number(checksum=checksum)
+            if docnum is not None:
+                docnums.add(docnum)
+        return docnums
+
+    def count_units(self, units, query, lang, params):
+        '''
+        Counts units matching fulltext search.
+
+        The search is restricted to the units checksums and the matches are
+        not scored, so this is cheaper than ranking them. Units are counted
+        from the checksums, so there is no need for another query.
+        '''
+        # Make sure pending updates from this process are visible
+        INDEX_QUEUE.flush()
+
+        search = get_search_params(params)
+        counts = self.get_unit_counts(units)
+        if not counts:
+            return 0
+
+        key = self.get_cache_key(
+            query, lang, search, 'matches', self.get_units_key(counts)
+        )
+        checksums = SEARCH_CACHE.get(key)
+        if checksums is None:
+            checksums = set()
+            for searcher, schema, fields in self.get_searchers(lang, search):
+                docnums = self.get_filter(searcher, counts)
+                if not docnums:
+                    continue
+                for param in fields:
+                    if not search[param]:
+                        continue
+                    parser = qparser.QueryParser(param, schema)
+                    results = searcher.search(
+                        parser.parse(query), limit=None, scored=False,
+                        filter=docnums
+                    )
+                    checksums.update(
+                        [result['checksum'] for result in results]
+                    )
+            checksums = frozenset(checksums)
+            SEARCH_CACHE.set(key, checksums)
+
+        return sum([counts[checksum] for checksum in checksums])
+
+    def more_like(self, checksum, source, top=5):
+        '''
+        Finds similar units.
+        '''
+        searcher = get_source_searcher()
         docnum = searcher.document_number(checksum=checksum)
         if docnum is None:
             return set()
@@ -279,3 +1126,530 @@ def more_like(checksum, source, top=5):
         results = searcher.more_like(docnum, 'source', source, top)
 
         return set([result['checksum'] for result in results])
+
+    def get_checksums(self, lang, prefix):
+        # Make sure pending updates from this process are visible
+        INDEX_QUEUE.flush()
+
+        if lang is None:
+            searcher = get_source_searcher()
+        else:
+            searcher = get_target_searcher(lang)
+
+        result = set()
+        for term in searcher.reader().expand_prefix('checksum', prefix):
+            if isinstance(term, bytes):
+                term = term.decode('utf-8')
+            # The terms include deleted documents until index is optimized
+            if searcher.document_number(checksum=term) is not None:
+                result.add(term)
+        return result
+
+    def delete_checksums(self, lang, checksums):
+        if lang is None:
+            index = get_source_index()
+        else:
+            index = get_target_index(lang)
+        with AsyncWriter(index) as writer:
+            for checksum in checksums:
+                writer.delete_by_term('checksum', checksum)
+
+
+def get_search_terms(query):
+    '''
+    Splits query to words usable in database fulltext queries.
+    '''
+    return TERMS_RE.findall(query)
+
+
+class DatabaseBackend(SearchBackend):
+    '''
+    Fulltext search stored in the database.
+
+    Documents are kept in FulltextDocument table, so the index is shared by
+    all nodes using the database. Searching uses FTS5 on SQLite, text search
+    on PostgreSQL and falls back to substring matching on other databases.
+    '''
+    source_fields = ('source', 'context', 'location')
+    target_fields = ('target', 'comment')
+
+    def __init__(self):
+        self.fts5 = None
+
+    def get_engine(self):
+        '''
+        Returns fulltext engine available in the database.
+        '''
+        if connection.vendor == 'sqlite':
+            # SQLite might be built without FTS5
+            if self.fts5 is None:
+                self.fts5 = (
+                    'trans_fulltextdocument_fts' in
+                    connection.introspection.table_names()
+                )
+            if self.fts5:
+                return 'fts5'
+        elif connection.vendor == 'postgresql':
+            return 'postgresql'
+        return 'like'
+
+    def update_document(self, language, fields):
+        '''
+        Creates or updates single document.
+        '''
+        from weblate.trans.models.search import FulltextDocument
+        try:
+            FulltextDocument.objects.update_or_create(
+                checksum=fields['checksum'],
+                language=language,
+                defaults=fields,
+            )
+        except IntegrityError:
+            # Document was created concurrently
+            FulltextDocument.objects.filter(
+                checksum=fields['checksum'],
+                language=language,
+            ).update(**fields)
+
+    def update_unit(self, unit, source=True):
+        if source:
+            self.update_document('', get_source_unit_fields(unit))
+        if unit.target:
+            self.update_document(
+                unit.translation.language.code,
+                get_target_unit_fields(unit)
+            )
+
+    def update_index(self, units, source_units=None):
+        # Default to same set for both updates
+        if source_units is None:
+            source_units = units
+
+        with transaction.atomic():
+            for unit in source_units.iterator():
+                self.update_document('', get_source_unit_fields(unit))
+
+            language_units = units.exclude(
+                target=''
+            ).select_related(
+                'translation__language'
+            )
+            for unit in language_units.iterator():
+                self.update_document(
+                    unit.translation.language.code,
+                    get_target_unit_fields(unit)
+                )
+
+    def index_units(self, units):
+        with transaction.atomic():
+            for unit in units:
+                self.update_unit(unit)
+
+    def rebuild(self, jobs=1, subprojects=None, clean=False):
+        '''
+        Rebuilds documents from units.
+
+        Everything happens in single transaction, so searches keep seeing
+        old documents until the rebuild is complete. The database does the
+        indexing work itself, so jobs is not used.
+        '''
+        from weblate.trans.models import Unit
+        from weblate.trans.models.search import FulltextDocument
+        units = Unit.objects.select_related('translation__language')
+        if subprojects is not None:
+            units = units.filter(translation__subproject__in=subprojects)
+        units = units.order_by('pk')
+
+        counts = {}
+        seen = set()
+        current = 0
+        step = 1000
+
+        with transaction.atomic():
+            if clean:
+                FulltextDocument.objects.all().delete()
+            while True:
+                chunk = list(units.filter(pk__gt=current)[:step])
+                if not chunk:
+                    break
+                for unit in chunk:
+                    current = unit.pk
+                    if unit.target:
+                        lang = unit.translation.language.code
+                        self.update_document(
+                            lang, get_target_unit_fields(unit)
+                        )
+                        name = 'target-%s' % lang
+                        counts[name] = counts.get(name, 0) + 1
+                    # Same string can be present in several components
+                    if unit.checksum in seen:
+                        continue
+                    seen.add(unit.checksum)
+                    self.update_document('', get_source_unit_fields(unit))
+
+        return [('source', len(seen))] + sorted(counts.items())
+
+    def clean(self):
+        from weblate.trans.models.search import FulltextDocument
+        FulltextDocument.objects.all().delete()
+
+    def get_areas(self, lang, params):
+        '''
+        Returns list of (language, fields) to search in.
+        '''
+        search = get_search_params(params)
+        areas = []
+        source = [field for field in self.source_fields if search[field]]
+        if source:
+            areas.append(('', source))
+        target = [field for field in self.target_fields if search[field]]
+        if target:
+            areas.append((lang, target))
+        return areas
+
+    def match_sql(self, terms, fields, operator='AND'):
+        '''
+        Returns SQL condition and params matching terms in given fields.
+        '''
+        engine = self.get_engine()
+        if engine == 'fts5':
+            match = ' {0} '.format(operator).join(
+                ['"{0}"'.format(term) for term in terms]
+            )
+            return (
+                'id IN (SELECT rowid FROM trans_fulltextdocument_fts '
+                'WHERE trans_fulltextdocument_fts MATCH %s)',
+                ['{{{0}}} : ({1})'.format(' '.join(fields), match)]
+            )
+        elif engine == 'postgresql':
+            match = ' {0} '.format('&' if operator == 'AND' else '|').join(
+                ["'{0}'".format(term) for term in terms]
+            )
+            return (
+                '({0})'.format(' OR '.join([
+                    'to_tsvector(\'simple\', {0}) @@ '
+                    'to_tsquery(\'simple\', %s)'.format(field)
+                    for field in fields
+                ])),
+                [match] * len(fields)
+            )
+        conditions = []
+        params = []
+        for term in terms:
+            conditions.append('({0})'.format(' OR '.join([
+                'UPPER({0}) LIKE UPPER(%s)'.format(field) for field in fields
+            ])))
+            params.extend(['%{0}%'.format(term)] * len(fields))
+        return (
+            '({0})'.format(' {0} '.format(operator).join(conditions)),
+            params
+        )
+
+    def rank_sql(self, terms, fields, operator='AND'):
+        '''
+        Returns SQL expression and params for relevance of a document.
+        '''
+        engine = self.get_engine()
+        if engine == 'fts5':
+            # The bm25 is computed for the fts table row matched by join_sql,
+            # so the rank can be used only together with it
+            return ('-bm25(trans_fulltextdocument_fts)', [])
+        elif engine == 'postgresql':
+            match = ' {0} '.format('&' if operator == 'AND' else '|').join(
+                ["'{0}'".format(term) for term in terms]
+            )
+            return (
+                'GREATEST({0})'.format(', '.join([
+                    'ts_rank(to_tsvector(\'simple\', {0}), '
+                    'to_tsquery(\'simple\', %s))'.format(field)
+                    for field in fields
+                ])),
+                [match] * len(fields)
+            )
+        return ('0', [])
+
+    def get_documents(self, query, lang, params):
+        '''
+        Returns queryset of documents matching the query.
+        '''
+        from weblate.trans.models.search import FulltextDocument
+        terms = get_search_terms(query)
+        areas = self.get_areas(lang, params)
+        if not terms or not areas:
+            return FulltextDocument.objects.none()
+        conditions = []
+        sql_params = []
+        for language, fields in areas:
+            sql, match_params = self.match_sql(terms, fields)
+            conditions.append('(language = %s AND {0})'.format(sql))
+            sql_params.append(language)
+            sql_params.extend(match_params)
+        return FulltextDocument.objects.extra(
+            where=[' OR '.join(conditions)],
+            params=sql_params,
+        )
+
+    def search(self, query, lang, params):
+        return set(
+            self.get_documents(query, lang, params).values_list(
+                'checksum', flat=True
+            )
+        )
+
+    def join_sql(self, terms, fields, operator='AND'):
+        '''
+        Returns joined tables, SQL condition and params matching terms in
+        given fields for ranking.
+
+        With FTS5 the fts table is joined, so that it is matched only once
+        for both condition and rank.
+        '''
+        if self.get_engine() == 'fts5':
+            match = ' {0} '.format(operator).join(
+                ['"{0}"'.format(term) for term in terms]
+            )
+            return (
+                ['trans_fulltextdocument_fts'],
+                'trans_fulltextdocument_fts.rowid = '
+                'trans_fulltextdocument.id AND '
+                'trans_fulltextdocument_fts MATCH %s',
+                ['{{{0}}} : ({1})'.format(' '.join(fields), match)]
+            )
+        match, match_params = self.match_sql(terms, fields, operator)
+        return [], match, match_params
+
+    def rank_area(self, terms, language, fields, top, operator='AND',
+                  exclude=None, units=None):
+        '''
+        Returns list of (checksum, score) for best matches in one area.
+
+        Documents can be restricted to units queryset, which is matched
+        in a subquery.
+        '''
+        from weblate.trans.models.search import FulltextDocument
+        tables, match, match_params = self.join_sql(terms, fields, operator)
+        rank, rank_params = self.rank_sql(terms, fields, operator)
+        where = ['trans_fulltextdocument.language = %s', match]
+        where_params = [language] + match_params
+        if exclude is not None:
+            where.append('trans_fulltextdocument.checksum != %s')
+            where_params.append(exclude)
+        documents = FulltextDocument.objects.extra(
+            select={'rank': rank},
+            select_params=rank_params,
+            tables=tables,
+            where=where,
+            params=where_params,
+            order_by=['-rank', 'checksum'],
+        )
+        if units is not None:
+            documents = documents.filter(
+                checksum__in=units.values('checksum')
+            )
+        documents = documents.values_list('checksum', 'rank')
+        if top is not None:
+            documents = documents[:top]
+        return list(documents)
+
+    def search_ranked(self, query, lang, params, offset=0, limit=None,
+                      units=None):
+        terms = get_search_terms(query)
+        if not terms:
+            return []
+
+        if limit is None:
+            top = None
+        else:
+            top = offset + limit
+
+        scores = {}
+        for language, fields in self.get_areas(lang, params):
+            for checksum, score in self.rank_area(terms, language, fields,
+                                                  top, units=units):
+                if score > scores.get(checksum, -1):
+                    scores[checksum] = score
+
+        ranked = sorted(
+            scores,
+            key=lambda checksum: (-scores[checksum], checksum)
+        )
+
+        if limit is None:
+            return ranked[offset:]
+        return ranked[offset:top]
+
+    def filter_units(self, units, query, lang, params):
+        '''
+        Filters units queryset by fulltext search.
+
+        The documents are matched in a subquery, so it is all done by
+        single SQL query.
+        '''
+        return units.filter(
+            checksum__in=self.get_documents(
+                query, lang, params
+            ).values('checksum')
+        )
+
+    def more_like(self, checksum, source, top=5):
+        '''
+        Finds similar units.
+
+        The documents sharing most of longer words with the source are
+        considered similar.
+        '''
+        terms = sorted(
+            set([term for term in get_search_terms(source) if len(term) > 2]),
+            key=lambda term: (-len(term), term)
+        )[:MORE_LIKE_TERMS]
+        if not terms:
+            return set()
+        return set([
+            result[0] for result in self.rank_area(
+                terms, '', ('source',), top, 'OR', checksum
+            )
+        ])
+
+    def get_checksums(self, lang, prefix):
+        from weblate.trans.models.search import FulltextDocument
+        return set(
+            FulltextDocument.objects.filter(
+                language=lang or '',
+                checksum__startswith=prefix,
+            ).values_list(
+                'checksum', flat=True
+            )
+        )
+
+    def delete_checksums(self, lang, checksums):
+        from weblate.trans.models.search import FulltextDocument
+        FulltextDocument.objects.filter(
+            language=lang or '',
+            checksum__in=checksums,
+        ).delete()
+
+
+def get_backend():
+    '''
+    Returns configured fulltext backend.
+    '''
+    path = appsettings.FULLTEXT_BACKEND
+    if path not in BACKENDS:
+        BACKENDS[path] = load_class(path, 'FULLTEXT_BACKEND')()
+    return BACKENDS[path]
+
+
+def update_index(units, source_units=None):
+    '''
+    Updates fulltext index for given set of units.
+    '''
+    get_backend().update_index(units, source_units)
+
+
+def index_units(units):
+    '''
+    Adds iterable of units to the fulltext index.
+    '''
+    get_backend().index_units(units)
+
+
+def rebuild_indexes(jobs=1, subprojects=None, clean=False):
+    '''
+    Rebuilds fulltext indexes.
+    '''
+    return get_backend().rebuild(jobs, subprojects, clean)
+
+
+def clean_indexes():
+    '''
+    Cleans all indexes.
+    '''
+    get_backend().clean()
+
+
+def optimize_indexes():
+    '''
+    Optimizes fulltext indexes.
+    '''
+    get_backend().optimize()
+
+
+def fulltext_search(query, lang, params):
+    '''
+    Performs fulltext search in given areas, returns set of checksums.
+    '''
+    return get_backend().search(query, lang, params)
+
+
+def fulltext_search_ranked(query, lang, params, offset=0, limit=None,
+                           units=None):
+    '''
+    Performs fulltext search in given areas, returns list of checksums
+    ordered by relevance.
+    '''
+    return get_backend().search_ranked(
+        query, lang, params, offset, limit, units
+    )
+
+
+def fulltext_filter(units, query, lang, params):
+    '''
+    Filters units queryset by fulltext search.
+    '''
+    return get_backend().filter_units(units, query, lang, params)
+
+
+def fulltext_count(units, query, lang, params):
+    '''
+    Counts units matching fulltext search.
+    '''
+    return get_backend().count_units(units, query, lang, params)
+
+
+def more_like(checksum, source, top=5):
+    '''
+    Finds similar units.
+    '''
+    return get_backend().more_like(checksum, source, top)
+
+
+def check_index(lang, prefix, repair=True):
+    '''
+    Compares index content with the database for checksums with given
+    prefix, returns tuple of number of missing and stale documents.
+
+    Missing documents are indexed and stale ones deleted when repairing.
+    Source index is checked when lang is None.
+    '''
+    from weblate.trans.models import Unit
+    backend = get_backend()
+
+    units = Unit.objects.filter(checksum__startswith=prefix)
+    if lang is not None:
+        units = units.filter(
+            translation__language__code=lang
+        ).exclude(
+            target=''
+        )
+    expected = set(units.values_list('checksum', flat=True).distinct())
+
+    stored = backend.get_checksums(lang, prefix)
+
+    missing = expected - stored
+    stale = stored - expected
+
+    if repair and missing:
+        missing = list(missing)
+        for start in range(0, len(missing), CHECK_INDEX_CHUNK):
+            chunk = units.filter(
+                checksum__in=missing[start:start + CHECK_INDEX_CHUNK]
+            )
+            if lang is None:
+                backend.update_index(Unit.objects.none(), chunk)
+            else:
+                backend.update_index(chunk, Unit.objects.none())
+
+    if repair and stale:
+        backend.delete_checksums(lang, stale)
+
+    return len(missing), len(stale)
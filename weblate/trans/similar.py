@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2012 - 2015 Michal Čihař <michal@cihar.com>
+#
+# This file is part of Weblate <https://weblate.org/>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+'''
+Pool of worker processes for similar strings lookups.
+
+The translation memory lookups can take long on big databases, so they run
+in separate processes where they can be limited by MT_WEBLATE_LIMIT without
+blocking the request.
+'''
+
+import atexit
+import multiprocessing
+import threading
+import time
+from django.core.signals import request_started
+from django.db import connections
+from django.dispatch import receiver
+from weblate import appsettings
+from weblate.trans.memory import memory_lookup
+
+# Machine translation service using the pool
+SIMILAR_SERVICE = 'weblate.trans.machine.weblatetm.WeblateSimilarTranslation'
+
+
+def init_worker():
+    '''
+    Prepares worker process for lookups.
+    '''
+    # Connections inherited from parent process can not be shared
+    for connection in connections.all():
+        connection.close()
+
+
+def similar_task(pk, top, deadline, submitted):
+    '''
+    Finds similar strings excluding exact matches.
+
+    Returns tuple of time spent waiting in the queue and list of unit ids
+    and similarity scores, the list is None if the request has expired
+    before being processed.
+    '''
+    from weblate.trans.models import Unit
+    started = time.time()
+    wait = started - submitted
+    if deadline is not None and started > deadline:
+        return wait, None
+
+    try:
+        unit = Unit.objects.select_related(
+            'translation__language'
+        ).get(pk=pk)
+    except Unit.DoesNotExist:
+        return wait, []
+
+    return wait, [
+        (match.pk, score) for match, score in memory_lookup(unit, top)
+    ]
+
+
+def stop_pool(pool):
+    '''
+    Terminates all workers of the pool.
+    '''
+    pool.terminate()
+    pool.join()
+
+
+class SimilarPool(object):
+    '''
+    Pre-forked pool of processes doing similarity lookups.
+
+    The pool is started before handling first HTTP request and kept
+    running. It can not be started inside transaction, the lookup is done
+    in the current process in that case. Every request has
+    deadline given by MT_WEBLATE_LIMIT, requests which were not started
+    before their deadline are skipped by the workers. The pool with
+    a worker overrunning the deadline is replaced by a new one.
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pool = None
+        self.requests = 0
+        self.timeouts = 0
+        self.recycled = 0
+        self.wait_time = 0.0
+        self.last_wait_time = 0.0
+
+    def get_pool(self):
+        '''
+        Returns worker pool, starting it if needed.
+
+        None is returned when the pool is not running and it can not be
+        started as database connections can not be closed in transaction.
+        '''
+        with self.lock:
+            if self.pool is None:
+                if any([c.in_atomic_block for c in connections.all()]):
+                    return None
+                # Workers have to open own database connections
+                for connection in connections.all():
+                    connection.close()
+                self.pool = multiprocessing.Pool(
+                    appsettings.MT_WEBLATE_WORKERS,
+                    init_worker
+                )
+            return self.pool
+
+    def terminate(self):
+        '''
+        Stops all workers.
+        '''
+        with self.lock:
+            if self.pool is not None:
+                self.pool.terminate()
+                self.pool.join()
+                self.pool = None
+
+    def recycle(self, pool):
+        '''
+        Replaces pool with a worker overrunning its deadline.
+
+        The old pool is terminated once all requests queued in it have
+        expired, new requests already go to the new pool.
+        '''
+        with self.lock:
+            if self.pool is not pool:
+                # Already replaced by other thread
+                return
+            self.pool = None
+            self.recycled += 1
+        timer = threading.Timer(
+            max(appsettings.MT_WEBLATE_LIMIT, 0),
+            stop_pool,
+            (pool,)
+        )
+        timer.daemon = True
+        timer.start()
+
+    def lookup(self, unit, top=5):
+        '''
+        Returns list of ids and similarity scores of translated units with
+        source similar to given one.
+
+        Raises exception if the lookup does not finish in MT_WEBLATE_LIMIT.
+        '''
+        limit = appsettings.MT_WEBLATE_LIMIT
+        pool = None
+        if limit >= 0:
+            pool = self.get_pool()
+        if pool is None:
+            return [
+                (match.pk, score) for match, score in memory_lookup(unit, top)
+            ]
+
+        submitted = time.time()
+        result = pool.apply_async(
+            similar_task,
+            (unit.pk, top, submitted + limit, submitted)
+        )
+
+        try:
+            wait, matches = result.get(limit)
+        except multiprocessing.TimeoutError:
+            # The worker might be still busy with this request
+            self.recycle(pool)
+            wait, matches = None, None
+
+        with self.lock:
+            self.requests += 1
+            if wait is not None:
+                self.last_wait_time = wait
+                self.wait_time += wait
+            if matches is None:
+                self.timeouts += 1
+
+        if matches is None:
+            raise Exception('Request timed out.')
+
+        return matches
+
+    def get_stats(self):
+        '''
+        Returns queue wait time and timeout information.
+        '''
+        with self.lock:
+            processed = self.requests - self.timeouts
+            if processed:
+                average = self.wait_time / processed
+            else:
+                average = 0.0
+            return {
+                'requests': self.requests,
+                'timeouts': self.timeouts,
+                'recycled': self.recycled,
+                'last_wait_time': self.last_wait_time,
+                'average_wait_time': average,
+            }
+
+
+SIMILAR_POOL = SimilarPool()
+atexit.register(SIMILAR_POOL.terminate)
+
+
+@receiver(request_started)
+def start_similar_pool(sender, **kwargs):
+    '''
+    Starts the pool before the request is handled, so that it is not
+    started later inside request transaction.
+    '''
+    if (appsettings.MT_WEBLATE_LIMIT >= 0 and
+            SIMILAR_SERVICE in appsettings.MACHINE_TRANSLATION_SERVICES):
+        SIMILAR_POOL.get_pool()
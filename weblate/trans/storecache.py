@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2012 - 2015 Michal Čihař <michal@cihar.com>
+#
+# This file is part of Weblate <https://weblate.org/>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+'''
+Cache of parsed translation files.
+
+Parsed translate-toolkit stores are pickled, compressed and stored in the
+DATA_DIR. The entries are keyed by file format, file name and Git compatible
+blob hash of the file content, so changed file is never loaded from the
+cache.
+'''
+
+import cPickle
+import hashlib
+import os
+import threading
+import time
+import zlib
+from django.utils.encoding import force_bytes
+from translate.storage.lisa import LISAfile
+from weblate import appsettings
+from weblate.trans.data import data_dir
+
+
+def get_blob_hash(data):
+    '''
+    Returns Git compatible hash of blob content.
+    '''
+    objhash = hashlib.sha1()
+    objhash.update('blob {0}\0'.format(len(data)))
+    objhash.update(data)
+    return objhash.hexdigest()
+
+
+class StoreCache(object):
+    '''
+    On-disk cache of parsed stores.
+
+    Least recently used entries are removed once the cache grows over
+    STORE_CACHE_SIZE bytes. Stores which can not be pickled (for example
+    the XML based ones) are always parsed.
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.uncacheable = 0
+        self.saved_time = 0.0
+
+    def get_path(self, fileformat, filename):
+        '''
+        Returns path to cache entry for given file.
+        '''
+        with open(filename, 'rb') as handle:
+            blob_hash = get_blob_hash(handle.read())
+        name_hash = hashlib.sha1(
+            force_bytes(os.path.abspath(filename))
+        ).hexdigest()
+        return os.path.join(
+            data_dir('stores'),
+            '{0}-{1}-{2}'.format(fileformat.format_id, name_hash, blob_hash)
+        )
+
+    def load(self, fileformat, storefile):
+        '''
+        Returns parsed store, using cached one if available.
+        '''
+        if (appsettings.STORE_CACHE_SIZE <= 0 or
+                not isinstance(storefile, basestring)):
+            return fileformat.parse_store(storefile)
+
+        start = time.time()
+        path = self.get_path(fileformat, storefile)
+
+        try:
+            with open(path, 'rb') as handle:
+                parse_time, store = cPickle.loads(
+                    zlib.decompress(handle.read())
+                )
+            # Mark as recently used
+            os.utime(path, None)
+        except IOError:
+            # Not cached
+            pass
+        except Exception:
+            # Corrupted or incompatible entry
+            self.remove(path)
+        else:
+            with self.lock:
+                self.hits += 1
+                self.saved_time += max(0.0, parse_time - time.time() + start)
+            return store
+
+        store = fileformat.parse_store(storefile)
+        parse_time = time.time() - start
+
+        with self.lock:
+            self.misses += 1
+
+        self.save(path, parse_time, store)
+
+        return store
+
+    def save(self, path, parse_time, store):
+        '''
+        Stores parsed store in the cache.
+        '''
+        # The lxml elements are silently pickled as invalid objects
+        if isinstance(store, LISAfile):
+            with self.lock:
+                self.uncacheable += 1
+            return
+
+        try:
+            data = zlib.compress(
+                cPickle.dumps((parse_time, store), cPickle.HIGHEST_PROTOCOL)
+            )
+        except Exception:
+            # Store can not be pickled
+            with self.lock:
+                self.uncacheable += 1
+            return
+
+        directory = os.path.dirname(path)
+        temp = '{0}.{1}.tmp'.format(path, os.getpid())
+        try:
+            if not os.path.exists(directory):
+                os.makedirs(directory)
+            with open(temp, 'wb') as handle:
+                handle.write(data)
+            # Atomic replace, readers never see partial entry
+            os.rename(temp, path)
+        except (IOError, OSError):
+            self.remove(temp)
+            return
+
+        self.evict(path)
+
+    def remove(self, path):
+        '''
+        Removes cache entry, ignoring errors.
+        '''
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+    def evict(self, current):
+        '''
+        Removes outdated entries for the current file and least recently
+        used entries to fit into STORE_CACHE_SIZE.
+        '''
+        directory, current_name = os.path.split(current)
+        prefix = current_name.rsplit('-', 1)[0] + '-'
+        entries = []
+        total = 0
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if name.startswith(prefix) and name != current_name:
+                # Older content of same file
+                self.remove(path)
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+        entries.sort()
+        for dummy, size, path in entries:
+            if total <= appsettings.STORE_CACHE_SIZE:
+                break
+            self.remove(path)
+            total -= size
+
+    def get_stats(self):
+        '''
+        Returns hit rate and saved time information.
+        '''
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'uncacheable': self.uncacheable,
+                'saved_time': self.saved_time,
+            }
+
+
+STORE_CACHE = StoreCache()
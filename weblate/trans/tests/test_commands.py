@@ -22,15 +22,26 @@
 Tests for management commands.
 """
 
-from django.test import TestCase
-from weblate.trans.tests.test_models import RepoTestCase
-from weblate.trans.models import SubProject, Suggestion
+from StringIO import StringIO
+import os
+from django.test import TestCase, TransactionTestCase
+from weblate.trans.tests.test_models import (
+    RepoTestCase, RepoTestMixin, ThreadPoolMixin,
+)
+from weblate.trans.models import SubProject, Suggestion, IndexUpdate, Unit
 from django.core.management import call_command
 from django.core.management.base import CommandError
 from django.contrib.auth.models import User
 from weblate.runner import main
 from weblate.trans.tests.utils import get_test_file
 from weblate.accounts.models import Profile
+from weblate.trans import search
+from weblate.trans.search import (
+    get_source_index, get_target_index, clean_indexes, update_index_unit,
+    fulltext_search, INDEX_QUEUE,
+)
+from weblate.trans.data import data_dir
+from weblate.trans.tests import OverrideSettings
 
 TEST_PO = get_test_file('cs.po')
 
@@ -291,6 +302,67 @@ class PeriodicCommandTest(RepoTestCase):
             'update_index'
         )
 
+    def test_update_index_pending(self):
+        IndexUpdate.objects.create(
+            unit=Unit.objects.all()[0],
+        )
+        self.assertGreaterEqual(IndexUpdate.objects.get_lag(), 0)
+        output = StringIO()
+        call_command(
+            'update_index',
+            verbosity=2,
+            stdout=output
+        )
+        self.assertEqual(IndexUpdate.objects.count(), 0)
+        self.assertIn('Indexed 1 updates, backlog 0', output.getvalue())
+        self.assertEqual(IndexUpdate.objects.get_lag(), 0)
+
+    def test_update_index_claim(self):
+        for unit in Unit.objects.all()[:2]:
+            IndexUpdate.objects.create(unit=unit, source=False)
+        token, claimed = IndexUpdate.objects.claim(1)
+        self.assertEqual(len(claimed), 1)
+
+        # Other worker does not get claimed update
+        other, other_claimed = IndexUpdate.objects.claim(10)
+        self.assertEqual(len(other_claimed), 1)
+        self.assertNotEqual(claimed[0].pk, other_claimed[0].pk)
+        self.assertEqual(IndexUpdate.objects.claim(10)[1], [])
+
+        # Change of unit being indexed releases the claim
+        with OverrideSettings(OFFLOAD_INDEXING=True):
+            update_index_unit(claimed[0].unit)
+        IndexUpdate.objects.filter(worker=token).delete()
+        self.assertEqual(IndexUpdate.objects.count(), 2)
+        token, claimed = IndexUpdate.objects.claim(10)
+        self.assertEqual(len(claimed), 1)
+        self.assertTrue(claimed[0].source)
+
+        # Released updates can be claimed again
+        IndexUpdate.objects.release(other)
+        self.assertEqual(len(IndexUpdate.objects.claim(10)[1]), 1)
+
+    def test_check_index(self):
+        clean_indexes()
+        output = StringIO()
+        call_command(
+            'check_index',
+            dry_run=True,
+            stdout=output
+        )
+        self.assertNotIn('Found 0 differences', output.getvalue())
+        call_command(
+            'check_index',
+            stdout=StringIO()
+        )
+        output = StringIO()
+        call_command(
+            'check_index',
+            dry_run=True,
+            stdout=output
+        )
+        self.assertIn('Found 0 differences', output.getvalue())
+
     def test_list_checks(self):
         call_command(
             'list_ignored_checks'
@@ -373,11 +445,27 @@ class PushGitTest(CheckGitTest):
 class LoadTest(CheckGitTest):
     command_name = 'loadpo'
 
+    def test_jobs(self):
+        # Runs sequentially as tests are wrapped in transaction
+        self.do_test(
+            'test/test',
+            force=True,
+            jobs=2,
+        )
+        self.assertEqual(
+            SubProject.objects.get(slug='test').translation_set.count(),
+            3
+        )
+
 
 class UpdateChecksTest(CheckGitTest):
     command_name = 'updatechecks'
 
 
+class UpdateStatsTest(CheckGitTest):
+    command_name = 'updatestats'
+
+
 class UpdateGitTest(CheckGitTest):
     command_name = 'updategit'
 
@@ -391,6 +479,67 @@ class RebuildIndexTest(CheckGitTest):
             clean=True,
         )
 
+    def test_jobs(self):
+        self.do_test(
+            'test',
+            jobs=1,
+        )
+
+    def test_jobs_clean(self):
+        self.do_test(
+            all=True,
+            clean=True,
+            jobs=1,
+        )
+        self.assertTrue(
+            get_source_index().doc_count() > 0
+        )
+        self.assertTrue(
+            get_target_index('cs').doc_count() > 0
+        )
+
+
+class RebuildIndexJobsTest(ThreadPoolMixin, RepoTestMixin,
+                           TransactionTestCase):
+    """
+    Rebuilding indexes by pool of processes.
+    """
+    def setUp(self):
+        super(RebuildIndexJobsTest, self).setUp()
+        self.create_subproject()
+
+    def test_jobs_clean(self):
+        call_command('rebuild_index', all=True, clean=True, jobs=2)
+        self.assertTrue(os.path.islink(data_dir('whoosh')))
+        self.assertTrue(get_source_index().doc_count() > 0)
+        self.assertTrue(get_target_index('cs').doc_count() > 0)
+        # Rebuild again replaces versioned directory
+        previous = os.path.realpath(data_dir('whoosh'))
+        call_command('rebuild_index', all=True, clean=True, jobs=2)
+        self.assertNotEqual(previous, os.path.realpath(data_dir('whoosh')))
+        self.assertTrue(get_source_index().doc_count() > 0)
+
+    def test_jobs_replay(self):
+        unit = Unit.objects.filter(translation__language__code='cs')[0]
+        build_index = search.build_index
+
+        def edit_build_index(params):
+            result = build_index(params)
+            if params[1] is None:
+                # Edit done by other process during the rebuild
+                unit.source = 'Rebuildedit'
+                INDEX_QUEUE.add(unit)
+                INDEX_QUEUE.flush()
+            return result
+
+        self.addCleanup(setattr, search, 'build_index', build_index)
+        search.build_index = edit_build_index
+        call_command('rebuild_index', all=True, clean=True, jobs=2)
+        self.assertEqual(
+            fulltext_search('Rebuildedit', 'cs', {'source': True}),
+            set([unit.checksum])
+        )
+
 
 class LockTranslationTest(CheckGitTest):
     command_name = 'lock_translation'
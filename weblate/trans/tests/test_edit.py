@@ -23,11 +23,16 @@ Tests for translation views.
 """
 
 import time
+from datetime import timedelta
 
 from django.core.urlresolvers import reverse
+from django.core.management import call_command
+from django.utils import timezone
 
+from weblate.trans.tests import OverrideSettings
 from weblate.trans.tests.test_views import ViewTestCase
-from weblate.trans.models import Change
+from weblate.trans.models import Change, PendingUnit
+from weblate.trans.writebehind import WRITE_BEHIND_QUEUE
 
 
 class EditTest(ViewTestCase):
@@ -442,6 +447,82 @@ class EditTSMonoTest(EditTest):
         return self.create_ts_mono()
 
 
+class EditWriteBehindTest(ViewTestCase):
+    '''
+    Tests for delayed writing of translation files.
+    '''
+    @OverrideSettings(WRITE_BEHIND_DELAY=3600)
+    def test_edit(self):
+        self.edit_unit(
+            'Hello, world!\n',
+            'Nazdar svete!\n'
+        )
+        unit = self.get_unit()
+        self.assertEqual(unit.target, 'Nazdar svete!\n')
+        self.assertTrue(unit.translated)
+        # File is not written yet
+        self.assertBackend(0)
+        self.assertEqual(PendingUnit.objects.count(), 1)
+
+        # Write pending edits
+        translation = self.get_translation()
+        WRITE_BEHIND_QUEUE.flush(translation.pk)
+        self.assertBackend(1)
+        self.assertFalse(PendingUnit.objects.exists())
+
+        # Commit does not need to write anything
+        translation.commit_pending(None)
+        self.assertFalse(translation.repo_needs_commit())
+
+    @OverrideSettings(WRITE_BEHIND_DELAY=3600)
+    def test_commit_locked(self):
+        self.edit_unit(
+            'Hello, world!\n',
+            'Nazdar svete!\n'
+        )
+        translation = self.get_translation()
+        lock = translation.subproject.repository_lock
+        with lock:
+            translation.commit_pending(None)
+            # Nested flush keeps the lock
+            self.assertTrue(lock.is_locked)
+        self.assertFalse(lock.is_locked)
+        self.assertBackend(1)
+        WRITE_BEHIND_QUEUE.flush(translation.pk)
+
+    @OverrideSettings(WRITE_BEHIND_DELAY=3600)
+    def test_stale(self):
+        self.edit_unit(
+            'Hello, world!\n',
+            'Nazdar svete!\n'
+        )
+        # Process ended without writing the edit
+        WRITE_BEHIND_QUEUE.timers.pop(self.get_translation().pk).cancel()
+
+        call_command('commit_pending', all=True, age=0, verbosity=0)
+        self.assertBackend(0)
+
+        PendingUnit.objects.update(
+            timestamp=timezone.now() - timedelta(hours=2)
+        )
+        call_command('commit_pending', all=True, age=0, verbosity=0)
+        self.assertBackend(1)
+        self.assertFalse(PendingUnit.objects.exists())
+
+    @OverrideSettings(WRITE_BEHIND_DELAY=3600)
+    def test_download(self):
+        self.edit_unit(
+            'Hello, world!\n',
+            'Nazdar svete!\n'
+        )
+        response = self.client.get(
+            reverse('download_translation', kwargs=self.kw_translation)
+        )
+        self.assertContains(response, 'Nazdar svete!')
+        self.assertFalse(PendingUnit.objects.exists())
+        WRITE_BEHIND_QUEUE.flush(self.get_translation().pk)
+
+
 class ZenViewTest(ViewTestCase):
     def test_zen(self):
         response = self.client.get(
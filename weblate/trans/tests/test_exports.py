@@ -58,6 +58,17 @@ class ExportsViewTest(ViewTestCase):
         )
         parsed = json.loads(response.content)
         self.assertEqual(parsed[0]['name'], 'Czech')
+        self.assertIsNone(parsed[0]['last_author'])
+
+    def test_export_stats_changed(self):
+        self.edit_unit('Hello, world!\n', 'Nazdar svete!\n')
+        response = self.client.get(
+            reverse('export_stats', kwargs=self.kw_subproject)
+        )
+        parsed = json.loads(response.content)
+        self.assertEqual(parsed[0]['last_author'], self.user.first_name)
+        self.assertEqual(parsed[0]['translated'], 1)
+        self.assertIsNotNone(parsed[0]['last_change'])
 
     def test_export_stats_jsonp(self):
         response = self.client.get(
@@ -38,15 +38,40 @@ class LockTest(TestCase):
 
     def test_lock_twice(self):
         '''
-        Basic locking test.
+        Nested locking test.
         '''
         lock = FileLock('lock-test')
         lock.acquire()
         lock.acquire()
         self.assertTrue(lock.is_locked)
         lock.release()
+        self.assertTrue(lock.is_locked)
+        self.assertTrue(lock.check_lock())
+        lock.release()
         self.assertFalse(lock.is_locked)
 
+    def test_context_nested(self):
+        '''
+        Test of nested context handling.
+        '''
+        lock = FileLock('lock-test')
+        with lock:
+            with lock:
+                self.assertTrue(lock.is_locked)
+            self.assertTrue(lock.check_lock())
+        self.assertFalse(lock.check_lock())
+
+    def test_release_force(self):
+        '''
+        Forced release of nested lock.
+        '''
+        lock = FileLock('lock-test')
+        lock.acquire()
+        lock.acquire()
+        lock.release(True)
+        self.assertFalse(lock.is_locked)
+        self.assertFalse(lock.check_lock())
+
     def test_lock_invalid(self):
         '''
         Basic locking test.
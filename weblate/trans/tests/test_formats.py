@@ -27,7 +27,7 @@ from django.test import SimpleTestCase
 from weblate.trans.formats import (
     AutoFormat, PoFormat, AndroidFormat, PropertiesFormat,
     JSONFormat, RESXFormat, PhpFormat, XliffFormat, TSFormat,
-    FILE_FORMATS,
+    FILE_FORMATS, get_store_index,
 )
 from weblate.trans.tests.utils import get_test_file
 from translate.storage.po import pofile
@@ -166,6 +166,50 @@ class AutoFormatTest(SimpleTestCase):
         )
 
 
+class StoreIndexTest(SimpleTestCase):
+    def test_shared_template(self):
+        self.assertIs(
+            PropertiesFormat.load_template(TEST_PROPERTIES),
+            PropertiesFormat.load_template(TEST_PROPERTIES),
+        )
+
+    def test_index(self):
+        index = get_store_index(PropertiesFormat.load(TEST_PROPERTIES))
+        self.assertEqual(index.find('CANCEL').source, 'Cancel')
+        self.assertEqual(index.get_position('CANCEL'), 5)
+        self.assertIsNone(index.find('NONEXISTING'))
+
+    def test_add(self):
+        testfile = tempfile.NamedTemporaryFile(suffix='.properties')
+        try:
+            testfile.write('CANCEL=Zrusit\nIGNORE=\n')
+            testfile.flush()
+            template = PropertiesFormat.load_template(TEST_PROPERTIES)
+            storage = PropertiesFormat(testfile.name, template)
+
+            # Empty translation is found
+            unit, add = storage.find_unit('IGNORE', '')
+            self.assertFalse(add)
+
+            unit, add = storage.find_unit('REPLACE', '')
+            self.assertTrue(add)
+            unit.set_target('Zmenit')
+            storage.add_unit(unit)
+
+            # Template is not modified
+            self.assertEqual(
+                get_store_index(template).find('REPLACE').source,
+                'Change'
+            )
+
+            # Added unit is found
+            unit, add = storage.find_unit('REPLACE', '')
+            self.assertFalse(add)
+            self.assertEqual(unit.get_target(), 'Zmenit')
+        finally:
+            testfile.close()
+
+
 class XMLMixin(object):
     def assert_same(self, newdata, testdata):
         self.assertXMLEqual(newdata, testdata)
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2012 - 2015 Michal Čihař <michal@cihar.com>
+#
+# This file is part of Weblate <https://weblate.org/>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Tests for translation memory.
+"""
+
+from unittest import TestCase
+from weblate.trans.memory import (
+    get_bands, get_similarity, get_ngrams, update_memory_unit, memory_lookup,
+    MIN_SCORE,
+)
+from weblate.trans.machine.weblatetm import WeblateSimilarTranslation
+from weblate.trans.models import Unit, SimilarityBand
+from weblate.trans.tests import OverrideSettings
+from weblate.trans.tests.test_models import RepoTestCase
+
+
+class MemoryTest(TestCase):
+    def test_ngrams(self):
+        self.assertEqual(get_ngrams('Ab'), set(['ab']))
+        self.assertEqual(get_ngrams('Abcd'), set(['abc', 'bcd']))
+        self.assertEqual(get_ngrams('a  B c'), get_ngrams('a b c'))
+
+    def test_bands(self):
+        self.assertEqual(
+            get_bands('Hello, world!'),
+            get_bands('hello,  world!')
+        )
+        self.assertEqual(len(get_bands('Hello, world!')), 8)
+        self.assertTrue(
+            set(get_bands('Thank you for using Weblate.')) &
+            set(get_bands('Thank you for using Weblate!'))
+        )
+
+    def test_similarity(self):
+        self.assertEqual(get_similarity('Hello', 'hello'), 100)
+        self.assertLess(get_similarity('Hello', 'Bye'), 50)
+        self.assertLess(
+            get_similarity('Hello, world!', 'Hello, Weblate!'),
+            100
+        )
+
+
+class MemoryLookupTest(RepoTestCase):
+    def setUp(self):
+        super(MemoryLookupTest, self).setUp()
+        translation = self.create_subproject().translation_set.get(
+            language_code='cs'
+        )
+        self.unit = translation.unit_set.get(
+            source='Thank you for using Weblate.'
+        )
+        self.unit.translated = True
+        Unit.objects.filter(pk=self.unit.pk).update(translated=True)
+        update_memory_unit(self.unit)
+        # Lookup for similar string, using other unit of the translation
+        self.other = translation.unit_set.get(source='Hello, world!\n')
+        self.other.source = 'Thank you for using Weblate!'
+
+    def test_update(self):
+        bands = SimilarityBand.objects.filter(unit=self.unit)
+        self.assertEqual(
+            bands.count(),
+            len(set(get_bands('Thank you for using Weblate.')))
+        )
+        self.unit.translated = False
+        update_memory_unit(self.unit)
+        self.assertFalse(bands.exists())
+
+    def test_lookup(self):
+        result = memory_lookup(self.other)
+        self.assertEqual(len(result), 1)
+        unit, score = result[0]
+        self.assertEqual(unit, self.unit)
+        self.assertEqual(
+            score,
+            get_similarity(
+                'Thank you for using Weblate.',
+                'Thank you for using Weblate!'
+            )
+        )
+        self.assertGreaterEqual(score, MIN_SCORE)
+        self.assertLess(score, 100)
+
+    def test_lookup_same(self):
+        # Exact match is not considered similar
+        self.other.source = self.unit.source
+        self.assertEqual(memory_lookup(self.other), [])
+
+    def test_lookup_deleted(self):
+        bands = SimilarityBand.objects.filter(unit_id=self.unit.pk)
+        self.assertTrue(bands.exists())
+        self.unit.delete()
+        self.assertFalse(bands.exists())
+        self.assertEqual(memory_lookup(self.other), [])
+
+    @OverrideSettings(MT_WEBLATE_LIMIT=-1)
+    def test_more_like_this_no_fork(self):
+        self.assertEqual(
+            Unit.objects.more_like_this(self.other),
+            memory_lookup(self.other)
+        )
+
+    @OverrideSettings(MT_WEBLATE_LIMIT=-1)
+    def test_machine(self):
+        score = memory_lookup(self.other)[0][1]
+        self.assertEqual(
+            WeblateSimilarTranslation().download_translations(
+                'cs', self.other.source, self.other, None
+            ),
+            [(
+                self.unit.target,
+                score,
+                'Weblate (Test/Test)',
+                self.unit.source,
+            )]
+        )
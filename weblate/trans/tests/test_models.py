@@ -22,22 +22,31 @@
 Tests for translation models.
 """
 
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase
+from django.db import (
+    connection, connections, transaction, DEFAULT_DB_ALIAS, IntegrityError,
+)
+from django.db.models import F
 from django.conf import settings
 from django.utils import timezone
 from django.contrib.auth.models import Permission, User
 from django.core.exceptions import ValidationError
+from django.core.urlresolvers import reverse
 import shutil
 import os
+import multiprocessing
+import multiprocessing.dummy
 from weblate.trans.models import (
     Project, SubProject, Source, Unit, WhiteboardMessage, Check, Suggestion,
-    get_related_units,
+    StatsRollup, Change, get_related_units,
 )
 from weblate import appsettings
 from weblate.trans.tests import OverrideSettings
 from weblate.trans.tests.utils import get_test_file
 from weblate.trans.vcs import GitRepository, HgRepository
-from weblate.trans.search import clean_indexes
+from weblate.trans.search import clean_indexes, INDEX_QUEUE
+from weblate.trans.similar import SIMILAR_POOL, SIMILAR_SERVICE
+from weblate.trans.memory import update_memory_unit
 
 REPOWEB_URL = \
     'https://github.com/nijel/weblate-test/blob/master/%(file)s#L%(line)s'
@@ -45,9 +54,9 @@ GIT_URL = 'git://github.com/nijel/weblate-test.git'
 HG_URL = 'https://nijel@bitbucket.org/nijel/weblate-test'
 
 
-class RepoTestCase(TestCase):
+class RepoTestMixin(object):
     """
-    Generic class for tests working with repositories.
+    Mixin for tests working with repositories.
     """
     def setUp(self):
         # Path where to clone remote repo for tests
@@ -299,6 +308,12 @@ class RepoTestCase(TestCase):
         )
 
 
+class RepoTestCase(RepoTestMixin, TestCase):
+    """
+    Generic class for tests working with repositories.
+    """
+
+
 class ProjectTest(RepoTestCase):
     """
     Project object testing.
@@ -826,6 +841,60 @@ class SubProjectTest(RepoTestCase):
         self.assertEqual(subproject.project.suggestion_set.count(), 1)
 
 
+class ThreadPoolMixin(object):
+    """
+    Mixin for tests using pool of processes.
+    """
+    def setUp(self):
+        super(ThreadPoolMixin, self).setUp()
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db(
+                connection.settings_dict['NAME']):
+            # Forked processes would not see in memory database, use worker
+            # thread sharing the connection instead
+            self.addCleanup(
+                setattr, multiprocessing, 'Pool', multiprocessing.Pool
+            )
+            multiprocessing.Pool = self.get_thread_pool
+
+    def get_thread_pool(self, processes):
+        db_connection = connections[DEFAULT_DB_ALIAS]
+        db_connection.allow_thread_sharing = True
+        self.addCleanup(setattr, db_connection, 'allow_thread_sharing', False)
+        return multiprocessing.dummy.Pool(
+            1, connections.__setitem__, (DEFAULT_DB_ALIAS, db_connection)
+        )
+
+
+class ParallelLoadTest(ThreadPoolMixin, RepoTestMixin, TransactionTestCase):
+    """
+    Loading translations by pool of processes.
+    """
+    def test_jobs(self):
+        subproject = self.create_subproject()
+        units = Unit.objects.filter(translation__subproject=subproject)
+        count = units.count()
+        subproject.translation_set.all().delete()
+        subproject.create_translations(force=True, jobs=2)
+        self.assertEqual(subproject.translation_set.count(), 3)
+        self.assertEqual(units.count(), count)
+        # Workers write queued index updates
+        self.assertEqual(len(INDEX_QUEUE), 0)
+
+    def test_jobs_transaction(self):
+        subproject = self.create_subproject()
+        original = multiprocessing.Pool
+
+        def fail(*args, **kwargs):
+            raise AssertionError('Pool should not be used')
+
+        self.addCleanup(setattr, multiprocessing, 'Pool', original)
+        multiprocessing.Pool = fail
+        with transaction.atomic():
+            subproject.create_translations(force=True, jobs=2)
+        subproject.create_translations(force=True)
+        self.assertEqual(subproject.translation_set.count(), 3)
+
+
 class TranslationTest(RepoTestCase):
     """
     Translation testing.
@@ -837,6 +906,98 @@ class TranslationTest(RepoTestCase):
         self.assertEqual(translation.total, 4)
         self.assertEqual(translation.fuzzy, 0)
 
+    def test_sync_units(self):
+        project = self.create_subproject()
+        translation = project.translation_set.get(language_code='cs')
+        units = set(translation.unit_set.values_list('pk', flat=True))
+        self.assertEqual(
+            Source.objects.filter(subproject=project).count(),
+            4
+        )
+        # Forced resync keeps existing units
+        translation.check_sync(force=True)
+        self.assertEqual(
+            units,
+            set(translation.unit_set.values_list('pk', flat=True))
+        )
+        # Removed units are created again
+        translation.unit_set.all()[0].delete()
+        translation.check_sync(force=True)
+        self.assertEqual(translation.unit_set.count(), 4)
+        self.assertEqual(translation.total, 4)
+        self.assertFalse(translation.unit_set.filter(num_words=0).exists())
+
+    def test_delete_stale_consistency(self):
+        project = self.create_subproject()
+        other = SubProject.objects.create(
+            name='Test 2',
+            slug='test-2',
+            project=project.project,
+            repo=self.git_repo_path,
+            push=self.git_repo_path,
+            filemask='po/*.po',
+            file_format='po',
+            repoweb=REPOWEB_URL,
+        )
+        source = 'Hello, world!\n'
+        units = []
+        for target, subproject in (('Ahoj', project), ('Nazdar', other)):
+            unit = Unit.objects.get(
+                translation__subproject=subproject,
+                translation__language_code='cs',
+                source=source,
+            )
+            Unit.objects.filter(pk=unit.pk).update(
+                target=target, translated=True
+            )
+            units.append(Unit.objects.get(pk=unit.pk))
+        units[0].run_checks()
+        checks = Check.objects.filter(
+            check='inconsistent', contentsum=units[0].contentsum
+        )
+        self.assertTrue(checks.exists())
+        # Removing one of the translations makes remaining one consistent
+        Unit.objects.delete_stale(units[1].translation, [units[1]])
+        self.assertFalse(checks.exists())
+
+    def test_new_source_changes(self):
+        project = self.create_subproject()
+        changes = Change.objects.filter(action=Change.ACTION_NEW_SOURCE)
+        self.assertEqual(changes.count(), 4)
+        # Bulk created changes are shown in component history
+        self.assertEqual(changes.filter(subproject=project).count(), 4)
+
+    def test_move_units(self):
+        project = self.create_subproject()
+        translation = project.translation_set.get(language_code='cs')
+        positions = list(translation.unit_set.values_list('pk', 'position'))
+        # Shift all units as if string was removed from the file
+        translation.unit_set.update(position=F('position') + 1)
+        translation.check_sync(force=True)
+        self.assertEqual(
+            positions,
+            list(translation.unit_set.values_list('pk', 'position'))
+        )
+
+    def test_delete_stale(self):
+        project = self.create_subproject()
+        source = 'Try Weblate at <http://demo.weblate.org/>!\n'
+        self.assertTrue(Check.objects.filter(language__code='de').exists())
+        for translation in project.translation_set.all():
+            unit = translation.unit_set.get(source=source)
+            Unit.objects.delete_stale(translation, [unit])
+            self.assertFalse(translation.unit_set.filter(pk=unit.pk).exists())
+            if translation.language_code == 'de':
+                self.assertFalse(
+                    Check.objects.filter(language__code='de').exists()
+                )
+            # Source is kept while used by any translation
+            self.assertEqual(
+                Source.objects.filter(checksum=unit.checksum).exists(),
+                Unit.objects.filter(checksum=unit.checksum).exists()
+            )
+        self.assertFalse(Check.objects.exists())
+
     def test_extra_file(self):
         """
         Test extra commit file handling.
@@ -890,6 +1051,168 @@ class TranslationTest(RepoTestCase):
         translation.unit_set.all().delete()
         translation.update_stats()
 
+    def test_update_checks(self):
+        """
+        Batch checks update.
+        """
+        project = self.create_subproject()
+        translation = project.translation_set.get(language_code='cs')
+        unit = translation.unit_set.get(source='Hello, world!\n')
+        translation.unit_set.filter(pk=unit.pk).update(
+            target='Ahoj svete', translated=True
+        )
+        unit = translation.unit_set.get(pk=unit.pk)
+        Unit.objects.update_checks(translation, [(unit, False, False)])
+        self.assertTrue(unit.checks().filter(check='end_newline').exists())
+        self.assertTrue(unit.has_failing_check)
+        unit = translation.unit_set.get(pk=unit.pk)
+        self.assertTrue(unit.has_failing_check)
+        translation = project.translation_set.get(language_code='cs')
+        self.assertEqual(translation.failing_checks, 1)
+
+        # Fixed translation removes the checks
+        unit.target = 'Ahoj svete!\n'
+        Unit.objects.update_checks(translation, [(unit, True, False)])
+        self.assertFalse(unit.checks().exists())
+        unit = translation.unit_set.get(pk=unit.pk)
+        self.assertFalse(unit.has_failing_check)
+
+    def test_stats_delta(self):
+        """
+        Incremental stats update and reconciliation.
+        """
+        project = self.create_subproject()
+        translation = project.translation_set.get(language_code='cs')
+        unit = translation.unit_set.get(source='Hello, world!\n')
+        unit.translated = True
+        unit.has_comment = True
+        unit.update_translation_stats()
+        self.assertEqual(translation.translated, 1)
+        self.assertEqual(translation.translated_words, unit.num_words)
+        self.assertEqual(translation.have_comment, 1)
+
+        # Counters are updated in the database
+        translation = project.translation_set.get(language_code='cs')
+        self.assertEqual(translation.translated, 1)
+        self.assertEqual(translation.total, 4)
+
+        # Applying same state again does nothing
+        unit.update_translation_stats()
+        translation = project.translation_set.get(language_code='cs')
+        self.assertEqual(translation.translated, 1)
+
+        # Reconciliation counts units, which were not saved
+        self.assertTrue(translation.reconcile_stats())
+        self.assertEqual(translation.translated, 0)
+        self.assertEqual(translation.have_comment, 0)
+        self.assertFalse(translation.reconcile_stats())
+        translation = project.translation_set.get(language_code='cs')
+        self.assertEqual(translation.translated, 0)
+
+    def test_rollups(self):
+        """
+        Project, component and language statistics rollups.
+        """
+        component = self.create_subproject()
+        translations = component.translation_set.count()
+        translated = sum([
+            item.translated for item in component.translation_set.all()
+        ])
+        translation = component.translation_set.get(language_code='cs')
+        rollup = StatsRollup.objects.get_rollup(subproject=component)
+        self.assertEqual(rollup.translations, translations)
+        self.assertEqual(rollup.total, 4 * translations)
+        self.assertEqual(rollup.translated, translated)
+        self.assertEqual(component.project.get_total(), 4)
+        self.assertEqual(
+            component.project.get_language_count(), translations
+        )
+        self.assertEqual(
+            set(component.project.get_languages()),
+            set([item.language for item in component.translation_set.all()])
+        )
+
+        # Strings in translations not in sync are averaged
+        StatsRollup.objects.add_delta(translation, {'total': translations})
+        self.assertEqual(component.project.get_total(), 5)
+        StatsRollup.objects.add_delta(translation, {'total': -translations})
+
+        # Edit is reflected in all levels
+        unit = translation.unit_set.filter(translated=False)[0]
+        unit.translated = True
+        unit.update_translation_stats()
+        percents = component.translation_set.get(
+            language_code='cs'
+        ).get_percents()
+        self.assertEqual(
+            StatsRollup.objects.get_percents(
+                component.project, language=translation.language
+            ),
+            percents
+        )
+        self.assertEqual(
+            StatsRollup.objects.get_percents(language=translation.language),
+            percents
+        )
+        self.assertEqual(
+            StatsRollup.objects.get_rollup(subproject=component).translated,
+            translated + 1
+        )
+
+        # Rebuild matches incremental updates
+        StatsRollup.objects.rebuild()
+        self.assertEqual(
+            StatsRollup.objects.get_rollup(component.project).translated,
+            translated + 1
+        )
+
+        # Removed translations are not counted
+        component.delete()
+        rollup = StatsRollup.objects.get_rollup(
+            language=translation.language
+        )
+        self.assertEqual(rollup.translations, 0)
+        self.assertEqual(rollup.translated, 0)
+
+    def test_rollups_concurrent(self):
+        """
+        Rollup created concurrently by other process.
+        """
+        component = self.create_subproject()
+        translation = component.translation_set.get(language_code='cs')
+        rollup = StatsRollup.objects.get_rollup(subproject=component)
+        translated = rollup.translated
+
+        # Duplicate rollups are rejected
+        with transaction.atomic():
+            self.assertRaises(
+                IntegrityError,
+                StatsRollup.objects.create,
+                project=component.project,
+                subproject=component,
+            )
+
+        # Missing rollup is created by other process meanwhile
+        original = StatsRollup.objects.filter
+        missing = [rollup.get_key()]
+
+        def filter_concurrent(**kwargs):
+            result = original(**kwargs)
+            if kwargs.get('key') in missing:
+                missing.remove(kwargs['key'])
+                return result.none()
+            return result
+
+        StatsRollup.objects.filter = filter_concurrent
+        try:
+            StatsRollup.objects.add_delta(translation, {'translated': 1})
+        finally:
+            del StatsRollup.objects.filter
+        self.assertEqual(
+            StatsRollup.objects.get_rollup(subproject=component).translated,
+            translated + 1
+        )
+
 
 class WhiteboardMessageTest(TestCase):
     """Test(s) for WhiteboardMessage model."""
@@ -944,17 +1267,79 @@ class SourceTest(ModelTestCase):
 class UnitTest(ModelTestCase):
     @OverrideSettings(MT_WEBLATE_LIMIT=15)
     def test_more_like(self):
+        SIMILAR_POOL.terminate()
+        unit = Unit.objects.get(
+            translation__language_code='cs',
+            source='Hello, world!\n',
+        )
+        other = Unit.objects.filter(
+            translation__language_code='cs',
+        ).exclude(pk=unit.pk)[0]
+        other.source = 'Hello, wide world!\n'
+        other.target = 'Ahoj, siroky svete!\n'
+        other.translated = True
+        other.save(backend=True)
+        update_memory_unit(other)
+        # Pool can not be started inside transaction, lookup is done
+        # in this process
+        self.assertEqual(
+            [match.pk for match, score in Unit.objects.more_like_this(unit)],
+            [other.pk]
+        )
+        self.assertIsNone(SIMILAR_POOL.pool)
+        self.assertTrue(Unit.objects.exists())
+
+    @OverrideSettings(MT_WEBLATE_LIMIT=-1)
+    def test_more_like_no_fork(self):
         unit = Unit.objects.all()[0]
-        self.assertEqual(Unit.objects.more_like_this(unit).count(), 0)
+        self.assertEqual(Unit.objects.more_like_this(unit), [])
+
+
+class SimilarPoolTest(TransactionTestCase):
+    """
+    Similar lookups in pool of processes.
+    """
+    def tearDown(self):
+        SIMILAR_POOL.terminate()
 
     @OverrideSettings(MT_WEBLATE_LIMIT=0)
-    def test_more_like_timeout(self):
-        unit = Unit.objects.all()[0]
+    def test_timeout(self):
         self.assertRaisesMessage(
-            Exception, 'Request timed out.', Unit.objects.more_like_this, unit
+            Exception, 'Request timed out.', SIMILAR_POOL.lookup, Unit(pk=0)
         )
 
-    @OverrideSettings(MT_WEBLATE_LIMIT=-1)
-    def test_more_like_no_fork(self):
-        unit = Unit.objects.all()[0]
-        self.assertEqual(Unit.objects.more_like_this(unit).count(), 0)
+    @OverrideSettings(MT_WEBLATE_LIMIT=0)
+    def test_recycle(self):
+        pool = SIMILAR_POOL.get_pool()
+        self.assertIsNotNone(pool)
+        stats = SIMILAR_POOL.get_stats()
+        SIMILAR_POOL.recycle(pool)
+        self.assertIsNot(SIMILAR_POOL.get_pool(), pool)
+        self.assertEqual(
+            SIMILAR_POOL.get_stats()['recycled'], stats['recycled'] + 1
+        )
+        # Recycling already replaced pool does nothing
+        SIMILAR_POOL.recycle(pool)
+        self.assertEqual(
+            SIMILAR_POOL.get_stats()['recycled'], stats['recycled'] + 1
+        )
+
+    @OverrideSettings(MT_WEBLATE_LIMIT=15)
+    def test_stats(self):
+        stats = SIMILAR_POOL.get_stats()
+        self.assertEqual(SIMILAR_POOL.lookup(Unit(pk=0)), [])
+        self.assertEqual(
+            SIMILAR_POOL.get_stats()['requests'], stats['requests'] + 1
+        )
+        self.assertEqual(
+            SIMILAR_POOL.get_stats()['timeouts'], stats['timeouts']
+        )
+
+    @OverrideSettings(
+        MT_WEBLATE_LIMIT=15,
+        MACHINE_TRANSLATION_SERVICES=(SIMILAR_SERVICE,)
+    )
+    def test_request_started(self):
+        SIMILAR_POOL.terminate()
+        self.client.get(reverse('home'))
+        self.assertIsNotNone(SIMILAR_POOL.pool)
@@ -20,7 +20,12 @@
 '''
 Tests for changes done in remote repository.
 '''
-from weblate.trans.models import SubProject
+from weblate.trans.models import SubProject, Change
+from weblate.trans.filelock import FileLockException
+from weblate.trans.propagation import (
+    Propagation, PropagationRunner, PROPAGATION_RUNNER
+)
+from weblate.trans.tests import OverrideSettings
 from weblate.trans.tests.test_models import REPOWEB_URL
 from weblate.trans.tests.test_views import ViewTestCase
 from django.utils import timezone
@@ -130,6 +135,94 @@ class MultiRepoTest(ViewTestCase):
         )
         self.assertEqual(translation.translated, 1)
 
+    def test_propagate_batch(self):
+        '''
+        Tests propagating progress and repeated propagation.
+        '''
+        before = PROPAGATION_RUNNER.get_stats()
+        self.push_first()
+        after = PROPAGATION_RUNNER.get_stats()
+        self.assertEqual(after['running'], 0)
+        self.assertEqual(after['finished'], before['finished'] + 1)
+        self.assertEqual(after['units'], before['units'] + 1)
+
+        translation = self.subproject2.translation_set.get(
+            language_code='cs'
+        )
+        unit = translation.unit_set.get(source='Hello, world!\n')
+        self.assertEqual(unit.target, 'Nazdar svete!\n')
+        self.assertTrue(unit.translated)
+        self.assertEqual(
+            unit.change_set.filter(action=Change.ACTION_NEW).count(), 1
+        )
+
+        # Nothing to change on second run
+        propagation = Propagation(self.get_unit(), self.request)
+        self.assertEqual(propagation.run(), 0)
+        self.assertEqual(propagation.total, 1)
+        self.assertEqual(propagation.done, 1)
+
+    @OverrideSettings(BACKGROUND_PROPAGATION=True)
+    def test_propagate_deferred(self):
+        '''
+        Tests background propagation waits for end of transaction.
+        '''
+        PROPAGATION_RUNNER.get_pending()
+        self.addCleanup(delattr, PROPAGATION_RUNNER.local, 'pending')
+        before = PROPAGATION_RUNNER.get_stats()
+        unit = self.get_unit()
+        unit.translate(self.request, ['Nazdar svete!\n'], False)
+
+        # Test is running inside transaction
+        pending = PROPAGATION_RUNNER.get_pending()
+        self.assertEqual(len(pending), 1)
+        self.assertEqual(PROPAGATION_RUNNER.get_stats(), before)
+        self.assertTrue(pending[0].is_current())
+
+        # Translation changed meanwhile
+        unit = self.get_unit()
+        unit.translate(self.request, ['Ahoj svete!\n'], False)
+        self.assertFalse(pending[0].is_current())
+        self.assertTrue(pending[1].is_current())
+
+    def test_propagate_background_lock(self):
+        '''
+        Tests lock failure in background propagation.
+        '''
+        def update_units(units, request, user):
+            raise FileLockException('Timeout occured.')
+
+        translation = self.subproject2.translation_set.get(
+            language_code='cs'
+        )
+        translation.update_units = update_units
+        propagation = Propagation(self.get_unit(), self.request)
+        propagation.background = True
+        propagation.request = None
+        self.assertIsNone(propagation.get_message_request())
+        self.assertEqual(
+            propagation.update_translation(
+                translation, list(translation.unit_set.all())
+            ),
+            0
+        )
+
+    def test_propagate_background_thread(self):
+        '''
+        Tests background propagation keeps only user and is waited for.
+        '''
+        runner = PropagationRunner()
+        propagation = Propagation(self.get_unit(), self.request)
+        # Thread can not see data of the test transaction
+        propagation.is_current = lambda: False
+        thread = runner.start_thread(propagation)
+        self.assertIsNone(propagation.request)
+        self.assertEqual(propagation.user, self.user)
+        self.assertFalse(thread.daemon)
+        runner.join()
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(runner.threads, set())
+
     def test_failed_update(self):
         """Test failed remote update."""
         if os.path.exists(self.git_repo_path):
@@ -219,6 +312,35 @@ class MultiRepoTest(ViewTestCase):
         )
         self.assertEqual(translation.total, 5)
 
+    def test_new_unit_partial(self):
+        '''
+        Tests that only changed files are checked on update.
+        '''
+        self.push_replace(EXTRA_PO, 'a')
+
+        # Make other translation look outdated
+        self.subproject2.translation_set.exclude(
+            language_code='cs'
+        ).update(
+            revision='outdated'
+        )
+
+        self.subproject2.do_update(self.request)
+
+        translation = self.subproject2.translation_set.get(
+            language_code='cs'
+        )
+        self.assertEqual(translation.total, 5)
+
+        # Files not touched by the update are not checked with Git
+        outdated = self.subproject2.translation_set.filter(
+            revision='outdated'
+        )
+        if self._vcs == 'git':
+            self.assertTrue(outdated.exists())
+        else:
+            self.assertFalse(outdated.exists())
+
     def test_deleted_unit(self):
         '''
         Test removing several units from remote repo.
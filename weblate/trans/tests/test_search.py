@@ -23,11 +23,19 @@ Tests for search views.
 """
 
 import re
+from importlib import import_module
+from unittest import SkipTest
 from django.core.urlresolvers import reverse
+from django.db import connection
 from weblate.trans.tests.test_views import ViewTestCase
 from weblate.trans.tests import OverrideSettings
-from weblate.trans.search import update_index_unit
-from weblate.trans.models import IndexUpdate
+from weblate.trans.search import (
+    update_index_unit, INDEX_QUEUE, get_source_searcher, SEARCH_CACHE,
+    fulltext_search_ranked, fulltext_search, more_like, rebuild_indexes,
+    get_backend,
+)
+from weblate.trans.models import IndexUpdate, Unit, FulltextDocument
+from weblate.trans.models.unit import RankedUnits
 
 
 class SearchViewTest(ViewTestCase):
@@ -375,3 +383,201 @@ class SearchBackendTest(ViewTestCase):
         self.assertEqual(IndexUpdate.objects.count(), 1)
         update = IndexUpdate.objects.all()[0]
         self.assertTrue(update.source, True)
+
+    @OverrideSettings(
+        OFFLOAD_INDEXING=False, INDEX_QUEUE_LIMIT=100, INDEX_QUEUE_DELAY=100
+    )
+    def test_queue(self):
+        INDEX_QUEUE.flush()
+        flushes = INDEX_QUEUE.get_stats()['flushes']
+        self.do_index_update()
+        # Updates of same unit are coalesced
+        self.assertEqual(INDEX_QUEUE.get_stats()['depth'], 2)
+        INDEX_QUEUE.flush()
+        stats = INDEX_QUEUE.get_stats()
+        self.assertEqual(stats['depth'], 0)
+        self.assertEqual(stats['flushes'], flushes + 1)
+
+    @OverrideSettings(
+        OFFLOAD_INDEXING=False, INDEX_QUEUE_LIMIT=1, INDEX_QUEUE_DELAY=100
+    )
+    def test_queue_limit(self):
+        self.do_index_update()
+        self.assertEqual(INDEX_QUEUE.get_stats()['depth'], 0)
+
+    def test_searcher_cache(self):
+        searcher = get_source_searcher()
+        self.assertIs(searcher, get_source_searcher())
+        # Index change should give fresh searcher
+        self.do_index_update()
+        INDEX_QUEUE.flush()
+        self.assertIsNot(searcher, get_source_searcher())
+
+    def test_search_cache(self):
+        params = {'source': True}
+        result = fulltext_search('Hello', 'cs', params)
+        stats = SEARCH_CACHE.get_stats()
+        self.assertEqual(
+            fulltext_search('  Hello ', 'cs', params),
+            result
+        )
+        self.assertEqual(SEARCH_CACHE.get_stats()['hits'], stats['hits'] + 1)
+        # Index change should invalidate the cache
+        self.do_index_update()
+        INDEX_QUEUE.flush()
+        fulltext_search('Hello', 'cs', params)
+        self.assertEqual(
+            SEARCH_CACHE.get_stats()['misses'], stats['misses'] + 1
+        )
+
+    def test_search_cache_generation(self):
+        SEARCH_CACHE.set(('test',), frozenset(['x']))
+        self.assertEqual(SEARCH_CACHE.get(('test',)), frozenset(['x']))
+        generation = SEARCH_CACHE.get_generation()
+        SEARCH_CACHE.clear()
+        self.assertGreater(SEARCH_CACHE.get_generation(), generation)
+        self.assertIsNone(SEARCH_CACHE.get(('test',)))
+
+
+class RankedSearchTest(ViewTestCase):
+    params = {
+        'q': 'weblate',
+        'search': 'ftx',
+        'type': 'all',
+        'ignored': False,
+        'source': True,
+        'target': False,
+        'context': False,
+        'location': False,
+        'comment': False,
+    }
+
+    def test_ranked(self):
+        checksums = fulltext_search_ranked('weblate', 'cs', self.params)
+        self.assertEqual(len(checksums), 2)
+        self.assertEqual(
+            checksums[1:],
+            fulltext_search_ranked('weblate', 'cs', self.params, 1, 1)
+        )
+        self.assertEqual(
+            [],
+            fulltext_search_ranked('weblate', 'cs', self.params, 2, 10)
+        )
+
+    def test_units(self):
+        units = Unit.objects.search(None, self.params, ranked=True)
+        # Two strings in three translations
+        self.assertEqual(units.count(), 6)
+        self.assertEqual(len(units[0:4]), 4)
+        self.assertEqual(len(list(units)), 6)
+        self.assertEqual(
+            units.filter(translation__language_code='cs').count(),
+            2
+        )
+        self.assertEqual(units[0].checksum, units[1].checksum)
+
+    def test_restricted(self):
+        checksums = fulltext_search_ranked('weblate', 'cs', self.params)
+        units = self.get_translation().unit_set.exclude(
+            checksum=checksums[0]
+        )
+        self.assertEqual(
+            fulltext_search_ranked(
+                'weblate', 'cs', self.params, units=units
+            ),
+            checksums[1:]
+        )
+        self.assertEqual(
+            fulltext_search_ranked(
+                'weblate', 'cs', self.params, 0, 1, units=units
+            ),
+            checksums[1:]
+        )
+        self.assertEqual(
+            fulltext_search_ranked(
+                'weblate', 'cs', self.params, units=units.none()
+            ),
+            []
+        )
+        ranked = RankedUnits(units, 'weblate', 'cs', self.params)
+        self.assertEqual(ranked.count(), 1)
+        self.assertEqual(ranked[0].checksum, checksums[1])
+
+
+class DatabaseBackendTest(RankedSearchTest):
+    def setUp(self):
+        super(DatabaseBackendTest, self).setUp()
+        self.override = OverrideSettings(
+            FULLTEXT_BACKEND='weblate.trans.search.DatabaseBackend'
+        )
+        self.override.__enter__()
+        self.addCleanup(self.override.__exit__)
+        rebuild_indexes(clean=True)
+
+    def test_search(self):
+        self.assertEqual(
+            len(fulltext_search('weblate', 'cs', self.params)),
+            2
+        )
+        self.assertEqual(
+            len(fulltext_search('nonexisting', 'cs', self.params)),
+            0
+        )
+
+    def test_update(self):
+        self.edit_unit(
+            'Hello, world!\n',
+            'Nazdar svete!\n'
+        )
+        params = {'target': True}
+        self.assertEqual(
+            len(fulltext_search('nazdar', 'cs', params)),
+            1
+        )
+        self.assertEqual(
+            len(fulltext_search('nazdar', 'de', params)),
+            0
+        )
+
+    def test_more_like(self):
+        unit = self.get_translation().unit_set.get(
+            source='Hello, world!\n',
+        )
+        self.assertNotIn(
+            unit.checksum,
+            more_like(unit.checksum, unit.source)
+        )
+
+    def test_update_document(self):
+        backend = get_backend()
+        backend.update_document('cs', {'checksum': 'x', 'target': 'Ahoj'})
+        backend.update_document('cs', {'checksum': 'x', 'target': 'Nazdar'})
+        document = FulltextDocument.objects.get(checksum='x')
+        self.assertEqual(document.target, 'Nazdar')
+        self.assertEqual(
+            len(fulltext_search('nazdar', 'cs', {'target': True})),
+            1
+        )
+
+
+class FTS5BackendTest(DatabaseBackendTest):
+    def setUp(self):
+        if connection.vendor != 'sqlite':
+            raise SkipTest('Test only applicable on SQLite')
+        # The fulltext table is created by migration, which is not used
+        # in tests
+        migration = import_module(
+            'weblate.trans.migrations.0049_fulltextdocument'
+        )
+        with connection.schema_editor() as schema_editor:
+            migration.create_fulltext(None, schema_editor)
+        self.addCleanup(self.drop_fulltext, migration)
+        super(FTS5BackendTest, self).setUp()
+        get_backend().fts5 = None
+        if get_backend().get_engine() != 'fts5':
+            raise SkipTest('SQLite built without FTS5')
+
+    def drop_fulltext(self, migration):
+        with connection.schema_editor() as schema_editor:
+            migration.drop_fulltext(None, schema_editor)
+        get_backend().fts5 = None
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2012 - 2015 Michal Čihař <michal@cihar.com>
+#
+# This file is part of Weblate <https://weblate.org/>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+'''
+Tests for parsed files cache.
+'''
+
+import os
+import shutil
+from django.test import SimpleTestCase
+from weblate import appsettings
+from weblate.trans.formats import PoFormat, XliffFormat
+from weblate.trans.storecache import StoreCache
+from weblate.trans.tests import OverrideSettings
+from weblate.trans.tests.utils import get_test_file
+
+TEST_PO = get_test_file('cs.po')
+TEST_XLIFF = get_test_file('cs.xliff')
+
+
+class StoreCacheTest(SimpleTestCase):
+    def get_sources(self, store):
+        return [unit.source for unit in store.units]
+
+    @OverrideSettings(DATA_DIR=OverrideSettings.TEMP_DIR)
+    def test_cached(self):
+        cache = StoreCache()
+        first = cache.load(PoFormat, TEST_PO)
+        second = cache.load(PoFormat, TEST_PO)
+        self.assertEqual(self.get_sources(first), self.get_sources(second))
+        stats = cache.get_stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+
+    @OverrideSettings(DATA_DIR=OverrideSettings.TEMP_DIR)
+    def test_uncacheable(self):
+        cache = StoreCache()
+        cache.load(XliffFormat, TEST_XLIFF)
+        store = cache.load(XliffFormat, TEST_XLIFF)
+        self.assertEqual(store.units[0].source, 'Hello, world!\n')
+        stats = cache.get_stats()
+        self.assertEqual(stats['hits'], 0)
+        self.assertEqual(stats['uncacheable'], 2)
+
+    @OverrideSettings(DATA_DIR=OverrideSettings.TEMP_DIR)
+    def test_changed(self):
+        cache = StoreCache()
+        filename = os.path.join(appsettings.DATA_DIR, 'cs.po')
+        shutil.copy(TEST_PO, filename)
+        cache.load(PoFormat, filename)
+        with open(filename, 'a') as handle:
+            handle.write('\nmsgid "Extra"\nmsgstr "Navic"\n')
+        store = cache.load(PoFormat, filename)
+        self.assertIn('Extra', self.get_sources(store))
+        self.assertEqual(cache.get_stats()['hits'], 0)
+        # Outdated entry is removed
+        self.assertEqual(len(os.listdir(os.path.join(
+            appsettings.DATA_DIR, 'stores'
+        ))), 1)
+
+    @OverrideSettings(DATA_DIR=OverrideSettings.TEMP_DIR, STORE_CACHE_SIZE=1)
+    def test_evicted(self):
+        cache = StoreCache()
+        cache.load(PoFormat, TEST_PO)
+        cache.load(PoFormat, TEST_PO)
+        self.assertEqual(cache.get_stats()['misses'], 2)
+
+    @OverrideSettings(DATA_DIR=OverrideSettings.TEMP_DIR, STORE_CACHE_SIZE=0)
+    def test_disabled(self):
+        cache = StoreCache()
+        cache.load(PoFormat, TEST_PO)
+        cache.load(PoFormat, TEST_PO)
+        self.assertEqual(cache.get_stats()['hits'], 0)
+        self.assertFalse(
+            os.path.exists(os.path.join(appsettings.DATA_DIR, 'stores'))
+        )
@@ -325,6 +325,62 @@ class VCSGitTest(RepoTestCase):
             40
         )
 
+    def test_object_hash_commit(self):
+        self.repo.set_committer('Foo Bar', 'foo@example.net')
+        obj_hash = self.repo.get_object_hash('README.md')
+        # Cached value is used
+        self.assertEqual(obj_hash, self.repo.get_object_hash('README.md'))
+        with open(os.path.join(self._tempdir, 'README.md'), 'w') as handle:
+            handle.write('Changed readme\n')
+        self.repo.commit(
+            'Test commit',
+            'Foo Bar <foo@bar.com>',
+            timezone.now(),
+            ['README.md']
+        )
+        # Cache is invalidated by commit
+        self.assertEqual(
+            self.repo.get_object_hash('README.md'),
+            'defbaf1494deea66f813276b7115804f1c358dff'
+        )
+
+    def test_object_hash_outside(self):
+        obj_hash = self.repo.get_object_hash('README.md')
+        # Commit done by other instance, as in other process
+        other = self._class(self._tempdir)
+        other.set_committer('Foo Bar', 'foo@example.net')
+        with open(os.path.join(self._tempdir, 'README.md'), 'w') as handle:
+            handle.write('Changed readme\n')
+        other.commit(
+            'Test commit',
+            'Foo Bar <foo@bar.com>',
+            timezone.now(),
+            ['README.md']
+        )
+        self.assertNotEqual(obj_hash, self.repo.get_object_hash('README.md'))
+        self.assertEqual(
+            self.repo.get_object_hash('README.md'),
+            'defbaf1494deea66f813276b7115804f1c358dff'
+        )
+
+    def test_object_hash_cached(self):
+        calls = []
+        execute = self.repo.execute
+
+        def counting_execute(*args, **kwargs):
+            calls.append(args)
+            return execute(*args, **kwargs)
+
+        self.repo.execute = counting_execute
+        obj_hash = self.repo.get_object_hash('README.md')
+        for dummy in range(3):
+            self.assertEqual(
+                obj_hash,
+                self.repo.get_object_hash('README.md')
+            )
+        # Tree is listed at most once for unchanged HEAD
+        self.assertLessEqual(len(calls), 1)
+
     def test_configure_remote(self):
         self.repo.configure_remote('pullurl', 'pushurl', 'branch')
         self.assertEqual(
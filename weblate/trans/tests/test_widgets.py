@@ -24,6 +24,7 @@ Tests for widgets.
 
 from weblate.trans.tests.test_views import ViewTestCase
 from weblate.trans.views.widgets import WIDGETS
+from weblate.lang.models import Language
 from django.core.urlresolvers import reverse
 
 
@@ -62,6 +63,23 @@ class WidgetsTest(ViewTestCase):
         )
         self.assertContains(response, 'Test')
 
+    def test_widget_stats(self):
+        self.edit_unit('Hello, world!\n', 'Nazdar svete!\n')
+        widget = WIDGETS['287x66'](self.project)
+        self.assertEqual(widget.total, self.project.get_total())
+        self.assertEqual(
+            widget.languages, self.project.get_language_count()
+        )
+        self.assertEqual(
+            widget.percent, self.project.get_translated_percent()
+        )
+        language = Language.objects.get(code='cs')
+        widget = WIDGETS['287x66'](self.project, lang=language)
+        self.assertEqual(
+            widget.percent, self.project.get_translated_percent(language)
+        )
+        self.assertGreater(widget.percent, 0)
+
     def assert_widget(self, widget, response):
         if hasattr(WIDGETS[widget], 'redirect'):
             self.assertEqual(response.status_code, 302)
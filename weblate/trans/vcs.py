@@ -309,6 +309,14 @@ class Repository(object):
         """
         raise NotImplementedError()
 
+    def get_changed_files(self, revision):
+        """
+        Returns list of files changed between revision and current one.
+
+        Returns None if this is not supported by the VCS.
+        """
+        return None
+
     def get_object_hash(self, path):
         """
         Returns hash of object in the VCS in a way compatible with Git.
@@ -360,6 +368,7 @@ class GitRepository(Repository):
     _cmd_update_remote = ['remote', 'update', 'origin']
     _cmd_push = ['push', 'origin']
     name = 'Git'
+    _tree_hashes = (None, None)
     req_version = '1.6'
     default_branch = 'master'
 
@@ -431,6 +440,7 @@ class GitRepository(Repository):
             self.execute(['rebase', '--abort'])
         else:
             self.execute(['rebase', 'origin/{0}'.format(branch)])
+        self._last_revision = None
 
     def merge(self, branch=None, abort=False):
         """
@@ -440,6 +450,7 @@ class GitRepository(Repository):
             self.execute(['merge', '--abort'])
         else:
             self.execute(['merge', 'origin/{0}'.format(branch)])
+        self._last_revision = None
 
     def needs_commit(self, filename=None):
         """
@@ -549,18 +560,79 @@ class GitRepository(Repository):
         # Clean cache
         self._last_revision = None
 
+    def get_changed_files(self, revision):
+        """
+        Returns list of files changed between revision and HEAD.
+        """
+        output = self.execute(['diff', '--name-only', '-z', revision, 'HEAD'])
+        return [name.decode('utf-8') for name in output.split('\0') if name]
+
+    def get_head_stamp(self):
+        """
+        Returns stamp identifying current HEAD without invoking git.
+
+        It consists of content of HEAD and the reference it points to, so
+        it changes whenever HEAD is moved, even by another process.
+        """
+        gitdir = os.path.join(self.path, '.git')
+        if not os.path.isdir(gitdir):
+            gitdir = self.path
+        stamp = []
+        name = 'HEAD'
+        while name is not None:
+            try:
+                with open(os.path.join(gitdir, name), 'rb') as handle:
+                    content = handle.read().strip()
+            except IOError:
+                # Reference is packed, use packed-refs state instead
+                try:
+                    stat = os.stat(os.path.join(gitdir, 'packed-refs'))
+                    stamp.append((name, stat.st_mtime, stat.st_size))
+                except OSError:
+                    stamp.append((name, None))
+                break
+            stamp.append(content)
+            name = None
+            if content.startswith(b'ref: '):
+                name = content[5:].decode('utf-8')
+        return tuple(stamp)
+
+    def get_tree_hashes(self):
+        """
+        Returns dictionary of blob hashes of all files in HEAD.
+
+        The whole tree is listed at once and cached for the HEAD stamp, so
+        HEAD moved by any process gets listed again.
+        """
+        head = self.get_head_stamp()
+        revision, tree = self._tree_hashes
+        if revision != head:
+            tree = {}
+            output = self.execute(['ls-tree', '-r', '-z', 'HEAD'])
+            for item in output.split('\0'):
+                if not item:
+                    continue
+                info, name = item.split('\t', 1)
+                dummy, kind, objhash = info.split()
+                if kind == 'blob':
+                    tree[name.decode('utf-8')] = objhash
+            self._tree_hashes = (head, tree)
+        return tree
+
     def get_object_hash(self, path):
         """
         Returns hash of object in the VCS.
         """
         real_path = self.resolve_symlinks(path)
+        if isinstance(real_path, bytes):
+            real_path = real_path.decode('utf-8')
 
-        git_hash = self.execute(['ls-tree', 'HEAD', real_path])
+        git_hash = self.get_tree_hashes().get(real_path)
 
-        if not git_hash:
+        if git_hash is None:
             return super(GitRepository, self).get_object_hash(path)
 
-        return git_hash.split()[2]
+        return git_hash
 
     def configure_remote(self, pull_url, push_url, branch):
         """
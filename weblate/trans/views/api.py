@@ -25,7 +25,8 @@ from django.http import (
     HttpResponse, HttpResponseNotAllowed, HttpResponseBadRequest
 )
 
-from weblate.trans.models import SubProject
+from weblate.trans.models import SubProject, Change
+from weblate.accounts.models import get_author_name
 from weblate.trans.views.helper import get_project, get_subproject
 from weblate.trans.site import get_site_url
 
@@ -321,15 +322,22 @@ def export_stats(request, project, subproject):
     if 'jsonp' in request.GET and request.GET['jsonp']:
         jsonp = request.GET['jsonp']
 
+    translations = subprj.translation_set.select_related('language')
+    last_changes = Change.objects.last_content_changes(translations)
+
     response = []
-    for trans in subprj.translation_set.all():
+    for trans in translations:
+        last_change = last_changes.get(trans.pk)
         response.append({
             'code': trans.language.code,
             'name': trans.language.name,
             'total': trans.total,
             'total_words': trans.total_words,
-            'last_change': trans.last_change,
-            'last_author': trans.get_last_author(),
+            'last_change': last_change.timestamp if last_change else None,
+            'last_author': (
+                get_author_name(last_change.author, False)
+                if last_change else None
+            ),
             'translated': trans.translated,
             'translated_words': trans.translated_words,
             'translated_percent': trans.get_translated_percent(),
@@ -30,7 +30,7 @@ import django.views.defaults
 
 from weblate.trans.models import (
     Project, SubProject, Translation, Check,
-    Dictionary, Change, Unit, WhiteboardMessage
+    Dictionary, Change, Unit, WhiteboardMessage, StatsRollup
 )
 from weblate.requirements import get_versions, get_optional_versions
 from weblate.lang.models import Language
@@ -116,6 +116,7 @@ def search(request):
         units = Unit.objects.search(
             None,
             search_form.cleaned_data,
+            ranked=True,
         ).select_related(
             'translation',
         )
@@ -167,12 +168,14 @@ def show_engage(request, project, lang=None):
     if lang is not None:
         language = try_set_language(lang)
 
+    stats = StatsRollup.objects.get_project_stats(obj, language)
+
     context = {
         'object': obj,
         'project': obj,
-        'languages': obj.get_language_count(),
-        'total': obj.get_total(),
-        'percent': obj.get_translated_percent(language),
+        'languages': stats['languages'],
+        'total': stats['total'],
+        'percent': stats['percent'],
         'url': obj.get_absolute_url(),
         'language': language,
     }
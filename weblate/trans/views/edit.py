@@ -301,7 +301,7 @@ def handle_translate(translation, request, user_locked,
             unit.translation.commit_pending(request, request.user)
             # Store new commit message
             unit.translation.commit_message = message
-            unit.translation.save()
+            unit.translation.save(update_fields=['commit_message'])
 
         go_next = perform_translation(unit, form, request)
 
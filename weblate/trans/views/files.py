@@ -35,6 +35,9 @@ from weblate.trans.views.helper import get_translation
 def download_translation(request, project, subproject, lang):
     obj = get_translation(request, project, subproject, lang)
 
+    # Write edits delayed by write-behind mode
+    obj.flush_pending(request)
+
     srcfilename = obj.get_filename()
 
     # Construct file name (do not use real filename as it is usually not
@@ -59,6 +62,9 @@ def download_language_pack(request, project, subproject, lang):
     if not obj.supports_language_pack():
         raise Http404('Language pack download not supported')
 
+    # Write edits delayed by write-behind mode
+    obj.flush_pending(request)
+
     filename, mime = obj.store.get_language_pack_meta()
 
     # Create response
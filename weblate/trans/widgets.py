@@ -22,6 +22,7 @@ from django.utils.translation import ugettext as _
 from django.template.loader import render_to_string
 from PIL import Image, ImageDraw
 from weblate.trans.fonts import is_base, get_font
+from weblate.trans.models import StatsRollup
 from weblate.appsettings import ENABLE_HTTPS
 from cStringIO import StringIO
 import os.path
@@ -79,9 +80,10 @@ class Widget(object):
         '''
         # Get object and related params
         self.obj = obj
-        self.percent = obj.get_translated_percent(lang)
-        self.total = obj.get_total()
-        self.languages = obj.get_language_count()
+        stats = StatsRollup.objects.get_project_stats(obj, lang)
+        self.percent = stats['percent']
+        self.total = stats['total']
+        self.languages = stats['languages']
         self.params = self.get_text_params()
 
         # Process parameters
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2012 - 2015 Michal Čihař <michal@cihar.com>
+#
+# This file is part of Weblate <https://weblate.org/>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+'''
+Delayed writing of edits to translation files.
+
+With WRITE_BEHIND_DELAY set, edits are saved to the database and recorded
+as PendingUnit objects. The translation file is then written once for all
+edits done within the delay, or earlier when it is needed for commit,
+push, download or merge.
+'''
+
+import atexit
+import threading
+from django.db import connection
+from weblate import appsettings
+from weblate.logger import LOGGER
+
+
+class WriteBehindQueue(object):
+    '''
+    Schedules writing of pending edits for translations.
+
+    Every translation with pending edits has timer which writes them to
+    the file after WRITE_BEHIND_DELAY seconds.
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.timers = {}
+        self.flushes = 0
+        self.units = 0
+
+    def schedule(self, translation):
+        '''
+        Schedules writing of pending edits for translation.
+        '''
+        with self.lock:
+            if translation.pk in self.timers:
+                return
+            timer = threading.Timer(
+                appsettings.WRITE_BEHIND_DELAY,
+                self.flush_thread,
+                [translation.pk]
+            )
+            timer.daemon = True
+            self.timers[translation.pk] = timer
+            timer.start()
+
+    def flush(self, translation_id):
+        '''
+        Writes pending edits for translation.
+        '''
+        from weblate.trans.models import Translation
+        with self.lock:
+            timer = self.timers.pop(translation_id, None)
+        if timer is not None:
+            timer.cancel()
+        try:
+            translation = Translation.objects.get(pk=translation_id)
+        except Translation.DoesNotExist:
+            return
+        translation.flush_pending()
+
+    def flush_safe(self, translation_id):
+        '''
+        Writes pending edits for translation, logging errors.
+        '''
+        try:
+            self.flush(translation_id)
+        except Exception as error:
+            LOGGER.error(
+                'failed to write pending edits for %d: %s',
+                translation_id,
+                error
+            )
+
+    def flush_thread(self, translation_id):
+        '''
+        Writes pending edits from timer thread.
+        '''
+        try:
+            self.flush_safe(translation_id)
+        finally:
+            # Thread has own database connection
+            connection.close()
+
+    def flush_all(self):
+        '''
+        Writes pending edits for all scheduled translations.
+        '''
+        with self.lock:
+            pending = list(self.timers.keys())
+        for translation_id in pending:
+            self.flush_safe(translation_id)
+
+    def flushed(self, units):
+        '''
+        Records written edits.
+        '''
+        if units:
+            with self.lock:
+                self.flushes += 1
+                self.units += units
+
+    def get_stats(self):
+        '''
+        Returns number of scheduled translations and written edits.
+        '''
+        with self.lock:
+            return {
+                'scheduled': len(self.timers),
+                'flushes': self.flushes,
+                'units': self.units,
+            }
+
+
+WRITE_BEHIND_QUEUE = WriteBehindQueue()
+atexit.register(WRITE_BEHIND_QUEUE.flush_all)